@@ -28,7 +28,7 @@ class AppointmentAttachmentAdmin(admin.ModelAdmin):
 class NoteTemplateAdmin(admin.ModelAdmin):
     list_display = ['name', 'category', 'is_active', 'created_by', 'created_at']
     list_filter = ['category', 'is_active', 'created_at']
-    search_fields = ['name', 'description', 'content']
+    search_fields = ['name', 'description', 'content_text']
     ordering = ['category', 'name']
     readonly_fields = ['created_at', 'updated_at']
     date_hierarchy = 'created_at'
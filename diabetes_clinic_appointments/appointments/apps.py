@@ -1,6 +1,61 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate, post_save, post_delete
+
+
+def repair_notes_index(sender, using, **kwargs):
+    """Re-create note search triggers dropped by SQLite table remakes"""
+    from django.db import connections
+    from utilities.search import repair_search_index
+    repair_search_index(connections[using], index='notes')
+
+
+def invalidate_template_catalog(sender, **kwargs):
+    """Drop the cached note template catalog after a template changes"""
+    from utilities.view_cache import bump_version
+    from .catalog import invalidate
+    invalidate()
+    bump_version('note_templates')
+
+
+def invalidate_patient_pages(sender, instance, **kwargs):
+    """Drop cached pages showing the patient's appointments"""
+    from utilities.view_cache import bump_version
+    bump_version(f'patient:{instance.patient_id}')
+
+
+def schedule_attachment_thumbnail(sender, instance, created, **kwargs):
+    """Generate the preview of a new image/PDF attachment in the background"""
+    if created and not instance.has_thumbnail:
+        from .thumbnails import schedule_thumbnail
+        schedule_thumbnail(instance)
+
+
+def delete_legacy_attachment_file(sender, instance, **kwargs):
+    """Remove a legacy (not content-addressed) file once no attachment refers to it"""
+    from django.db import transaction
+    from .storage import attachment_storage, is_blob
+
+    name = instance.file.name
+    if not name or is_blob(name) or sender.objects.filter(file=name).exists():
+        return
+    transaction.on_commit(lambda: attachment_storage.delete(name))
 
 
 class AppointmentsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appointments'
+
+    def ready(self):
+        post_migrate.connect(repair_notes_index, sender=self)
+
+        NoteTemplate = self.get_model('NoteTemplate')
+        post_save.connect(invalidate_template_catalog, sender=NoteTemplate)
+        post_delete.connect(invalidate_template_catalog, sender=NoteTemplate)
+
+        Appointment = self.get_model('Appointment')
+        post_save.connect(invalidate_patient_pages, sender=Appointment)
+        post_delete.connect(invalidate_patient_pages, sender=Appointment)
+
+        AppointmentAttachment = self.get_model('AppointmentAttachment')
+        post_save.connect(schedule_attachment_thumbnail, sender=AppointmentAttachment)
+        post_delete.connect(delete_legacy_attachment_file, sender=AppointmentAttachment)
@@ -0,0 +1,148 @@
+"""
+Streaming ZIP export of appointment attachments.
+
+The archive is produced while it is sent: ``ZipFile`` writes into a small
+buffer that is flushed to the client after every chunk of every file, so
+memory use does not depend on the size or number of attachments and no
+temporary file is created. Formats that are already compressed (images,
+PDF, Office Open XML, archives) are stored as-is instead of being deflated
+again, and ZIP64 records are used automatically for large files and
+archives.
+"""
+
+import logging
+import os
+import zipfile
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+
+logger = logging.getLogger(__name__)
+
+# Stored without compression - deflating them again only costs CPU
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.pdf', '.docx', '.xlsx',
+    '.zip', '.rar', '.7z',
+}
+
+CHUNK_SIZE = 64 * 1024
+
+# Oldest timestamp a ZIP entry can hold
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+class _ZipStream:
+    """Unseekable file object collecting the bytes ``ZipFile`` writes"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """Return (as a list of at most one chunk) and forget what was written since the last call"""
+        if not self._chunks:
+            return []
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return [data]
+
+
+def _zip_info(arcname, attachment, file_size):
+    uploaded_at = timezone.localtime(attachment.uploaded_at)
+    info = zipfile.ZipInfo(arcname, date_time=max(uploaded_at.timetuple()[:6], ZIP_EPOCH))
+    info.external_attr = 0o644 << 16
+    if attachment.file_extension in STORED_EXTENSIONS:
+        info.compress_type = zipfile.ZIP_STORED
+    else:
+        info.compress_type = zipfile.ZIP_DEFLATED
+    # Lets ZipFile decide up front whether the entry needs ZIP64 headers.
+    # Must not be smaller than the data written, so it is the size of the
+    # opened file, not AppointmentAttachment.file_size (which may be stale).
+    info.file_size = file_size
+    return info
+
+
+def iter_zip(entries):
+    """
+    Generate a ZIP archive chunk by chunk.
+
+    Args:
+        entries: Iterable of ``(arcname, attachment)`` pairs
+
+    Yields:
+        bytes: Consecutive parts of the archive
+    """
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', allowZip64=True) as archive:
+        for arcname, attachment in entries:
+            try:
+                source = attachment.file.open('rb')
+            except OSError:
+                # Headers are already sent, so a missing file cannot fail the
+                # response - leave it out of the archive
+                logger.warning('Attachment %s missing from storage, skipped in ZIP', attachment.id)
+                continue
+
+            with source:
+                info = _zip_info(arcname, attachment, os.fstat(source.fileno()).st_size)
+                with archive.open(info, 'w') as target:
+                    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+                        target.write(chunk)
+                        yield from stream.pop()
+            yield from stream.pop()
+    yield from stream.pop()
+
+
+def _safe_name(name):
+    name = name.replace('\\', '/').rsplit('/', 1)[-1].strip()
+    return name or 'plik'
+
+
+def _unique(name, used):
+    candidate = name
+    root, extension = os.path.splitext(name)
+    number = 1
+    while candidate in used:
+        number += 1
+        candidate = f'{root} ({number}){extension}'
+    used.add(candidate)
+    return candidate
+
+
+def appointment_entries(attachments):
+    """Archive entries for a single appointment (files in the archive root)"""
+    used = set()
+    for attachment in attachments:
+        yield _unique(_safe_name(attachment.filename), used), attachment
+
+
+def patient_entries(attachments):
+    """Archive entries for many appointments - one folder per appointment date"""
+    used = set()
+    for attachment in attachments:
+        appointment_date = timezone.localtime(attachment.appointment.appointment_date)
+        folder = appointment_date.strftime('%Y-%m-%d_%H%M')
+        yield _unique(f'{folder}/{_safe_name(attachment.filename)}', used), attachment
+
+
+def zip_response(entries, filename):
+    """Streaming download of a ZIP archive built from ``entries``"""
+    response = StreamingHttpResponse(iter_zip(entries), content_type='application/zip')
+    response['Content-Disposition'] = content_disposition_header(True, filename)
+    # Pass the stream through nginx as it is produced instead of buffering it
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,157 @@
+"""
+Cached catalog of active note templates.
+
+The catalog is small and rarely changes, but it is needed on every notes
+editor page and on every "load template" AJAX call. It is kept at two
+levels:
+
+* in the shared cache (``note_templates`` namespace), so all worker processes
+  build it from the database only once per change,
+* in a process-local snapshot, so repeated requests in one worker do not
+  even deserialize it.
+
+Both levels are keyed by a version counter stored in the shared cache and
+bumped whenever a ``NoteTemplate`` is saved or deleted (see ``apps.py``).
+The list carries no HTML content; content is fetched per template by ID.
+"""
+
+import hashlib
+import json
+import time
+
+from django.db import transaction
+
+from utilities.cache import CacheNamespace
+
+
+# Entries are versioned, so the timeout only bounds memory held by old versions
+CACHE_TIMEOUT = 60 * 60 * 24
+
+templates_cache = CacheNamespace('note_templates', timeout=CACHE_TIMEOUT)
+VERSION_KEY = templates_cache.key('version')
+
+# (version, templates, content), replaced as a whole so a list built for an
+# older version is never stored under a newer one by a concurrent thread
+_local = (None, None, {})
+
+
+def get_version():
+    """Return the current catalog version, initializing it if missing"""
+    version = templates_cache.get('version')
+    if version is None:
+        # A time-based start value never reuses keys of an evicted counter
+        templates_cache.add('version', time.time_ns(), timeout=None)
+        version = templates_cache.get('version', time.time_ns())
+    return version
+
+
+def bump_version():
+    """Invalidate the catalog in every process"""
+    try:
+        templates_cache.incr('version')
+    except ValueError:
+        templates_cache.set('version', time.time_ns(), timeout=None)
+
+
+def invalidate():
+    """
+    Invalidate the catalog now and again once the current transaction commits.
+
+    The second bump drops a catalog another process may have rebuilt from
+    the not yet committed state in between.
+    """
+    bump_version()
+    transaction.on_commit(bump_version)
+
+
+def _local_snapshot():
+    global _local
+    version = get_version()
+    snapshot = _local
+    if snapshot[0] != version:
+        snapshot = _local = (version, None, {})
+    return snapshot
+
+
+def get_templates():
+    """
+    Return active templates as dicts, ordered by category and name.
+
+    Each entry has ``id``, ``name``, ``description``, ``category``,
+    ``category_display``, ``content_excerpt``, ``created_by_name`` and
+    ``created_at``.
+    """
+    global _local
+    version, templates, content = _local_snapshot()
+    if templates is not None:
+        return templates
+
+    key = (version, 'list')
+    templates = templates_cache.get(key)
+    if templates is None:
+        templates = _load_templates()
+        templates_cache.set(key, templates)
+
+    _local = (version, templates, content)
+    return templates
+
+
+def get_template(template_id):
+    """
+    Return ``{'id', 'name', 'content', 'etag'}`` for an active template.
+
+    ``content`` is the sanitized HTML and ``etag`` a hash of the whole
+    entry, suitable for an HTTP ETag. Returns None for unknown or inactive
+    templates.
+    """
+    version, _, content = _local_snapshot()
+    template_id = int(template_id)
+    if template_id in content:
+        return content[template_id]
+
+    key = (version, 'content', template_id)
+    # Cache misses for unknown IDs as False, so they are not re-queried
+    template = templates_cache.get(key)
+    if template is None:
+        template = _load_template(template_id) or False
+        templates_cache.set(key, template)
+
+    content[template_id] = template or None
+    return template or None
+
+
+def _load_templates():
+    from .models import NoteTemplate
+
+    templates = NoteTemplate.objects.filter(is_active=True).select_related('created_by__user').only(
+        'id', 'name', 'description', 'category', 'content_excerpt', 'created_at',
+        'created_by', 'created_by__user', 'created_by__user__last_name',
+    ).order_by('category', 'name')
+
+    return [
+        {
+            'id': template.id,
+            'name': template.name,
+            'description': template.description,
+            'category': template.category,
+            'category_display': template.get_category_display(),
+            'content_excerpt': template.content_excerpt,
+            'created_by_name': template.created_by.user.last_name if template.created_by else '',
+            'created_at': template.created_at,
+        }
+        for template in templates
+    ]
+
+
+def _load_template(template_id):
+    from .models import NoteTemplate
+
+    template = NoteTemplate.objects.filter(id=template_id, is_active=True).only(
+        'id', 'name', 'content', 'content_html', 'content_hash'
+    ).first()
+    if template is None:
+        return None
+
+    entry = {'id': template.id, 'name': template.name, 'content': template.safe_content}
+    entry['etag'] = hashlib.sha256(json.dumps(entry, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+    return entry
@@ -0,0 +1,314 @@
+"""
+Chunked, resumable attachment uploads.
+
+A large file is sent in several short requests instead of one long
+multipart POST:
+
+1. ``start_upload`` validates the name and declared size and creates an
+   ``AttachmentUpload`` with an empty temporary file,
+2. ``write_chunk`` appends one chunk at a given offset, streaming it from
+   the request straight into the temporary file,
+3. ``finish_upload`` turns the complete file into an
+   ``AppointmentAttachment`` (moved into content-addressed storage).
+
+The offset is the size of the temporary file, so an interrupted upload is
+resumed by asking for the current offset and sending the rest. Limits are
+checked before any data is read and again for every chunk, so an upload
+that is too large or of the wrong type is rejected at the first chunk,
+not after the whole file arrived.
+
+Requests for one upload are serialised with a lock on its temporary file,
+not with a database row lock: no transaction is open while a chunk is read
+from the client or the finished file is hashed (with SQLite's IMMEDIATE
+transactions that would hold the database-wide write lock).
+"""
+
+import fcntl
+import os
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from doctors.forms import AppointmentAttachmentForm
+
+from .models import AppointmentAttachment, AttachmentUpload, file_sha256
+from .storage import attachment_storage
+
+
+# Temporary files live next to the blobs (same file system, so finishing an
+# upload is a rename) and, like them, are not served under /media/
+INCOMPLETE_PREFIX = 'attachments/incomplete'
+
+# Images and PDF scans may exceed the regular attachment size limit
+IMAGING_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.pdf'}
+
+# Leading bytes of formats that are easy to recognise; the first chunk of
+# such a file must start with one of them
+SIGNATURES = {
+    '.pdf': (b'%PDF-',),
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.jpeg': (b'\xff\xd8\xff',),
+    '.gif': (b'GIF87a', b'GIF89a'),
+    '.bmp': (b'BM',),
+    '.docx': (b'PK\x03\x04',),
+    '.xlsx': (b'PK\x03\x04',),
+    '.zip': (b'PK\x03\x04', b'PK\x05\x06'),
+    '.7z': (b"7z\xbc\xaf'\x1c",),
+    '.rar': (b'Rar!\x1a\x07',),
+}
+
+READ_SIZE = 64 * 1024
+
+
+class UploadError(Exception):
+    """
+    Rejected upload request.
+
+    ``status`` is the HTTP status to answer with, ``offset`` the number of
+    bytes received (for resuming) and ``abort`` whether the upload was
+    discarded.
+    """
+
+    def __init__(self, message, status=400, offset=None, abort=False):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.offset = offset
+        self.abort = abort
+
+
+class ChunkedUploadFile(File):
+    """Completed upload; storage can move it into place instead of copying"""
+
+    def __init__(self, path, name):
+        super().__init__(open(path, 'rb'), name=name)
+        self.path = path
+        # Read by AppointmentAttachment.save() instead of hashing the file again
+        self.sha256 = file_sha256(self)
+
+    def temporary_file_path(self):
+        return self.path
+
+
+def max_size_for(filename):
+    """Return the size limit in bytes for a file with the given name"""
+    extension = os.path.splitext(filename)[1].lower()
+    if extension in IMAGING_EXTENSIONS:
+        return max(settings.ATTACHMENT_IMAGING_MAX_SIZE, settings.ATTACHMENT_MAX_SIZE)
+    return settings.ATTACHMENT_MAX_SIZE
+
+
+def upload_path(upload):
+    """Return the path of the upload's temporary file"""
+    return attachment_storage.path(f'{INCOMPLETE_PREFIX}/{upload.pk}')
+
+
+def current_offset(upload):
+    """Return the number of bytes received so far"""
+    try:
+        return os.path.getsize(upload_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+def validate_upload(filename, size):
+    """
+    Check the name and declared size of a new upload.
+
+    Raises:
+        UploadError: Unsupported extension (415) or file too large (413)
+    """
+    allowed = AppointmentAttachmentForm.ALLOWED_EXTENSIONS
+    extension = os.path.splitext(filename)[1].lower()
+    if extension not in allowed:
+        raise UploadError(
+            f'Niedozwolony typ pliku: {extension or "brak rozszerzenia"}. '
+            f'Dozwolone rozszerzenia: {", ".join(allowed)}',
+            status=415,
+        )
+
+    limit = max_size_for(filename)
+    if size <= 0:
+        raise UploadError('Nieprawidłowy rozmiar pliku.')
+    if size > limit:
+        raise UploadError(
+            f'Plik jest za duży. Maksymalny rozmiar to {limit / (1024 * 1024):.0f}MB. '
+            f'Twój plik ma {size / (1024 * 1024):.2f}MB.',
+            status=413,
+        )
+
+
+def start_upload(appointment, doctor, filename, size, file_type='other', description=''):
+    """
+    Validate and register a new chunked upload.
+
+    Returns:
+        AttachmentUpload: The upload, with an empty temporary file
+    """
+    filename = os.path.basename(filename.replace('\\', '/'))[:255]
+    validate_upload(filename, size)
+
+    valid_types = dict(AppointmentAttachment.FILE_TYPE_CHOICES)
+    upload = AttachmentUpload.objects.create(
+        appointment=appointment,
+        uploaded_by=doctor,
+        original_name=filename,
+        file_type=file_type if file_type in valid_types else 'other',
+        description=description or '',
+        size=size,
+    )
+
+    path = upload_path(upload)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'wb').close()
+    return upload
+
+
+@contextmanager
+def _locked(upload):
+    """
+    Hold an exclusive lock on the upload's temporary file.
+
+    Yields the file opened for appending. Another request holding the lock
+    (e.g. a retried chunk still in flight) is answered with 409, a finished
+    or aborted upload with 404.
+    """
+    try:
+        # Never re-create the file of an upload finished in the meantime
+        fd = os.open(upload_path(upload), os.O_WRONLY | os.O_APPEND)
+    except FileNotFoundError:
+        raise UploadError('Przesyłanie zostało zakończone lub anulowane.', status=404)
+    with os.fdopen(fd, 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError(
+                'Trwa przesyłanie innej części tego pliku - wznów od podanego miejsca.',
+                status=409, offset=current_offset(upload),
+            )
+        yield f
+
+
+def write_chunk(upload, offset, stream, length):
+    """
+    Append ``length`` bytes read from ``stream`` at ``offset``.
+
+    The offset must equal the number of bytes already received. A chunk
+    that would exceed the declared size, or a first chunk that does not
+    match the file extension, aborts the whole upload.
+
+    Returns:
+        int: The new offset
+
+    Raises:
+        UploadError: Offset mismatch or concurrent chunk (409), chunk or
+            file too large (413), content not matching the extension (415),
+            upload already finished or aborted (404)
+    """
+    try:
+        with _locked(upload) as f:
+            _append(upload, offset, stream, length, f)
+    except UploadError as e:
+        if e.abort:
+            abort_upload(upload)
+        raise
+    AttachmentUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now())
+    return current_offset(upload)
+
+
+def _append(upload, offset, stream, length, f):
+    received = current_offset(upload)
+    if offset != received:
+        raise UploadError(
+            'Nieprawidłowy offset - wznów przesyłanie od podanego miejsca.',
+            status=409, offset=received,
+        )
+    if length > settings.ATTACHMENT_CHUNK_SIZE:
+        raise UploadError(
+            f'Część pliku jest za duża (maks. {settings.ATTACHMENT_CHUNK_SIZE} B).',
+            status=413, offset=received,
+        )
+    if offset + length > upload.size:
+        raise UploadError(
+            'Plik jest większy niż zadeklarowano. Przesyłanie przerwane.',
+            status=413, abort=True,
+        )
+
+    remaining = length
+    while remaining:
+        data = stream.read(min(READ_SIZE, remaining))
+        if not data:
+            break
+        if offset == 0 and remaining == length and not _matches_signature(upload.original_name, data):
+            raise UploadError(
+                'Zawartość pliku nie odpowiada jego rozszerzeniu. Przesyłanie przerwane.',
+                status=415, abort=True,
+            )
+        f.write(data)
+        remaining -= len(data)
+
+
+def _matches_signature(filename, data):
+    signatures = SIGNATURES.get(os.path.splitext(filename)[1].lower())
+    if not signatures:
+        return True
+    return any(data.startswith(s) or s.startswith(data) for s in signatures)
+
+
+def finish_upload(upload):
+    """
+    Turn a completely received upload into an attachment.
+
+    Returns:
+        AppointmentAttachment: The new attachment
+
+    Raises:
+        UploadError: Not all bytes received yet or a chunk still being
+            written (409), upload already finished or aborted (404)
+    """
+    path = upload_path(upload)
+    with _locked(upload):
+        received = current_offset(upload)
+        if received != upload.size:
+            raise UploadError(
+                f'Przesłano {received} z {upload.size} bajtów.',
+                status=409, offset=received,
+            )
+
+        # Hashed here, outside the transaction
+        upload_file = ChunkedUploadFile(path, upload.original_name)
+        attachment = AppointmentAttachment(
+            appointment_id=upload.appointment_id,
+            uploaded_by_id=upload.uploaded_by_id,
+            file_type=upload.file_type,
+            description=upload.description,
+            file=upload_file,
+        )
+        try:
+            with transaction.atomic():
+                # Storage moves the file into place (a rename)
+                attachment.save()
+                upload.delete()
+        finally:
+            upload_file.close()
+
+    _remove(path)
+    return attachment
+
+
+def abort_upload(upload):
+    """Delete an upload and its temporary file"""
+    path = upload_path(upload)
+    upload.delete()
+    _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
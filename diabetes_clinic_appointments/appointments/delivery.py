@@ -0,0 +1,303 @@
+"""
+Delivery of protected attachment files.
+
+Views check permissions and then hand the file over to the web server
+instead of streaming it through a (scarce) application worker:
+
+* ``nginx``  - ``X-Accel-Redirect`` to an ``internal`` location that maps
+  ``ATTACHMENT_ACCEL_REDIRECT_PREFIX`` onto ``MEDIA_ROOT``,
+* ``apache`` - ``X-Sendfile`` with the absolute, URL-quoted file path
+  (mod_xsendfile),
+* ``django`` - stream the file from Django (development, tests).
+
+The mode is selected with the ``ATTACHMENT_DELIVERY`` setting. In every
+mode conditional requests (``If-None-Match``, ``If-Modified-Since``) are
+answered by Django with 304 before touching the file. When Django streams
+the file itself it also honours ``Range`` (single and multiple ranges) and
+``If-Range``; nginx and Apache do that on their own.
+
+Under ASGI, Django reads synchronous iterators of streamed responses into a
+list before sending them; ``stream_for_asgi`` reads them chunk by chunk
+instead, so large files and ZIP exports are not held in memory.
+"""
+
+import mimetypes
+import re
+import secrets
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+from utilities.metrics import Counter
+
+
+DELIVERY_MODES = ('django', 'nginx', 'apache')
+
+# More ranges than this in one request are ignored and the whole file is sent
+MAX_RANGES = 16
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_SPEC = re.compile(r'^\s*(\d*)\s*-\s*(\d*)\s*$')
+
+# Counted when the response is built; with nginx/Apache the web server sends them
+attachment_bytes = Counter(
+    'clinic_attachment_bytes_served_total', 'Bytes of attachment files sent by delivery mode', ['delivery']
+)
+
+
+def get_delivery_mode():
+    """Return the configured delivery mode"""
+    mode = getattr(settings, 'ATTACHMENT_DELIVERY', 'django')
+    if mode not in DELIVERY_MODES:
+        raise ImproperlyConfigured(
+            f"ATTACHMENT_DELIVERY must be one of {', '.join(DELIVERY_MODES)} (got {mode!r})"
+        )
+    return mode
+
+
+def parse_range_header(header, size):
+    """
+    Parse a ``Range: bytes=...`` header.
+
+    Args:
+        header (str): Header value
+        size (int): Length of the representation in bytes
+
+    Returns:
+        list | None: Sorted, coalesced ``(start, end)`` pairs (inclusive),
+        an empty list when no range is satisfiable, or None when the header
+        is malformed or should be ignored (the full file is served then)
+    """
+    unit, _, specs = header.partition('=')
+    if unit.strip().lower() != 'bytes' or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC.match(spec)
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+
+        if first == '':
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length == 0:
+                continue
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+            if end < start:
+                return None
+            if start >= size:
+                continue
+            end = min(end, size - 1)
+        ranges.append((start, end))
+
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    coalesced = []
+    for start, end in sorted(ranges):
+        if coalesced and start <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(coalesced[-1][1], end))
+        else:
+            coalesced.append((start, end))
+    return coalesced
+
+
+def _if_range_matches(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range is None:
+        return True
+    if if_range.startswith('"') or if_range.startswith('W/'):
+        # Strong comparison only
+        return not etag.startswith('W/') and if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def _read_range(file, start, end):
+    file.seek(start)
+    remaining = end - start + 1
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
+
+
+def _range_response(attachment, ranges, content_type):
+    size = attachment.file_size
+    file = attachment.file.open('rb')
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        response = StreamingHttpResponse(_read_range(file, start, end), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    else:
+        boundary = secrets.token_hex(16)
+        headers = [
+            (
+                f'--{boundary}\r\nContent-Type: {content_type}\r\n'
+                f'Content-Range: bytes {start}-{end}/{size}\r\n\r\n'
+            ).encode('ascii')
+            for start, end in ranges
+        ]
+        closing = f'\r\n--{boundary}--\r\n'.encode('ascii')
+
+        def parts():
+            for index, (start, end) in enumerate(ranges):
+                yield (b'\r\n' if index else b'') + headers[index]
+                yield from _read_range(file, start, end)
+            yield closing
+
+        length = sum(len(h) for h in headers) + 2 * (len(ranges) - 1) + len(closing)
+        length += sum(end - start + 1 for start, end in ranges)
+        response = StreamingHttpResponse(
+            parts(), status=206, content_type=f'multipart/byteranges; boundary={boundary}'
+        )
+        response['Content-Length'] = str(length)
+
+    response._resource_closers.append(file.close)
+    return response
+
+
+async def _iterate_in_thread(iterator):
+    next_chunk = sync_to_async(next)
+    while (chunk := await next_chunk(iterator, None)) is not None:
+        yield chunk
+
+
+def stream_for_asgi(request, response):
+    """Under ASGI, stream a response's synchronous iterator chunk by chunk (see module docstring)"""
+    if isinstance(request, ASGIRequest) and response.streaming and not response.is_async:
+        response.streaming_content = _iterate_in_thread(iter(response.streaming_content))
+    return response
+
+
+def _delegated_response(mode, name, path, content_type):
+    """Empty response telling nginx/Apache which file to send"""
+    response = HttpResponse(content_type=content_type)
+    if mode == 'nginx':
+        prefix = settings.ATTACHMENT_ACCEL_REDIRECT_PREFIX.rstrip('/')
+        response['X-Accel-Redirect'] = f'{prefix}/{quote(name)}'
+    else:
+        # mod_xsendfile URL-unescapes the path (XSendFileUnescape, on by default)
+        response['X-Sendfile'] = quote(path)
+    return response
+
+
+def serve_attachment(request, attachment, as_attachment=True):
+    """
+    Build the response delivering an attachment's file.
+
+    Permission checks must be done by the caller.
+
+    Args:
+        request: Current request
+        attachment: AppointmentAttachment instance
+        as_attachment (bool): Force a download instead of inline display
+            (used for opening PDFs and images in the browser)
+
+    Returns:
+        HttpResponse: 304/412 for satisfied conditional requests, an empty
+        response with a web-server redirect header, or the file (full,
+        206 partial or 416) streamed by Django
+    """
+    mode = get_delivery_mode()
+    etag = attachment.etag
+    last_modified = int(attachment.uploaded_at.timestamp())
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    if as_attachment:
+        content_type = 'application/octet-stream'
+    else:
+        content_type = mimetypes.guess_type(attachment.filename)[0] or 'application/octet-stream'
+
+    if mode != 'django':
+        # The body is supplied by the web server
+        response = _delegated_response(mode, attachment.file.name, attachment.file.path, content_type)
+    else:
+        range_header = request.META.get('HTTP_RANGE')
+        ranges = None
+        if range_header and request.method == 'GET' and _if_range_matches(request, etag, last_modified):
+            ranges = parse_range_header(range_header, attachment.file_size)
+
+        if ranges == []:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{attachment.file_size}'
+        elif ranges:
+            response = _range_response(attachment, ranges, content_type)
+        else:
+            response = FileResponse(attachment.file.open('rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+
+    response['Content-Disposition'] = content_disposition_header(as_attachment, attachment.filename)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if request.method == 'GET' and response.status_code in (200, 206):
+        attachment_bytes.inc(_served_bytes(request, response, attachment, mode), delivery=mode)
+    return stream_for_asgi(request, response)
+
+
+def _served_bytes(request, response, attachment, mode):
+    """Body size of a download (with nginx/Apache: of the ranges they will send)"""
+    if response.status_code == 206:
+        return int(response['Content-Length'])
+    if mode != 'django':
+        ranges = parse_range_header(request.META.get('HTTP_RANGE', ''), attachment.file_size)
+        if ranges:
+            return sum(end - start + 1 for start, end in ranges)
+    return attachment.file_size
+
+
+def serve_thumbnail(request, attachment):
+    """
+    Build the response delivering an attachment's WebP thumbnail.
+
+    Permission checks must be done by the caller. Thumbnails depend only on
+    the file content, so they are cached by the browser for a year.
+
+    Returns:
+        HttpResponse: 304 for a matching ``If-None-Match``, or the thumbnail
+        (sent by the web server or streamed by Django)
+
+    Raises:
+        Http404: The thumbnail file is missing (``has_thumbnail`` is cleared,
+        so the attachment list falls back to the file type icon)
+    """
+    from .storage import attachment_storage
+    from .thumbnails import THUMBNAIL_MAX_AGE, thumbnail_name
+
+    mode = get_delivery_mode()
+    name = thumbnail_name(attachment.sha256)
+    if not attachment_storage.exists(name):
+        type(attachment).objects.filter(sha256=attachment.sha256).update(has_thumbnail=False)
+        raise Http404('Miniatura nie istnieje.')
+    etag = f'"{attachment.sha256}-thumb"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        if mode != 'django':
+            response = _delegated_response(mode, name, attachment_storage.path(name), 'image/webp')
+        else:
+            response = FileResponse(attachment_storage.open(name, 'rb'), content_type='image/webp')
+
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={THUMBNAIL_MAX_AGE}, immutable'
+    return stream_for_asgi(request, response)
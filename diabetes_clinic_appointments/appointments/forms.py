@@ -4,6 +4,12 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from .models import Appointment
 from doctors.models import Doctor
+from utilities.metrics import Counter
+
+
+booking_conflicts = Counter(
+    'clinic_booking_conflicts_total', 'Bookings rejected because the slot is already taken', ['form']
+)
 
 
 class DateTimePickerWidget(forms.DateTimeInput):
@@ -110,6 +116,7 @@ class AppointmentBookingForm(forms.ModelForm):
             )
 
             if conflicting_appointments.exists():
+                booking_conflicts.inc(form='book')
                 raise ValidationError('Wybrany termin jest już zajęty. Wybierz inną godzinę.')
 
             # Basic validation for working hours (assuming 8:00-17:00)
@@ -211,6 +218,7 @@ class AppointmentEditForm(forms.ModelForm):
                 conflicting_appointments = conflicting_appointments.exclude(id=self.appointment_id)
 
             if conflicting_appointments.exists():
+                booking_conflicts.inc(form='edit')
                 raise ValidationError('Wybrany termin jest już zajęty. Wybierz inną godzinę.')
 
             # Basic validation for working hours (assuming 8:00-17:00)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand
+
+from appointments.models import Appointment, NoteTemplate
+
+
+class Command(BaseCommand):
+    help = 'Populate the stored HTML/text/excerpt renderings of appointment notes and note templates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Number of rows loaded and updated per query (default: 500)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Recompute renderings even when the stored content hash matches '
+                 '(e.g. after changing the sanitizer)',
+        )
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        force = options['force']
+
+        updated, total = self.backfill(
+            Appointment.objects.only('id', 'notes', *Appointment.RENDERED_NOTES_FIELDS),
+            'refresh_rendered_notes',
+            Appointment.RENDERED_NOTES_FIELDS,
+            chunk_size,
+            force,
+        )
+        self.stdout.write(f'Wizyty: zaktualizowano {updated} z {total}')
+
+        updated, total = self.backfill(
+            NoteTemplate.objects.only('id', 'content', *NoteTemplate.RENDERED_CONTENT_FIELDS),
+            'refresh_rendered_content',
+            NoteTemplate.RENDERED_CONTENT_FIELDS,
+            chunk_size,
+            force,
+        )
+        self.stdout.write(f'Szablony: zaktualizowano {updated} z {total}')
+
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
+
+    def backfill(self, queryset, refresh_method, fields, chunk_size, force):
+        """Walk the table in primary-key order, one chunk at a time, saving only changed rows"""
+        model = queryset.model
+        queryset = queryset.order_by('pk')
+        last_pk = None
+        updated = total = 0
+
+        while True:
+            chunk = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk[:chunk_size])
+            if not chunk:
+                break
+
+            changed = [obj for obj in chunk if getattr(obj, refresh_method)(force=force)]
+            if changed:
+                model.objects.bulk_update(changed, fields)
+
+            last_pk = chunk[-1].pk
+            total += len(chunk)
+            updated += len(changed)
+
+        return updated, total
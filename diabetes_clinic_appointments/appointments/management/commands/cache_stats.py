@@ -0,0 +1,55 @@
+from django.core.cache import caches
+from django.core.management.base import BaseCommand
+
+from utilities.cache import flush_stats, get_stats, reset_stats
+
+
+REDIS_INFO_FIELDS = ('keyspace_hits', 'keyspace_misses', 'evicted_keys', 'used_memory_human')
+
+
+class Command(BaseCommand):
+    help = 'Show cache hit rates per namespace (utilities.cache) and Redis server statistics'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alias', default='default', help='Cache alias from settings.CACHES')
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        alias = options['alias']
+        cache = caches[alias]
+        self.stdout.write(f'Backend: {type(cache).__module__}.{type(cache).__name__}')
+
+        flush_stats(alias)
+        stats = get_stats(alias)
+        if not stats:
+            self.stdout.write('Brak zarejestrowanych odczytów.')
+        for name, counters in stats.items():
+            total = counters['hits'] + counters['misses']
+            rate = counters['hits'] / total * 100 if total else 0
+            self.stdout.write(
+                f'{name:<20} trafienia: {counters["hits"]:>8}  chybienia: {counters["misses"]:>8}  '
+                f'hit rate: {rate:5.1f}%'
+            )
+
+        info = self._redis_info(cache)
+        if info:
+            self.stdout.write('Redis:')
+            for field in REDIS_INFO_FIELDS:
+                if field in info:
+                    self.stdout.write(f'  {field}: {info[field]}')
+
+        if options['reset']:
+            reset_stats(alias)
+            self.stdout.write('Liczniki wyzerowane.')
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
+
+    def _redis_info(self, cache):
+        # Only django.core.cache.backends.redis.RedisCache exposes the client
+        client = getattr(getattr(cache, '_cache', None), 'get_client', None)
+        if client is None:
+            return None
+        try:
+            return client().info()
+        except Exception as e:
+            self.stderr.write(f'Nie udało się pobrać statystyk Redis: {e}')
+            return None
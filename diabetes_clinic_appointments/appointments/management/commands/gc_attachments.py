@@ -0,0 +1,87 @@
+import os
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from appointments.chunked import abort_upload
+from appointments.models import AppointmentAttachment, AttachmentUpload
+from appointments.storage import BLOB_PREFIX, attachment_storage
+from appointments.thumbnails import thumbnail_name
+
+
+class Command(BaseCommand):
+    help = ('Delete content-addressed attachment blobs no AppointmentAttachment refers to '
+            'and chunked uploads abandoned for longer than the grace period')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--grace-hours',
+            type=float,
+            default=24,
+            help='Keep unreferenced blobs modified within this many hours, e.g. '
+                 'uploads whose attachment row is not committed yet (default: 24)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be deleted',
+        )
+
+    def handle(self, *args, **options):
+        root = attachment_storage.path(BLOB_PREFIX)
+        cutoff = time.time() - options['grace_hours'] * 3600
+        dry_run = options['dry_run']
+
+        referenced = set(
+            AppointmentAttachment.objects.filter(
+                file__startswith=f'{BLOB_PREFIX}/'
+            ).values_list('file', flat=True)
+        )
+        # Thumbnails live and die with the content they show; legacy
+        # attachments (outside the blob layout) have them under the blob name too
+        thumbnails = {
+            thumbnail_name(sha256) for sha256 in
+            AppointmentAttachment.objects.exclude(sha256='').values_list('sha256', flat=True).distinct()
+        }
+
+        scanned = deleted = freed = 0
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, attachment_storage.location).replace(os.sep, '/')
+                scanned += 1
+
+                if name in referenced or name in thumbnails:
+                    continue
+                stat = os.stat(path)
+                if stat.st_mtime > cutoff:
+                    continue
+
+                deleted += 1
+                freed += stat.st_size
+                if dry_run:
+                    self.stdout.write(f'Do usunięcia: {name}')
+                else:
+                    os.remove(path)
+
+        action = 'Do usunięcia' if dry_run else 'Usunięto'
+        self.stdout.write(
+            f'Przeskanowano {scanned} plików, odwołań w bazie: {len(referenced)}. '
+            f'{action}: {deleted} ({freed / (1024 * 1024):.2f} MB).'
+        )
+
+        # Chunked uploads nobody resumed (see appointments/chunked.py)
+        stale = AttachmentUpload.objects.filter(
+            updated_at__lt=timezone.now() - timedelta(hours=options['grace_hours'])
+        )
+        abandoned = 0
+        for upload in stale:
+            abandoned += 1
+            if dry_run:
+                self.stdout.write(f'Przerwane przesyłanie do usunięcia: {upload.original_name} ({upload.id})')
+            else:
+                abort_upload(upload)
+        self.stdout.write(f'Przerwane przesyłania - {action.lower()}: {abandoned}.')
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
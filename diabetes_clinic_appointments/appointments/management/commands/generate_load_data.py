@@ -0,0 +1,481 @@
+import hashlib
+import math
+import random
+import time
+from datetime import date, datetime, timedelta
+from datetime import time as day_time
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from appointments.models import Appointment, AppointmentAttachment, DiabetesPrediction
+from appointments.storage import attachment_storage, blob_name
+from authentication.models import User
+from doctors.models import Doctor
+from patients.models import Patient
+from utilities.richtext import render_rich_text
+from utilities.search import repair_search_index, suspend_search_index
+from utilities.validators import generate_pesel
+from utilities.view_cache import bump_version
+
+
+USERNAME_PREFIX = 'load_'
+
+SEARCH_INDEXES = ('users', 'notes')
+
+MALE_FIRST_NAMES = ['Jan', 'Piotr', 'Krzysztof', 'Andrzej', 'Tomasz', 'Paweł', 'Marcin', 'Michał', 'Jakub', 'Adam']
+FEMALE_FIRST_NAMES = ['Anna', 'Maria', 'Katarzyna', 'Małgorzata', 'Agnieszka', 'Barbara', 'Ewa', 'Magdalena', 'Zofia', 'Joanna']
+LAST_NAMES = ['Nowak', 'Kowalski', 'Wiśniewski', 'Wójcik', 'Kowalczyk', 'Kamiński', 'Lewandowski', 'Zieliński',
+              'Szymański', 'Woźniak', 'Dąbrowski', 'Kozłowski', 'Mazur', 'Jankowski', 'Kwiatkowski', 'Krawczyk']
+CITIES = [('00-001', 'Warszawa'), ('30-001', 'Kraków'), ('50-001', 'Wrocław'), ('60-001', 'Poznań'),
+          ('80-001', 'Gdańsk'), ('90-001', 'Łódź'), ('20-001', 'Lublin'), ('40-001', 'Katowice')]
+STREETS = ['Warszawska', 'Polna', 'Leśna', 'Słoneczna', 'Krótka', 'Szkolna', 'Ogrodowa', 'Lipowa', 'Kwiatowa']
+
+REASONS = ['Wizyta kontrolna', 'Kontrola poziomu glukozy', 'Omówienie wyników HbA1c', 'Dobór dawki insuliny',
+           'Konsultacja dietetyczna', 'Pierwsza wizyta', 'Zmiana leczenia', 'Problemy ze stopą cukrzycową',
+           'Edukacja - obsługa glukometru', 'Recepta na leki']
+
+NOTES = [
+    '<p>Pacjent w dobrym stanie ogólnym. <strong>HbA1c 6,8%</strong>. Kontynuacja leczenia.</p>',
+    '<p>Glikemie na czczo 140-160 mg/dl.</p><ul><li>Metformina 1000 mg 2x dziennie</li>'
+    '<li>Kontrola za 3 miesiące</li></ul>',
+    '<p>Zgłasza epizody hipoglikemii w nocy. Zmniejszono dawkę insuliny długodziałającej o 2 j.</p>',
+    '<p>Omówiono zasady diety o niskim indeksie glikemicznym. Zalecono aktywność fizyczną 150 min/tydzień.</p>',
+    '<p>Badanie stóp bez zmian. Skierowanie na badanie dna oka.</p>',
+    '<p>Wyniki: cholesterol LDL 130 mg/dl, kreatynina w normie. <em>Rozważyć statynę.</em></p>',
+]
+
+ATTACHMENTS = [
+    ('wyniki_badan.txt', 'test_result', b'Glukoza na czczo: 126 mg/dl\nHbA1c: 7,1%\n'),
+    ('skierowanie.txt', 'document', b'Skierowanie na badanie dna oka.\n'),
+    ('dzienniczek_glikemii.csv', 'other', b'data;godzina;glukoza\n2024-01-01;07:00;132\n'),
+]
+
+RISK_LEVELS = [(30, 'niskie', 'green'), (50, 'umiarkowane', 'yellow'), (70, 'wysokie', 'orange'),
+               (101, 'bardzo wysokie', 'red')]
+
+WORKING_WEEKDAYS = {'mon-fri': (0, 1, 2, 3, 4), 'mon-sat': (0, 1, 2, 3, 4, 5), 'tue-thu': (1, 2, 3)}
+
+# Days between appointments of a series; 4 weeks for "monthly" keeps the weekday
+SERIES_INTERVALS = {'weekly': 7, 'biweekly': 14, 'monthly': 28}
+
+
+class RowWriter:
+    """
+    Insert rows (dicts of field attname -> value) with executemany or COPY.
+
+    Skips model instances and bulk_create's per-value SQL compilation, which
+    cap generation at a few hundred thousand rows per minute. Fields missing
+    from a row get the field default; no save() or pre_save() runs, so
+    auto_now values and denormalized fields must be given explicitly.
+    """
+
+    # Values of these fields need the backend's conversion (e.g. datetimes to
+    # UTC strings on SQLite); psycopg adapts them natively for COPY
+    ADAPTED_TYPES = {'DateTimeField', 'DateField', 'TimeField', 'DecimalField'}
+
+    def __init__(self, using, batch_size, copy):
+        self.connection = connections[using]
+        self.batch_size = batch_size
+        self.copy = copy
+        self.adapted = {}
+
+    def write(self, model, rows):
+        if not rows:
+            return
+        fields = model._meta.concrete_fields
+        columns = [
+            (field.attname, field.get_default(),
+             field if field.get_internal_type() in self.ADAPTED_TYPES and not self.copy else None,
+             self.adapted.setdefault(field, {}))
+            for field in fields
+        ]
+        records = []
+        for row in rows:
+            record = []
+            for attname, default, field, adapted in columns:
+                value = row.get(attname, default)
+                if field is not None and value is not None:
+                    # Few distinct values (timestamps, slot times) repeat across rows
+                    prepared = adapted.get(value)
+                    if prepared is None:
+                        if len(adapted) > 100000:
+                            adapted.clear()
+                        prepared = adapted[value] = field.get_db_prep_save(value, self.connection)
+                    value = prepared
+                record.append(value)
+            records.append(record)
+
+        quote = self.connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        names = ', '.join(quote(field.column) for field in fields)
+        with self.connection.cursor() as cursor:
+            if self.copy:
+                with cursor.copy(f'COPY {table} ({names}) FROM STDIN') as copy:
+                    for record in records:
+                        copy.write_row(record)
+            else:
+                placeholders = ', '.join(['%s'] * len(fields))
+                sql = f'INSERT INTO {table} ({names}) VALUES ({placeholders})'
+                for start in range(0, len(records), self.batch_size):
+                    cursor.executemany(sql, records[start:start + self.batch_size])
+
+
+class Command(BaseCommand):
+    help = ('Generate a large synthetic dataset (doctors, patients with valid PESELs, appointments with '
+            'notes, series, attachments and predictions) for load and benchmark testing')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=200, help='Number of doctors (default: 200)')
+        parser.add_argument('--patients', type=int, default=50000, help='Number of patients (default: 50000)')
+        parser.add_argument(
+            '--appointments',
+            type=int,
+            default=1000000,
+            help='Number of appointments, about a year of history per doctor at 1M (default: 1000000)',
+        )
+        parser.add_argument('--seed', type=int, default=42, help='Random seed - same seed, same data (default: 42)')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows generated and inserted per transaction (default: 5000)',
+        )
+        parser.add_argument(
+            '--password',
+            default='loadtest123',
+            help='Password of every generated account (default: loadtest123)',
+        )
+        parser.add_argument(
+            '--copy',
+            action='store_true',
+            help='Insert with COPY instead of INSERT (PostgreSQL with psycopg 3 only)',
+        )
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias (default: default)')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        connection = connections[self.using]
+        if options['copy'] and connection.vendor != 'postgresql':
+            raise CommandError('--copy wymaga bazy PostgreSQL.')
+        if min(options['doctors'], options['patients']) < 1 and options['appointments'] > 0:
+            raise CommandError('Wizyty wymagają co najmniej jednego lekarza i pacjenta.')
+
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.batch_size = options['batch_size']
+        self.writer = RowWriter(self.using, self.batch_size, options['copy'])
+        # Hashing a password takes ~0.5 s, so every account shares one hash
+        self.password = make_password(options['password'])
+
+        started = time.monotonic()
+        # Search indexes are rebuilt once at the end instead of row by row
+        for index in SEARCH_INDEXES:
+            suspend_search_index(connection, index)
+        try:
+            doctors = self.timed('Lekarze', self.create_doctors, options['doctors'])
+            patients = self.timed('Pacjenci', self.create_patients, options['patients'])
+            self.timed('Wizyty', self.create_appointments, options['appointments'], doctors, patients)
+        finally:
+            start = time.monotonic()
+            for index in SEARCH_INDEXES:
+                repair_search_index(connection, index)
+            self.stdout.write(f'Indeksy wyszukiwania: {time.monotonic() - start:.1f} s')
+
+        models = [User, Doctor, Patient, Appointment, AppointmentAttachment, DiabetesPrediction]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        bump_version('users')
+
+        self.stdout.write(
+            f'Czas całkowity: {time.monotonic() - started:.1f} s. Konta: {USERNAME_PREFIX}doctor_<id>, '
+            f'{USERNAME_PREFIX}patient_<id>, hasło: {options["password"]}'
+        )
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
+
+    def timed(self, label, method, *args):
+        start = time.monotonic()
+        result, rows = method(*args)
+        elapsed = max(time.monotonic() - start, 1e-9)
+        self.stdout.write(f'{label}: {rows} wierszy w {elapsed:.1f} s ({rows / elapsed * 60:,.0f} wierszy/min)')
+        return result
+
+    def next_pk(self, model):
+        return (model.objects.using(self.using).aggregate(Max('pk'))['pk__max'] or 0) + 1
+
+    def flush(self, *groups):
+        """Insert groups of (model, rows) in one transaction, parents first"""
+        with transaction.atomic(using=self.using):
+            for model, rows in groups:
+                self.writer.write(model, rows)
+
+    def person(self, female):
+        first_name = self.rng.choice(FEMALE_FIRST_NAMES if female else MALE_FIRST_NAMES)
+        last_name = self.rng.choice(LAST_NAMES)
+        if female and last_name.endswith('ski'):
+            last_name = last_name[:-1] + 'a'
+        return first_name, last_name
+
+    def address(self):
+        postcode, city = self.rng.choice(CITIES)
+        return f'ul. {self.rng.choice(STREETS)} {self.rng.randint(1, 120)}\n{postcode} {city}'
+
+    def user(self, pk, kind, first_name, last_name):
+        username = f'{USERNAME_PREFIX}{kind}_{pk}'
+        return dict(
+            id=pk,
+            username=username,
+            password=self.password,
+            first_name=first_name,
+            last_name=last_name,
+            email=f'{username}@example.com',
+            user_type=kind,
+            phone_number=f'+48{self.rng.randint(500000000, 899999999)}',
+            date_joined=self.now,
+        )
+
+    def create_doctors(self, count):
+        """Return (doctor pk, working weekdays, slot times) per doctor"""
+        user_pk, doctor_pk = self.next_pk(User), self.next_pk(Doctor)
+        users, doctors, calendars = [], [], []
+        for i in range(count):
+            first_name, last_name = self.person(female=self.rng.random() < 0.6)
+            start_hour = self.rng.choice([7, 8, 8, 9])
+            working_days = self.rng.choices(list(WORKING_WEEKDAYS), weights=[85, 10, 5])[0]
+            users.append(self.user(user_pk + i, 'doctor', first_name, last_name))
+            doctors.append(dict(
+                id=doctor_pk + i,
+                user_id=user_pk + i,
+                license_number=f'LD{doctor_pk + i:08d}',
+                specialization=self.rng.choice(['diabetologist', 'diabetologist', 'endocrinologist',
+                                                'internal_medicine', 'family_medicine']),
+                years_of_experience=self.rng.randint(1, 35),
+                office_address=self.address(),
+                consultation_fee=Decimal(self.rng.choice([150, 200, 250, 300])),
+                working_hours_start=day_time(start_hour),
+                working_hours_end=day_time(start_hour + 8),
+                working_days=working_days,
+                education='Uniwersytet Medyczny',
+                created_at=self.now,
+                updated_at=self.now,
+            ))
+            slots = [timedelta(hours=start_hour, minutes=30 * n) for n in range(16)]
+            calendars.append((doctor_pk + i, WORKING_WEEKDAYS[working_days], slots))
+        self.flush((User, users), (Doctor, doctors))
+        return calendars, count * 2
+
+    def create_patients(self, count):
+        """Return (patient pk, birth year, female) per patient"""
+        user_pk, patient_pk = self.next_pk(User), self.next_pk(Patient)
+        existing_pesels = set(Patient.objects.using(self.using).values_list('pesel', flat=True))
+        first_birth_date = date(1935, 1, 1)
+        birth_days = (date(2008, 12, 31) - first_birth_date).days
+
+        patients = []
+        serial = 0
+        for start in range(0, count, self.batch_size):
+            users, profiles = [], []
+            for i in range(start, min(start + self.batch_size, count)):
+                female = self.rng.random() < 0.5
+                birth_date = first_birth_date + timedelta(days=self.rng.randrange(birth_days))
+                pesel = generate_pesel(birth_date, self.rng.randrange(1000), female)
+                while pesel in existing_pesels:
+                    serial = (serial + 1) % 1000
+                    pesel = generate_pesel(birth_date, serial, female)
+                existing_pesels.add(pesel)
+
+                diabetes_type = self.rng.choices(
+                    ['type2', 'type1', 'healthy', 'gestational'], weights=[65, 20, 10, 5]
+                )[0]
+                if diabetes_type == 'gestational' and not female:
+                    diabetes_type = 'type2'
+                first_name, last_name = self.person(female)
+                diagnosis_date = None
+                if diabetes_type != 'healthy':
+                    diagnosis_date = self.now.date() - timedelta(days=self.rng.randrange(30, 20 * 365))
+                    diagnosis_date = max(diagnosis_date, birth_date + timedelta(days=365))
+
+                users.append(self.user(user_pk + i, 'patient', first_name, last_name))
+                profiles.append(dict(
+                    id=patient_pk + i,
+                    user_id=user_pk + i,
+                    date_of_birth=birth_date,
+                    pesel=pesel,
+                    address=self.address(),
+                    emergency_contact_name=' '.join(self.person(not female)),
+                    emergency_contact_phone=f'+48{self.rng.randint(500000000, 899999999)}',
+                    diabetes_type=diabetes_type,
+                    diagnosis_date=diagnosis_date,
+                    current_medications=self.rng.choice(
+                        ['', 'Metformina 500 mg 2x dziennie', 'Insulina glargine 20 j. wieczorem']
+                    ),
+                    allergies=self.rng.choice(['', '', '', 'Penicylina']),
+                    created_at=self.now,
+                    updated_at=self.now,
+                ))
+                patients.append((patient_pk + i, birth_date.year, female))
+            self.flush((User, users), (Patient, profiles))
+        return patients, count * 2
+
+    def attachment_blobs(self):
+        """Store the few attachment files once; generated attachments share them"""
+        blobs = []
+        for original_name, file_type, content in ATTACHMENTS:
+            sha256 = hashlib.sha256(content).hexdigest()
+            name = attachment_storage.save(blob_name(sha256), ContentFile(content))
+            blobs.append((name, original_name, file_type, len(content), sha256))
+        return blobs
+
+    def create_appointments(self, count, doctors, patients):
+        if not count:
+            return None, 0
+        appointment_pk = self.next_pk(Appointment)
+        attachment_pk = self.next_pk(AppointmentAttachment)
+        prediction_pk = self.next_pk(DiabetesPrediction)
+        blobs = self.attachment_blobs()
+        notes = []
+        for html in NOTES:
+            rendered = render_rich_text(html)
+            notes.append({'notes': html, 'notes_text': rendered.text, 'notes_html': rendered.html,
+                          'notes_excerpt': rendered.excerpt, 'notes_hash': rendered.hash})
+
+        today = timezone.localdate()
+        current_tz = timezone.get_current_timezone()
+        # Overlapping panels: every patient sees about 3 doctors
+        panel = min(len(patients), max(1, 3 * len(patients) // len(doctors)))
+        appointments, attachments, predictions = [], [], []
+        rows = 0
+
+        for index, (doctor_pk, weekdays, slots) in enumerate(doctors):
+            remaining = count // len(doctors) + (index < count % len(doctors))
+            occupancy = self.rng.uniform(0.5, 0.9)
+            # Book the doctor's calendar day by day; mostly history, at most
+            # two months ahead
+            working_days_needed = math.ceil(remaining / (len(slots) * occupancy))
+            calendar_days = math.ceil(working_days_needed * 7 / len(weekdays))
+            day = today + timedelta(days=min(60, calendar_days // 10) - calendar_days)
+            panel_start = index * len(patients) // len(doctors)
+            series = {}
+
+            while remaining:
+                day += timedelta(days=1)
+                if day.weekday() not in weekdays:
+                    continue
+                midnight = datetime.combine(day, day_time())
+                for slot in slots:
+                    if not remaining:
+                        break
+                    instance_of = series.pop((day, slot), None)
+                    if instance_of is None and self.rng.random() > occupancy:
+                        continue
+
+                    appointment_date = timezone.make_aware(midnight + slot, current_tz)
+                    past = day < today
+                    if past:
+                        status = self.rng.choices(['completed', 'cancelled', 'no_show'], weights=[82, 10, 8])[0]
+                    else:
+                        status = 'scheduled' if self.rng.random() < 0.92 else 'cancelled'
+
+                    fields = {}
+                    if instance_of is not None:
+                        head, patient, reason, pattern, end_date = instance_of
+                        fields = {'is_recurring': True, 'recurrence_pattern': pattern,
+                                  'recurrence_end_date': end_date, 'parent_appointment_id': head}
+                    else:
+                        patient = patients[(panel_start + self.rng.randrange(panel)) % len(patients)]
+                        reason = self.rng.choice(REASONS)
+                        if self.rng.random() < 0.04:
+                            pattern = self.rng.choice(list(SERIES_INTERVALS))
+                            repeats = self.rng.randint(2, 6)
+                            interval = SERIES_INTERVALS[pattern]
+                            end_date = day + timedelta(days=interval * repeats)
+                            fields = {'is_recurring': True, 'recurrence_pattern': pattern,
+                                      'recurrence_end_date': end_date}
+                            for n in range(1, repeats + 1):
+                                series[(day + timedelta(days=interval * n), slot)] = (
+                                    appointment_pk, patient, reason, pattern, end_date
+                                )
+                    if status == 'completed' and self.rng.random() < 0.6:
+                        fields.update(self.rng.choice(notes))
+
+                    appointments.append(dict(
+                        id=appointment_pk,
+                        patient_id=patient[0],
+                        doctor_id=doctor_pk,
+                        appointment_date=appointment_date,
+                        status=status,
+                        reason=reason,
+                        created_at=self.now,
+                        updated_at=self.now,
+                        **fields,
+                    ))
+                    if status == 'completed':
+                        if self.rng.random() < 0.05:
+                            attachments.append(self.attachment(attachment_pk, appointment_pk, doctor_pk, blobs))
+                            attachment_pk += 1
+                        if self.rng.random() < 0.15:
+                            predictions.append(
+                                self.prediction(prediction_pk, appointment_pk, doctor_pk, patient, day.year)
+                            )
+                            prediction_pk += 1
+                    appointment_pk += 1
+                    remaining -= 1
+
+                    if len(appointments) >= self.batch_size:
+                        rows += len(appointments) + len(attachments) + len(predictions)
+                        self.flush((Appointment, appointments), (AppointmentAttachment, attachments),
+                                   (DiabetesPrediction, predictions))
+                        appointments, attachments, predictions = [], [], []
+
+        rows += len(appointments) + len(attachments) + len(predictions)
+        self.flush((Appointment, appointments), (AppointmentAttachment, attachments),
+                   (DiabetesPrediction, predictions))
+        return None, rows
+
+    def attachment(self, pk, appointment_pk, doctor_pk, blobs):
+        name, original_name, file_type, size, sha256 = self.rng.choice(blobs)
+        return dict(
+            id=pk,
+            appointment_id=appointment_pk,
+            file=name,
+            original_name=original_name,
+            file_type=file_type,
+            uploaded_by_id=doctor_pk,
+            uploaded_at=self.now,
+            file_size=size,
+            sha256=sha256,
+        )
+
+    def prediction(self, pk, appointment_pk, doctor_pk, patient, year):
+        _, birth_year, female = patient
+        glucose = self.rng.gauss(125, 30)
+        bmi = self.rng.gauss(29, 5)
+        # Rough logistic risk so that the stored level matches the inputs
+        probability = 1 / (1 + math.exp(-(0.035 * (glucose - 125) + 0.08 * (bmi - 29) - 0.4)))
+        percentage = probability * 100
+        _, risk_level, risk_color = next(level for level in RISK_LEVELS if percentage < level[0])
+        return dict(
+            id=pk,
+            appointment_id=appointment_pk,
+            pregnancies=self.rng.randint(0, 4) if female else 0,
+            glucose=round(max(glucose, 50), 1),
+            blood_pressure=round(self.rng.gauss(80, 10), 1),
+            skin_thickness=round(self.rng.uniform(10, 45), 1),
+            insulin=round(self.rng.uniform(15, 250), 1),
+            bmi=round(max(bmi, 16), 1),
+            diabetes_pedigree=round(self.rng.uniform(0.08, 2.4), 3),
+            age=max(year - birth_year, 1),
+            probability=probability,
+            percentage=percentage,
+            risk_level=risk_level,
+            risk_color=risk_color,
+            created_by_id=doctor_pk,
+            created_at=self.now,
+        )
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from appointments.models import AppointmentAttachment
+from appointments.thumbnails import generate_thumbnail, supports_thumbnail
+
+
+class Command(BaseCommand):
+    help = 'Generate missing thumbnails for image and PDF attachments (e.g. uploaded before thumbnails existed)'
+
+    def handle(self, *args, **options):
+        pending = AppointmentAttachment.objects.filter(has_thumbnail=False).exclude(sha256='')
+
+        done = set()
+        generated = skipped = failed = 0
+        for attachment in pending.iterator():
+            # Attachments sharing a file share the thumbnail
+            if attachment.sha256 in done:
+                continue
+            if not supports_thumbnail(attachment):
+                skipped += 1
+                continue
+            try:
+                generate_thumbnail(attachment)
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f'{attachment.filename} (#{attachment.id}): {e}')
+                continue
+            done.add(attachment.sha256)
+            generated += 1
+
+        self.stdout.write(f'Miniatury: wygenerowano {generated}, pominięto {skipped}, błędy: {failed}.')
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
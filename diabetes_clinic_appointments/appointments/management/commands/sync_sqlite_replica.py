@@ -0,0 +1,36 @@
+import sqlite3
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from utilities.replica import REPLICA_ALIAS, replica_configured
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary database into the SQLite replica (DATABASE_REPLICA_URL=sqlite:///...), '
+        'for trying out replica routing locally. Run it periodically to simulate replication lag.'
+    )
+
+    def handle(self, *args, **options):
+        if not replica_configured():
+            raise CommandError('DATABASE_REPLICA_URL is not set.')
+
+        primary = connections['default'].settings_dict
+        replica = connections[REPLICA_ALIAS].settings_dict
+        for settings_dict in (primary, replica):
+            if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+                raise CommandError('Both databases must be SQLite (use PostgreSQL replication otherwise).')
+
+        connections[REPLICA_ALIAS].close()
+        # The backup API copies a consistent snapshot even while the primary is in use
+        source = sqlite3.connect(str(primary['NAME']))
+        target = sqlite3.connect(str(replica['NAME']))
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
+
+        self.stdout.write(f'Skopiowano {primary["NAME"]} -> {replica["NAME"]}.')
+        self.stdout.write(self.style.SUCCESS('Gotowe.'))
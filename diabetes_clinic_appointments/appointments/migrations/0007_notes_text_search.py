@@ -0,0 +1,59 @@
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def populate_plain_text(apps, schema_editor):
+    """Compute the plain-text projection of existing notes and templates"""
+    from utilities.richtext import html_to_text
+
+    Appointment = apps.get_model('appointments', 'Appointment')
+    NoteTemplate = apps.get_model('appointments', 'NoteTemplate')
+
+    batch = []
+    for appointment in Appointment.objects.exclude(notes__isnull=True).exclude(notes='').only('id', 'notes').iterator(chunk_size=BATCH_SIZE):
+        appointment.notes_text = html_to_text(appointment.notes)
+        batch.append(appointment)
+        if len(batch) >= BATCH_SIZE:
+            Appointment.objects.bulk_update(batch, ['notes_text'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['notes_text'])
+
+    templates = list(NoteTemplate.objects.only('id', 'content'))
+    for template in templates:
+        template.content_text = html_to_text(template.content)
+    NoteTemplate.objects.bulk_update(templates, ['content_text'], batch_size=BATCH_SIZE)
+
+
+def install_notes_index(apps, schema_editor):
+    from utilities.search import install_search_index
+    install_search_index(schema_editor.connection, index='notes')
+
+
+def uninstall_notes_index(apps, schema_editor):
+    from utilities.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection, index='notes')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0006_diabetesprediction'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='notes_text',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Notatki bez znaczników HTML (do wyszukiwania)'),
+        ),
+        migrations.AddField(
+            model_name='notetemplate',
+            name='content_text',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Treść szablonu bez znaczników HTML (do wyszukiwania)', verbose_name='Treść (tekst)'),
+        ),
+        migrations.RunPython(populate_plain_text, migrations.RunPython.noop),
+        migrations.RunPython(install_notes_index, uninstall_notes_index),
+    ]
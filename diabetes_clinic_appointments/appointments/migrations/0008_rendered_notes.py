@@ -0,0 +1,78 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:18
+
+from django.db import migrations, models
+
+
+BATCH_SIZE = 500
+
+
+def populate_renderings(apps, schema_editor):
+    """Store the sanitized HTML, excerpt and hash of existing notes and templates"""
+    from utilities.richtext import render_rich_text
+
+    Appointment = apps.get_model('appointments', 'Appointment')
+    NoteTemplate = apps.get_model('appointments', 'NoteTemplate')
+
+    batch = []
+    for appointment in Appointment.objects.exclude(notes__isnull=True).exclude(notes='').only('id', 'notes').iterator(chunk_size=BATCH_SIZE):
+        rendered = render_rich_text(appointment.notes)
+        appointment.notes_html = rendered.html
+        appointment.notes_excerpt = rendered.excerpt
+        appointment.notes_hash = rendered.hash
+        batch.append(appointment)
+        if len(batch) >= BATCH_SIZE:
+            Appointment.objects.bulk_update(batch, ['notes_html', 'notes_excerpt', 'notes_hash'])
+            batch = []
+    if batch:
+        Appointment.objects.bulk_update(batch, ['notes_html', 'notes_excerpt', 'notes_hash'])
+
+    templates = list(NoteTemplate.objects.only('id', 'content'))
+    for template in templates:
+        rendered = render_rich_text(template.content)
+        template.content_html = rendered.html
+        template.content_excerpt = rendered.excerpt
+        template.content_hash = rendered.hash
+    NoteTemplate.objects.bulk_update(
+        templates, ['content_html', 'content_excerpt', 'content_hash'], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0007_notes_text_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointment',
+            name='notes_excerpt',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Początek notatek jako tekst (do list)', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='notes_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='SHA-256 notatek, z których wyliczono powyższe pola', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='appointment',
+            name='notes_html',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Oczyszczony HTML notatek (do wyświetlania)'),
+        ),
+        migrations.AddField(
+            model_name='notetemplate',
+            name='content_excerpt',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Początek treści szablonu jako tekst (do list)', max_length=255, verbose_name='Podgląd treści'),
+        ),
+        migrations.AddField(
+            model_name='notetemplate',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='SHA-256 treści, z której wyliczono powyższe pola', max_length=64, verbose_name='Skrót treści'),
+        ),
+        migrations.AddField(
+            model_name='notetemplate',
+            name='content_html',
+            field=models.TextField(blank=True, default='', editable=False, help_text='Oczyszczony HTML treści szablonu (do wstawiania do notatek)', verbose_name='Treść (HTML)'),
+        ),
+        migrations.RunPython(populate_renderings, migrations.RunPython.noop),
+    ]
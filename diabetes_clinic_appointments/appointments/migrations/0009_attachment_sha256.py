@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:25
+
+from django.db import migrations, models
+
+
+def hash_existing_files(apps, schema_editor):
+    """Compute content hashes of already uploaded attachments"""
+    import hashlib
+
+    AppointmentAttachment = apps.get_model('appointments', 'AppointmentAttachment')
+
+    batch = []
+    for attachment in AppointmentAttachment.objects.filter(sha256='').only('id', 'file').iterator(chunk_size=100):
+        digest = hashlib.sha256()
+        try:
+            with attachment.file.open('rb') as f:
+                for chunk in f.chunks():
+                    digest.update(chunk)
+        except (OSError, ValueError):
+            # Missing file - left empty, served with a weak ETag
+            continue
+        attachment.sha256 = digest.hexdigest()
+        batch.append(attachment)
+    AppointmentAttachment.objects.bulk_update(batch, ['sha256'], batch_size=100)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0008_rendered_notes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentattachment',
+            name='sha256',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Skrót zawartości pliku (ETag przy pobieraniu)', max_length=64, verbose_name='Skrót SHA-256'),
+        ),
+        migrations.RunPython(hash_existing_files, migrations.RunPython.noop),
+    ]
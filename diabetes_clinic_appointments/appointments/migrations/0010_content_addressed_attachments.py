@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:27
+
+import appointments.models
+import appointments.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0009_attachment_sha256'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentattachment',
+            name='original_name',
+            field=models.CharField(blank=True, default='', help_text='Nazwa pliku w momencie przesłania', max_length=255, verbose_name='Nazwa pliku'),
+        ),
+        migrations.AlterField(
+            model_name='appointmentattachment',
+            name='file',
+            field=models.FileField(max_length=255, storage=appointments.storage.get_attachment_storage, upload_to=appointments.models.appointment_attachment_path, verbose_name='Plik'),
+        ),
+        migrations.AlterField(
+            model_name='appointmentattachment',
+            name='sha256',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Skrót zawartości pliku (ETag przy pobieraniu)', max_length=64, verbose_name='Skrót SHA-256'),
+        ),
+    ]
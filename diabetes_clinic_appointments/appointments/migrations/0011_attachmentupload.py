@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:30
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0010_content_addressed_attachments'),
+        ('doctors', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttachmentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('original_name', models.CharField(max_length=255, verbose_name='Nazwa pliku')),
+                ('file_type', models.CharField(choices=[('image', 'Zdjęcie'), ('document', 'Dokument'), ('test_result', 'Wynik badania'), ('other', 'Inne')], default='other', max_length=20, verbose_name='Typ pliku')),
+                ('description', models.TextField(blank=True, verbose_name='Opis')),
+                ('size', models.BigIntegerField(help_text='Rozmiar zadeklarowany przy rozpoczęciu przesyłania', verbose_name='Rozmiar pliku (bajty)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Rozpoczęto')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Ostatnia część')),
+                ('appointment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pending_uploads', to='appointments.appointment', verbose_name='Wizyta')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='doctors.doctor', verbose_name='Przesyłane przez')),
+            ],
+            options={
+                'verbose_name': 'Przesyłany załącznik',
+                'verbose_name_plural': 'Przesyłane załączniki',
+                'ordering': ['-created_at'],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 04:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appointments', '0011_attachmentupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='appointmentattachment',
+            name='has_thumbnail',
+            field=models.BooleanField(default=False, editable=False, help_text='Czy wygenerowano miniaturę podglądu (zdjęcia, PDF)', verbose_name='Miniatura'),
+        ),
+    ]
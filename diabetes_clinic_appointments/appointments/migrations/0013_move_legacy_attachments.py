@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def move_legacy_files(apps, schema_editor):
+    """Move attachments uploaded before content-addressed storage into the blob layout"""
+    from appointments.storage import BLOB_PREFIX, move_to_blob
+
+    AppointmentAttachment = apps.get_model('appointments', 'AppointmentAttachment')
+
+    legacy = AppointmentAttachment.objects.exclude(file__startswith=f'{BLOB_PREFIX}/').exclude(sha256='')
+    for attachment_id, name, sha256 in legacy.values_list('id', 'file', 'sha256').iterator(chunk_size=100):
+        new_name = move_to_blob(name, sha256)
+        if new_name is not None:
+            AppointmentAttachment.objects.filter(id=attachment_id).update(file=new_name)
+
+
+class Migration(migrations.Migration):
+
+    # Each row is updated right after its file is moved, so an interrupted
+    # migration leaves no row pointing at a moved file
+    atomic = False
+
+    dependencies = [
+        ('appointments', '0012_attachment_thumbnail'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_legacy_files, migrations.RunPython.noop),
+    ]
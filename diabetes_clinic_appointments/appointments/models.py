@@ -3,13 +3,60 @@ from django.conf import settings
 from patients.models import Patient
 from doctors.models import Doctor
 from ckeditor.fields import RichTextField
+from utilities.richtext import content_hash as compute_content_hash, render_rich_text, sanitize_html
+from .storage import blob_name, get_attachment_storage
+import hashlib
 import os
+import uuid
 
 
 def appointment_attachment_path(instance, filename):
     """Generate upload path for appointment attachments"""
-    # Format: appointments/patient_ID/appointment_ID/filename
-    return f'appointments/patient_{instance.appointment.patient.id}/appointment_{instance.appointment.id}/{filename}'
+    # Content-addressed: attachments/sha256/ab/cd/<sha256> (see storage.py).
+    # Files uploaded before were stored as appointments/patient_ID/appointment_ID/filename
+    return blob_name(instance.sha256)
+
+
+def file_sha256(file):
+    """Return the SHA-256 hex digest of a Django File, read in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+class AppointmentQuerySet(models.QuerySet):
+    """
+    Named projections for appointment queries.
+
+    Lists never display the notes body, so they load only the excerpt/hash
+    renderings and skip the free-text columns of the joined patient and
+    doctor profiles.
+    """
+
+    NOTES_BODY_FIELDS = ('notes', 'notes_text', 'notes_html')
+
+    RELATED_DETAIL_ONLY_FIELDS = (
+        'patient__address', 'patient__current_medications', 'patient__allergies',
+        'doctor__office_address', 'doctor__education', 'doctor__certifications', 'doctor__bio',
+    )
+
+    CALENDAR_FIELDS = ('id', 'appointment_date', 'duration_minutes', 'status', 'doctor_id', 'patient_id')
+
+    def for_listing(self):
+        """Appointments for histories, upcoming lists and dashboards"""
+        return self.select_related('patient__user', 'doctor__user').defer(
+            *self.NOTES_BODY_FIELDS, *self.RELATED_DETAIL_ONLY_FIELDS
+        )
+
+    def for_calendar(self):
+        """Only the columns needed to lay appointments out in time (slots, conflicts)"""
+        return self.only(*self.CALENDAR_FIELDS)
+
+    def for_detail(self):
+        """Full appointment rows with patient and doctor profiles"""
+        return self.select_related('patient__user', 'doctor__user')
+
 
 class Appointment(models.Model):
     STATUS_CHOICES = [
@@ -32,6 +79,10 @@ class Appointment(models.Model):
     status = models.CharField(max_length=15, choices=STATUS_CHOICES, default='scheduled')
     reason = models.CharField(max_length=200, help_text="Powód wizyty")
     notes = RichTextField(blank=True, null=True, config_name='doctor_notes', help_text="Notatki z wizyty (dla lekarza)")
+    notes_text = models.TextField(blank=True, default='', editable=False, help_text="Notatki bez znaczników HTML (do wyszukiwania)")
+    notes_html = models.TextField(blank=True, default='', editable=False, help_text="Oczyszczony HTML notatek (do wyświetlania)")
+    notes_excerpt = models.CharField(max_length=255, blank=True, default='', editable=False, help_text="Początek notatek jako tekst (do list)")
+    notes_hash = models.CharField(max_length=64, blank=True, default='', editable=False, help_text="SHA-256 notatek, z których wyliczono powyższe pola")
     duration_minutes = models.PositiveIntegerField(default=30)
 
     # Recurring appointment fields
@@ -59,6 +110,8 @@ class Appointment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AppointmentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-appointment_date']
         verbose_name = "Wizyta"
@@ -67,6 +120,44 @@ class Appointment(models.Model):
     def __str__(self):
         return f"{self.patient.user.first_name} {self.patient.user.last_name} - {self.appointment_date.strftime('%Y-%m-%d %H:%M')} - Dr. {self.doctor.user.last_name}"
 
+    RENDERED_NOTES_FIELDS = ['notes_text', 'notes_html', 'notes_excerpt', 'notes_hash']
+
+    def save(self, *args, **kwargs):
+        """Override save to store the renderings of notes"""
+        # Rows loaded without notes (e.g. for_listing) cannot have changed them
+        if 'notes' not in self.get_deferred_fields():
+            self.refresh_rendered_notes()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'notes' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *self.RENDERED_NOTES_FIELDS}
+        super().save(*args, **kwargs)
+
+    def refresh_rendered_notes(self, force=False):
+        """Recompute the stored renderings if notes changed; returns True when they were updated"""
+        notes_hash = compute_content_hash(self.notes)
+        if notes_hash == self.notes_hash and not force:
+            return False
+
+        rendered = render_rich_text(self.notes)
+        self.notes_text = rendered.text
+        self.notes_html = rendered.html
+        self.notes_excerpt = rendered.excerpt
+        self.notes_hash = rendered.hash
+        return True
+
+    @property
+    def has_notes(self):
+        """Whether the appointment has notes (does not load the notes column)"""
+        return bool(self.notes_hash)
+
+    @property
+    def safe_notes(self):
+        """Sanitized notes HTML, safe to render with |safe"""
+        if self.notes_hash or not self.notes:
+            return self.notes_html
+        # Row saved before the renderings existed and not backfilled yet
+        return sanitize_html(self.notes)
+
     def get_series_appointments(self):
         """Zwraca wszystkie wizyty w serii (włączając tę wizytę)"""
         if self.parent_appointment:
@@ -104,8 +195,17 @@ class AppointmentAttachment(models.Model):
     )
     file = models.FileField(
         upload_to=appointment_attachment_path,
+        storage=get_attachment_storage,
+        max_length=255,
         verbose_name='Plik'
     )
+    original_name = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        verbose_name='Nazwa pliku',
+        help_text='Nazwa pliku w momencie przesłania'
+    )
     file_type = models.CharField(
         max_length=20,
         choices=FILE_TYPE_CHOICES,
@@ -131,6 +231,21 @@ class AppointmentAttachment(models.Model):
         default=0,
         verbose_name='Rozmiar pliku (bajty)'
     )
+    sha256 = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        db_index=True,
+        verbose_name='Skrót SHA-256',
+        help_text='Skrót zawartości pliku (ETag przy pobieraniu)'
+    )
+    has_thumbnail = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Miniatura',
+        help_text='Czy wygenerowano miniaturę podglądu (zdjęcia, PDF)'
+    )
 
     class Meta:
         ordering = ['-uploaded_at']
@@ -141,20 +256,39 @@ class AppointmentAttachment(models.Model):
         return f"{self.get_file_type_display()} - {self.file.name}"
 
     def save(self, *args, **kwargs):
-        """Override save to store file size"""
+        """Override save to store file size, original name and content hash"""
         if self.file:
             self.file_size = self.file.size
+            if not self.file._committed:
+                # New upload: the storage name is derived from the hash, which
+                # the upload handlers (uploads.py) computed while receiving it
+                self.original_name = os.path.basename(self.file.name)[:255]
+                self.sha256 = getattr(self.file.file, 'sha256', None) or file_sha256(self.file)
+            elif not self.sha256:
+                self.sha256 = file_sha256(self.file)
         super().save(*args, **kwargs)
 
+    @property
+    def reference_count(self):
+        """Number of attachments sharing this attachment's stored file"""
+        return AppointmentAttachment.objects.filter(file=self.file.name).count()
+
+    @property
+    def etag(self):
+        """HTTP entity tag: strong from the content hash, weak fallback otherwise"""
+        if self.sha256:
+            return f'"{self.sha256}"'
+        return f'W/"{self.file_size}-{int(self.uploaded_at.timestamp())}"'
+
     @property
     def filename(self):
-        """Return just the filename without path"""
-        return os.path.basename(self.file.name)
+        """Return the original filename (stored files are named by content hash)"""
+        return self.original_name or os.path.basename(self.file.name)
 
     @property
     def file_extension(self):
         """Return file extension"""
-        return os.path.splitext(self.file.name)[1].lower()
+        return os.path.splitext(self.filename)[1].lower()
 
     @property
     def is_image(self):
@@ -173,6 +307,51 @@ class AppointmentAttachment(models.Model):
         return round(self.file_size / (1024 * 1024), 2)
 
 
+class AttachmentUpload(models.Model):
+    """Chunked attachment upload in progress (see chunked.py)"""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    appointment = models.ForeignKey(
+        Appointment,
+        on_delete=models.CASCADE,
+        related_name='pending_uploads',
+        verbose_name='Wizyta'
+    )
+    uploaded_by = models.ForeignKey(
+        Doctor,
+        on_delete=models.CASCADE,
+        verbose_name='Przesyłane przez'
+    )
+    original_name = models.CharField(
+        max_length=255,
+        verbose_name='Nazwa pliku'
+    )
+    file_type = models.CharField(
+        max_length=20,
+        choices=AppointmentAttachment.FILE_TYPE_CHOICES,
+        default='other',
+        verbose_name='Typ pliku'
+    )
+    description = models.TextField(
+        blank=True,
+        verbose_name='Opis'
+    )
+    size = models.BigIntegerField(
+        verbose_name='Rozmiar pliku (bajty)',
+        help_text='Rozmiar zadeklarowany przy rozpoczęciu przesyłania'
+    )
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Rozpoczęto')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Ostatnia część')
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name = "Przesyłany załącznik"
+        verbose_name_plural = "Przesyłane załączniki"
+
+    def __str__(self):
+        return f"{self.original_name} ({self.size} B)"
+
+
 class NoteTemplate(models.Model):
     """Model for storing reusable note templates for common cases"""
 
@@ -202,6 +381,36 @@ class NoteTemplate(models.Model):
         verbose_name='Treść szablonu',
         help_text='Treść szablonu notatki (HTML)'
     )
+    content_text = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Treść (tekst)',
+        help_text='Treść szablonu bez znaczników HTML (do wyszukiwania)'
+    )
+    content_html = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Treść (HTML)',
+        help_text='Oczyszczony HTML treści szablonu (do wstawiania do notatek)'
+    )
+    content_excerpt = models.CharField(
+        max_length=255,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Podgląd treści',
+        help_text='Początek treści szablonu jako tekst (do list)'
+    )
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Skrót treści',
+        help_text='SHA-256 treści, z której wyliczono powyższe pola'
+    )
     category = models.CharField(
         max_length=20,
         choices=CATEGORY_CHOICES,
@@ -238,6 +447,37 @@ class NoteTemplate(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_category_display()})"
 
+    RENDERED_CONTENT_FIELDS = ['content_text', 'content_html', 'content_excerpt', 'content_hash']
+
+    def save(self, *args, **kwargs):
+        """Override save to store the renderings of content"""
+        if 'content' not in self.get_deferred_fields():
+            self.refresh_rendered_content()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'content' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *self.RENDERED_CONTENT_FIELDS}
+        super().save(*args, **kwargs)
+
+    def refresh_rendered_content(self, force=False):
+        """Recompute the stored renderings if content changed; returns True when they were updated"""
+        new_hash = compute_content_hash(self.content)
+        if new_hash == self.content_hash and not force:
+            return False
+
+        rendered = render_rich_text(self.content)
+        self.content_text = rendered.text
+        self.content_html = rendered.html
+        self.content_excerpt = rendered.excerpt
+        self.content_hash = rendered.hash
+        return True
+
+    @property
+    def safe_content(self):
+        """Sanitized content HTML, safe to insert into notes"""
+        if self.content_hash or not self.content:
+            return self.content_html
+        return sanitize_html(self.content)
+
 
 class DiabetesPrediction(models.Model):
     """Model do przechowywania wyników predykcji ryzyka cukrzycy"""
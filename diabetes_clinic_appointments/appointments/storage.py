@@ -0,0 +1,117 @@
+"""
+Content-addressed storage for appointment attachments.
+
+Files are stored under their SHA-256:
+
+    attachments/sha256/ab/cd/abcdef0123...
+
+so an identical file (e.g. the same lab PDF attached to several visits) is
+kept on disk only once. ``AppointmentAttachment`` rows reference blobs by
+name; the number of rows pointing at a blob is its reference count.
+Deleting an attachment only removes the row - blobs nobody references any
+more are removed by ``manage.py gc_attachments``.
+
+Files uploaded before were stored as ``appointments/patient_X/...``;
+migration 0013 moves them into the blob layout (``move_to_blob``). A legacy
+file that could not be moved (no content hash) is deleted together with its
+last attachment row, since ``gc_attachments`` only walks the blobs.
+"""
+
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+BLOB_PREFIX = 'attachments/sha256'
+
+
+def blob_name(sha256):
+    """Return the storage name of the blob with the given SHA-256 hex digest"""
+    return f'{BLOB_PREFIX}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    File system storage where a name always identifies the same content.
+
+    Saving a name that already exists is a no-op (deduplication) that only
+    refreshes the blob's modification time, which ``gc_attachments`` uses
+    as a grace period for blobs whose referencing row is not committed yet.
+    New blobs are written to a temporary file (or an upload's temporary
+    file is used directly) and renamed into place, so concurrent uploads of
+    the same content are safe.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Same name means same content - never rename
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        if os.path.exists(full_path):
+            os.utime(full_path)
+            return name
+
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+
+        # Completed temporary files (large uploads) are renamed, not copied,
+        # when they are on the same file system
+        if hasattr(content, 'temporary_file_path'):
+            try:
+                os.chmod(content.temporary_file_path(), self.file_permissions_mode or 0o644)
+                os.replace(content.temporary_file_path(), full_path)
+                return name
+            except OSError:
+                pass
+
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in content.chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, self.file_permissions_mode or 0o644)
+            os.replace(tmp_path, full_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+
+attachment_storage = ContentAddressedStorage()
+
+
+def is_blob(name):
+    """Whether a storage name is in the content-addressed layout"""
+    return name.startswith(f'{BLOB_PREFIX}/')
+
+
+def move_to_blob(name, sha256):
+    """
+    Move a file stored under a legacy name to the blob of its content hash.
+
+    If the blob already exists (same content uploaded again), the legacy
+    copy is removed.
+
+    Returns:
+        str: The blob name, or None if neither file exists
+    """
+    new_name = blob_name(sha256)
+    old_path = attachment_storage.path(name)
+    new_path = attachment_storage.path(new_name)
+    if os.path.exists(new_path):
+        if os.path.exists(old_path):
+            os.remove(old_path)
+        return new_name
+    if not os.path.exists(old_path):
+        return None
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    os.replace(old_path, new_path)
+    return new_name
+
+
+def get_attachment_storage():
+    """Storage callable for ``AppointmentAttachment.file``"""
+    return attachment_storage
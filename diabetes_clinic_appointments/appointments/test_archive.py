@@ -0,0 +1,171 @@
+"""
+Tests for the streaming ZIP export of attachments.
+"""
+
+import os
+import shutil
+import tempfile
+import tracemalloc
+import zipfile
+from datetime import date, time as dtime, timedelta
+from io import BytesIO
+from unittest.mock import patch
+from urllib.parse import quote
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.archive import appointment_entries, iter_zip
+from appointments.models import Appointment, AppointmentAttachment
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AttachmentArchiveTest(TestCase):
+    """Test ZIP export of an appointment's and a patient's attachments"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'attachments'), ignore_errors=True)
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient',
+            last_name='Łukasiewicz'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+        self.first, self.second = [
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                appointment_date=timezone.make_aware(timezone.datetime(2025, 3, day, 10, 30)),
+                reason='Kontrola',
+                status='completed'
+            )
+            for day in (3, 17)
+        ]
+        self.attach(self.first, 'wyniki.pdf', b'%PDF-1.4 ' + b'HbA1c 6.8% ' * 200)
+        self.attach(self.first, 'zalecenia.txt', b'Dieta, ruch. ' * 200)
+        self.attach(self.first, 'wyniki.pdf', b'%PDF-1.4 kontrolne')
+        self.attach(self.second, 'wyniki.pdf', b'%PDF-1.4 drugie')
+        self.client.login(username='doctor_test', password='testpass123')
+
+    def attach(self, appointment, name, content):
+        return AppointmentAttachment.objects.create(
+            appointment=appointment,
+            file=SimpleUploadedFile(name, content),
+            uploaded_by=self.doctor
+        )
+
+    def get_zip(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        return response, zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+
+    def test_appointment_archive(self):
+        response, archive = self.get_zip(reverse('doctors:download_appointment_attachments', args=[self.first.id]))
+
+        self.assertIn(quote('zalaczniki_łukasiewicz_2025-03-03.zip'), response['Content-Disposition'])
+        self.assertEqual(sorted(archive.namelist()), ['wyniki (2).pdf', 'wyniki.pdf', 'zalecenia.txt'])
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('zalecenia.txt'), b'Dieta, ruch. ' * 200)
+        # Already compressed formats are stored, text is deflated
+        self.assertEqual(archive.getinfo('wyniki.pdf').compress_type, zipfile.ZIP_STORED)
+        self.assertEqual(archive.getinfo('zalecenia.txt').compress_type, zipfile.ZIP_DEFLATED)
+
+    def test_patient_archive_has_folder_per_appointment(self):
+        _, archive = self.get_zip(reverse('doctors:download_patient_attachments', args=[self.patient.id]))
+
+        self.assertEqual(sorted(archive.namelist()), [
+            '2025-03-03_1030/wyniki (2).pdf',
+            '2025-03-03_1030/wyniki.pdf',
+            '2025-03-03_1030/zalecenia.txt',
+            '2025-03-17_1030/wyniki.pdf',
+        ])
+        self.assertEqual(archive.read('2025-03-17_1030/wyniki.pdf'), b'%PDF-1.4 drugie')
+
+    def test_stale_file_size_does_not_break_archive(self):
+        """Test the entry size comes from the file, not from the database row"""
+        AppointmentAttachment.objects.filter(appointment=self.first).update(file_size=1)
+
+        # A small limit stands in for a stale size of a file over 4 GB
+        with patch('zipfile.ZIP64_LIMIT', 1024):
+            _, archive = self.get_zip(reverse('doctors:download_appointment_attachments', args=[self.first.id]))
+
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(archive.read('zalecenia.txt'), b'Dieta, ruch. ' * 200)
+
+    def test_other_doctor_forbidden(self):
+        other_user = User.objects.create_user(username='other', password='testpass123', user_type='doctor')
+        Doctor.objects.create(
+            user=other_user,
+            license_number='DOC999',
+            specialization='diabetologist',
+            years_of_experience=5,
+            office_address='ul. Inna 2',
+            consultation_fee=150.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        self.client.login(username='other', password='testpass123')
+
+        response = self.client.get(reverse('doctors:download_appointment_attachments', args=[self.first.id]))
+        self.assertEqual(response.status_code, 403)
+
+        # No appointments with the patient - nothing to export
+        response = self.client.get(reverse('doctors:download_patient_attachments', args=[self.patient.id]))
+        self.assertEqual(response.status_code, 302)
+
+    def test_memory_does_not_grow_with_file_size(self):
+        """An 8 MB file is streamed with a small, bounded buffer"""
+        big = self.attach(self.second, 'tomografia.bmp', os.urandom(8 * 1024 * 1024))
+
+        tracemalloc.start()
+        try:
+            total = 0
+            for part in iter_zip(appointment_entries([big])):
+                total += len(part)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertGreater(total, 8 * 1024 * 1024)
+        self.assertLess(peak, 1024 * 1024)
@@ -0,0 +1,154 @@
+"""
+Tests for the async views served through the ASGI handler.
+"""
+
+import json
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.handlers.asgi import ASGIHandler
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment, AppointmentAttachment
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def next_weekday():
+    day = timezone.localdate() + timedelta(days=7)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncViewsTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test', password='testpass123', user_type='doctor',
+            first_name='Jan', last_name='Lekarz',
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University',
+        )
+        other_user = User.objects.create_user(username='other_doctor', password='testpass123', user_type='doctor')
+        Doctor.objects.create(
+            user=other_user,
+            license_number='DOC456',
+            specialization='diabetologist',
+            years_of_experience=5,
+            office_address='ul. Lekarska 2',
+            consultation_fee=150.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University',
+        )
+        patient_user = User.objects.create_user(username='patient_test', password='testpass123', user_type='patient')
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1',
+        )
+        self.day = next_weekday()
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.make_aware(datetime.combine(self.day, time(10, 0))),
+            reason='Kontrola',
+            status='scheduled',
+        )
+
+    async def test_available_slots(self):
+        await self.async_client.alogin(username='patient_test', password='testpass123')
+        response = await self.async_client.get(
+            reverse('appointments:available_time_slots'),
+            {'doctor_id': self.doctor.id, 'date': self.day.isoformat()},
+        )
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertNotIn('10:00', data['available_slots'])
+        self.assertIn('10:00', data['occupied_slots'])
+        self.assertIn('08:00', data['available_slots'])
+        self.assertEqual(data['doctor_name'], 'Dr. Jan Lekarz')
+
+    async def test_update_status(self):
+        await self.async_client.alogin(username='doctor_test', password='testpass123')
+        response = await self.async_client.post(
+            reverse('doctors:update_appointment_status', args=[self.appointment.id]),
+            json.dumps({'status': 'completed'}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        appointment = await Appointment.objects.aget(pk=self.appointment.pk)
+        self.assertEqual(appointment.status, 'completed')
+
+    async def test_update_status_of_other_doctors_appointment(self):
+        await self.async_client.alogin(username='other_doctor', password='testpass123')
+        response = await self.async_client.post(
+            reverse('doctors:update_appointment_status', args=[self.appointment.id]),
+            json.dumps({'status': 'completed'}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 403)
+        appointment = await Appointment.objects.aget(pk=self.appointment.pk)
+        self.assertEqual(appointment.status, 'scheduled')
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    async def test_download_streams_asynchronously(self):
+        attachment = await sync_to_async(AppointmentAttachment.objects.create)(
+            appointment=self.appointment,
+            file=SimpleUploadedFile('wyniki.txt', b'x' * 200_000),
+            file_type='test_result',
+            uploaded_by=self.doctor,
+        )
+        await self.async_client.alogin(username='doctor_test', password='testpass123')
+        response = await self.async_client.get(reverse('doctors:download_attachment', args=[attachment.id]))
+
+        self.assertEqual(response.status_code, 200)
+        # Under ASGI the file is read chunk by chunk, not into a list
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(content, b'x' * 200_000)
+
+
+class AsgiMiddlewareChainTest(SimpleTestCase):
+    """The middleware chain stays async, so async views do not run in a thread"""
+
+    # Django logs adaptations only with DEBUG
+    @override_settings(DEBUG=True)
+    def test_no_middleware_is_adapted(self):
+        with self.assertNoLogs('django.request', 'DEBUG'):
+            handler = ASGIHandler()
+
+        self.assertTrue(iscoroutinefunction(handler._middleware_chain))
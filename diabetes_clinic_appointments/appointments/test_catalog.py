@@ -0,0 +1,107 @@
+"""
+Tests for the cached note template catalog.
+"""
+
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+from appointments import catalog
+from appointments.models import NoteTemplate
+
+
+class NoteTemplateCatalogTest(TestCase):
+    """Test get_templates() / get_template() caching and invalidation"""
+
+    def setUp(self):
+        cache.clear()
+        NoteTemplate.objects.all().delete()
+        self.template = NoteTemplate.objects.create(
+            name='Kontrola',
+            description='Wizyta kontrolna',
+            content='<p>Glikemia <script>x</script>w normie</p>',
+            category='checkup'
+        )
+
+    def test_list_has_no_content(self):
+        """Test list entries carry metadata and excerpt but no HTML"""
+        templates = catalog.get_templates()
+
+        self.assertEqual(len(templates), 1)
+        self.assertEqual(templates[0]['name'], 'Kontrola')
+        self.assertEqual(templates[0]['category_display'], 'Kontrola')
+        self.assertEqual(templates[0]['content_excerpt'], 'Glikemia w normie')
+        self.assertNotIn('content', templates[0])
+
+    def test_list_served_from_cache(self):
+        """Test repeated calls do not query the database"""
+        catalog.get_templates()
+
+        with self.assertNumQueries(0):
+            catalog.get_templates()
+
+    def test_shared_cache_used_after_process_snapshot_lost(self):
+        """Test another process (empty local snapshot) reuses the shared cache"""
+        catalog.get_templates()
+        catalog._local = (None, None, {})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(len(catalog.get_templates()), 1)
+
+    def test_list_built_for_old_version_not_kept_after_change(self):
+        """Test a list built while another thread moved to a new version is not served for it"""
+        load_templates = catalog._load_templates
+
+        def load_then_change():
+            templates = load_templates()
+            # Meanwhile the template changes and another thread takes the new version
+            self.template.name = 'Kontrola okresowa'
+            self.template.save()
+            catalog._local_snapshot()
+            return templates
+
+        with patch.object(catalog, '_load_templates', side_effect=load_then_change):
+            catalog.get_templates()
+
+        self.assertEqual(catalog.get_templates()[0]['name'], 'Kontrola okresowa')
+
+    def test_save_and_delete_invalidate(self):
+        """Test saving or deleting a template bumps the catalog version"""
+        catalog.get_templates()
+
+        self.template.name = 'Kontrola okresowa'
+        self.template.save()
+        self.assertEqual(catalog.get_templates()[0]['name'], 'Kontrola okresowa')
+
+        NoteTemplate.objects.create(name='Dieta', content='<p>Dieta</p>', category='diet', is_active=False)
+        self.assertEqual(len(catalog.get_templates()), 1)
+
+        self.template.delete()
+        self.assertEqual(catalog.get_templates(), [])
+
+    def test_get_template_returns_sanitized_content(self):
+        """Test content is served sanitized, with an ETag that follows changes"""
+        entry = catalog.get_template(self.template.id)
+        self.assertEqual(entry['content'], '<p>Glikemia w normie</p>')
+
+        with self.assertNumQueries(0):
+            self.assertEqual(catalog.get_template(self.template.id), entry)
+
+        self.template.content = '<p>Glikemia podwyższona</p>'
+        self.template.save()
+        self.assertNotEqual(catalog.get_template(self.template.id)['etag'], entry['etag'])
+
+    def test_get_template_unknown_or_inactive(self):
+        """Test unknown and inactive templates are not served"""
+        self.assertIsNone(catalog.get_template(999999))
+
+        self.template.is_active = False
+        self.template.save()
+        self.assertIsNone(catalog.get_template(self.template.id))
+
+    def test_version_reinitialized_after_eviction(self):
+        """Test a lost version counter starts a fresh version"""
+        version = catalog.get_version()
+        cache.delete(catalog.VERSION_KEY)
+
+        self.assertNotEqual(catalog.get_version(), version)
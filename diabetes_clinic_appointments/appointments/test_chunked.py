@@ -0,0 +1,237 @@
+"""
+Tests for chunked, resumable attachment uploads.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from datetime import date, time as dtime, timedelta
+from io import StringIO
+from unittest.mock import patch
+
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.chunked import upload_path
+from appointments.models import Appointment, AppointmentAttachment, AttachmentUpload
+from appointments.storage import blob_name
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+SCAN = b'%PDF-1.7 ' + bytes(range(256)) * 40
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    ATTACHMENT_MAX_SIZE=4096,
+    ATTACHMENT_IMAGING_MAX_SIZE=16384,
+    ATTACHMENT_CHUNK_SIZE=4096,
+)
+class ChunkedUploadTest(TestCase):
+    """Test init / PUT chunk / finish and the limits checked on the way"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'attachments'), ignore_errors=True)
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() - timedelta(days=1),
+            reason='Kontrola',
+            status='completed'
+        )
+        self.client.login(username='doctor_test', password='testpass123')
+
+    def start(self, filename='tomografia.pdf', size=len(SCAN), **extra):
+        return self.client.post(
+            reverse('doctors:start_attachment_upload', args=[self.appointment.id]),
+            data=json.dumps({'filename': filename, 'size': size, **extra}),
+            content_type='application/json',
+        )
+
+    def put(self, upload_id, offset, data):
+        return self.client.put(
+            reverse('doctors:attachment_upload', args=[upload_id]),
+            data=data,
+            content_type='application/octet-stream',
+            HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def test_upload_in_chunks_creates_attachment(self):
+        """Imaging files may exceed ATTACHMENT_MAX_SIZE when sent in chunks"""
+        response = self.start(file_type='test_result', description='TK jamy brzusznej')
+        self.assertEqual(response.status_code, 201)
+        upload_id = response.json()['upload_id']
+
+        for offset in range(0, len(SCAN), 4096):
+            response = self.put(upload_id, offset, SCAN[offset:offset + 4096])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()['offset'], min(offset + 4096, len(SCAN)))
+
+        response = self.client.post(reverse('doctors:finish_attachment_upload', args=[upload_id]))
+
+        self.assertEqual(response.status_code, 200)
+        attachment = AppointmentAttachment.objects.get(id=response.json()['attachment']['id'])
+        self.assertEqual(attachment.filename, 'tomografia.pdf')
+        self.assertEqual(attachment.file_type, 'test_result')
+        self.assertEqual(attachment.description, 'TK jamy brzusznej')
+        self.assertEqual(attachment.file_size, len(SCAN))
+        self.assertEqual(attachment.sha256, hashlib.sha256(SCAN).hexdigest())
+        self.assertEqual(attachment.file.name, blob_name(attachment.sha256))
+        with attachment.file.open('rb') as f:
+            self.assertEqual(f.read(), SCAN)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(MEDIA_ROOT, 'attachments', 'incomplete')), [])
+
+    def test_resume_after_offset_mismatch(self):
+        """A wrong offset is answered with the number of bytes received"""
+        upload_id = self.start().json()['upload_id']
+        self.put(upload_id, 0, SCAN[:4096])
+
+        response = self.put(upload_id, 0, SCAN[:4096])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        self.assertEqual(response['Upload-Offset'], '4096')
+
+        response = self.client.get(reverse('doctors:attachment_upload', args=[upload_id]))
+        self.assertEqual(response.json()['offset'], 4096)
+
+    def test_rejects_disallowed_extension_and_size_before_data(self):
+        self.assertEqual(self.start(filename='skrypt.exe').status_code, 415)
+        # Non-imaging files keep the regular limit
+        self.assertEqual(self.start(filename='wyniki.xlsx', size=8192).status_code, 413)
+        self.assertEqual(self.start(size=16385).status_code, 413)
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_chunk_beyond_declared_size_aborts_upload(self):
+        upload_id = self.start(size=100).json()['upload_id']
+
+        response = self.put(upload_id, 0, SCAN[:200])
+
+        self.assertEqual(response.status_code, 413)
+        self.assertTrue(response.json()['aborted'])
+        self.assertFalse(AttachmentUpload.objects.exists())
+
+    def test_content_not_matching_extension_aborts_upload(self):
+        upload_id = self.start().json()['upload_id']
+
+        response = self.put(upload_id, 0, b'MZ\x90\x00' + SCAN[4:4096])
+
+        self.assertEqual(response.status_code, 415)
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertFalse(os.path.exists(os.path.join(MEDIA_ROOT, 'attachments', 'incomplete', upload_id)))
+
+    def test_finish_incomplete_upload_fails(self):
+        upload_id = self.start().json()['upload_id']
+        self.put(upload_id, 0, SCAN[:4096])
+
+        response = self.client.post(reverse('doctors:finish_attachment_upload', args=[upload_id]))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        self.assertFalse(AppointmentAttachment.objects.exists())
+
+    def test_concurrent_chunk_is_rejected(self):
+        """A chunk arriving while another one is written is answered with the offset"""
+        upload_id = self.start().json()['upload_id']
+        self.put(upload_id, 0, SCAN[:4096])
+
+        with open(upload_path(AttachmentUpload.objects.get()), 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            response = self.put(upload_id, 4096, SCAN[4096:8192])
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        self.assertEqual(self.put(upload_id, 4096, SCAN[4096:8192]).status_code, 200)
+
+    def test_finished_file_hashed_outside_transaction(self):
+        """Hashing a large file must not hold a database transaction"""
+        upload_id = self.start().json()['upload_id']
+        for offset in range(0, len(SCAN), 4096):
+            self.put(upload_id, offset, SCAN[offset:offset + 4096])
+        depth = len(connection.savepoint_ids)
+        depths = []
+
+        def hash_file(file):
+            depths.append(len(connection.savepoint_ids))
+            return hashlib.sha256(SCAN).hexdigest()
+
+        with patch('appointments.chunked.file_sha256', side_effect=hash_file):
+            response = self.client.post(reverse('doctors:finish_attachment_upload', args=[upload_id]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(depths, [depth])
+        self.assertEqual(self.put(upload_id, len(SCAN), b'x').status_code, 404)
+
+    def test_other_doctor_cannot_access_upload(self):
+        upload_id = self.start().json()['upload_id']
+        other_user = User.objects.create_user(username='other', password='testpass123', user_type='doctor')
+        Doctor.objects.create(
+            user=other_user,
+            license_number='DOC999',
+            specialization='diabetologist',
+            years_of_experience=5,
+            office_address='ul. Inna 2',
+            consultation_fee=150.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        self.client.login(username='other', password='testpass123')
+
+        self.assertEqual(self.put(upload_id, 0, SCAN[:4096]).status_code, 404)
+        self.assertEqual(self.start().status_code, 403)
+
+    def test_gc_removes_abandoned_uploads(self):
+        upload_id = self.start().json()['upload_id']
+        upload = AttachmentUpload.objects.get(id=upload_id)
+        AttachmentUpload.objects.filter(id=upload_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+        call_command('gc_attachments', stdout=StringIO())
+
+        self.assertFalse(AttachmentUpload.objects.exists())
+        self.assertFalse(os.path.exists(upload_path(upload)))
@@ -0,0 +1,268 @@
+"""
+Tests for protected attachment delivery.
+"""
+
+import shutil
+import tempfile
+from urllib.parse import quote
+from datetime import date, time, timedelta
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment, AppointmentAttachment
+from appointments.delivery import parse_range_header
+from utilities import metrics
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AttachmentDeliveryTest(TestCase):
+    """Test download_attachment in each ATTACHMENT_DELIVERY mode"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University'
+        )
+        self.other_doctor_user = User.objects.create_user(
+            username='other_doctor',
+            password='testpass123',
+            user_type='doctor'
+        )
+        Doctor.objects.create(
+            user=self.other_doctor_user,
+            license_number='DOC456',
+            specialization='diabetologist',
+            years_of_experience=5,
+            office_address='ul. Lekarska 2',
+            consultation_fee=150.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University'
+        )
+        patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient'
+        )
+        patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+        appointment = Appointment.objects.create(
+            patient=patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() - timedelta(days=1),
+            reason='Kontrola',
+            status='completed'
+        )
+        self.attachment = AppointmentAttachment.objects.create(
+            appointment=appointment,
+            file=SimpleUploadedFile('wyniki badań.pdf', b'%PDF-1.4 test'),
+            file_type='test_result',
+            uploaded_by=self.doctor
+        )
+        self.url = reverse('doctors:download_attachment', kwargs={'attachment_id': self.attachment.id})
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_django_mode_streams_file(self):
+        """Test development mode streams the file from Django"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 test')
+        self.assertIn('attachment;', response['Content-Disposition'])
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    @override_settings(ATTACHMENT_DELIVERY='nginx', METRICS_DIR=tempfile.mkdtemp())
+    def test_served_bytes_are_counted(self):
+        """Test full downloads and ranges add to clinic_attachment_bytes_served_total"""
+        metrics._values.clear()
+        self.client.login(username='doctor_test', password='testpass123')
+        self.client.get(self.url)
+        self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+
+        # nginx serves the range itself
+        self.assertIn('clinic_attachment_bytes_served_total{delivery="nginx"} 17', metrics.render())
+        with override_settings(ATTACHMENT_DELIVERY='django'):
+            self.client.get(self.url, HTTP_RANGE='bytes=0-3')
+        self.assertIn('clinic_attachment_bytes_served_total{delivery="django"} 4', metrics.render())
+        metrics._values.clear()
+
+    @override_settings(ATTACHMENT_DELIVERY='nginx', ATTACHMENT_ACCEL_REDIRECT_PREFIX='/protected-media/')
+    def test_nginx_mode_returns_accel_redirect(self):
+        """Test nginx mode returns an empty response with X-Accel-Redirect"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(
+            response['X-Accel-Redirect'],
+            '/protected-media/' + quote(self.attachment.file.name)
+        )
+        self.assertIn("filename*=utf-8''" + quote(self.attachment.filename), response['Content-Disposition'])
+
+    @override_settings(ATTACHMENT_DELIVERY='apache')
+    def test_apache_mode_returns_sendfile(self):
+        """Test Apache mode returns X-Sendfile with the absolute path"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-Sendfile'], quote(self.attachment.file.path))
+        self.assertEqual(response.content, b'')
+
+    @override_settings(ATTACHMENT_DELIVERY='nginx')
+    def test_permission_checked_before_redirect(self):
+        """Test other doctors get 403 and no redirect header"""
+        self.client.login(username='other_doctor', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 403)
+        self.assertNotIn('X-Accel-Redirect', response)
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_content_hash_etag_and_last_modified(self):
+        """Test a strong ETag from the stored hash and Last-Modified from upload time"""
+        import hashlib
+
+        self.assertEqual(self.attachment.sha256, hashlib.sha256(b'%PDF-1.4 test').hexdigest())
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['ETag'], f'"{self.attachment.sha256}"')
+        self.assertIn('Last-Modified', response)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_conditional_get_returns_304(self):
+        """Test If-None-Match and If-Modified-Since are answered with 304"""
+        self.client.login(username='doctor_test', password='testpass123')
+        first = self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_single_range(self):
+        """Test a single range returns 206 with Content-Range"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1-3')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 1-3/13')
+        self.assertEqual(response['Content-Length'], '3')
+        self.assertEqual(b''.join(response.streaming_content), b'PDF')
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_multiple_ranges(self):
+        """Test several ranges return a multipart/byteranges body"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=0-0,-4')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response['Content-Type'].startswith('multipart/byteranges; boundary='))
+        body = b''.join(response.streaming_content)
+        self.assertEqual(len(body), int(response['Content-Length']))
+        self.assertIn(b'Content-Range: bytes 0-0/13\r\n\r\n%', body)
+        self.assertIn(b'Content-Range: bytes 9-12/13\r\n\r\ntest', body)
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_unsatisfiable_range(self):
+        """Test a range past the end returns 416"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100-200')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */13')
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_if_range_mismatch_returns_full_file(self):
+        """Test a stale If-Range validator makes the Range header ignored"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=1-3', HTTP_IF_RANGE='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'%PDF-1.4 test')
+
+    @override_settings(ATTACHMENT_DELIVERY='django')
+    def test_inline_pdf(self):
+        """Test ?inline=1 opens PDFs in the browser with their real type"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url + '?inline=1')
+
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(response['Content-Disposition'].startswith('inline'))
+
+    @override_settings(ATTACHMENT_DELIVERY='lighttpd')
+    def test_unknown_mode_rejected(self):
+        """Test an invalid mode is reported as misconfiguration"""
+        from appointments.delivery import serve_attachment
+
+        with self.assertRaises(ImproperlyConfigured):
+            serve_attachment(None, self.attachment)
+
+
+class ParseRangeHeaderTest(SimpleTestCase):
+    """Test parse_range_header()"""
+
+    def test_single_ranges(self):
+        """Test explicit, open-ended and suffix ranges"""
+        self.assertEqual(parse_range_header('bytes=0-99', 1000), [(0, 99)])
+        self.assertEqual(parse_range_header('bytes=900-', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=-100', 1000), [(900, 999)])
+        self.assertEqual(parse_range_header('bytes=990-2000', 1000), [(990, 999)])
+
+    def test_multiple_ranges_coalesced(self):
+        """Test ranges are sorted and overlapping/adjacent ones merged"""
+        self.assertEqual(
+            parse_range_header('bytes=500-599, 0-99,100-199, 550-650', 1000),
+            [(0, 199), (500, 650)]
+        )
+
+    def test_unsatisfiable(self):
+        """Test ranges past the end give an empty list"""
+        self.assertEqual(parse_range_header('bytes=1000-1100', 1000), [])
+        self.assertEqual(parse_range_header('bytes=-0', 1000), [])
+
+    def test_invalid_or_ignored(self):
+        """Test malformed headers and too many ranges are ignored"""
+        self.assertIsNone(parse_range_header('items=0-1', 1000))
+        self.assertIsNone(parse_range_header('bytes=abc', 1000))
+        self.assertIsNone(parse_range_header('bytes=50-10', 1000))
+        self.assertIsNone(parse_range_header('bytes=' + ','.join(f'{i * 10}-{i * 10 + 1}' for i in range(20)), 1000))
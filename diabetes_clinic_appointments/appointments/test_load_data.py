@@ -0,0 +1,98 @@
+"""
+Tests for the generate_load_data management command.
+"""
+
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db.models import F
+from django.test import TestCase, override_settings
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment, AppointmentAttachment, DiabetesPrediction
+from utilities.search import search_notes
+from utilities.validators import extract_birth_date_from_pesel, is_valid_pesel
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class GenerateLoadDataTest(TestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, *args):
+        out = StringIO()
+        call_command(
+            'generate_load_data', '--doctors', '3', '--patients', '40', '--appointments', '600',
+            '--batch-size', '100', *args, stdout=out,
+        )
+        return out.getvalue()
+
+    def test_generates_requested_volumes(self):
+        out = self.generate()
+
+        self.assertIn('Gotowe.', out)
+        self.assertEqual(Doctor.objects.count(), 3)
+        self.assertEqual(Patient.objects.count(), 40)
+        self.assertEqual(Appointment.objects.count(), 600)
+        self.assertEqual(User.objects.filter(username__startswith='load_').count(), 43)
+        self.assertTrue(AppointmentAttachment.objects.exists())
+        self.assertTrue(DiabetesPrediction.objects.exists())
+
+    def test_rows_are_consistent(self):
+        self.generate()
+
+        for pesel, date_of_birth in Patient.objects.values_list('pesel', 'date_of_birth'):
+            self.assertTrue(is_valid_pesel(pesel))
+            self.assertEqual(extract_birth_date_from_pesel(pesel), date_of_birth)
+        # Series instances belong to the head's patient and doctor, later in time
+        instances = Appointment.objects.filter(parent_appointment__isnull=False)
+        self.assertFalse(instances.exclude(patient=F('parent_appointment__patient')).exists())
+        self.assertFalse(instances.exclude(appointment_date__gt=F('parent_appointment__appointment_date')).exists())
+        # Only completed visits have notes, attachments and predictions
+        self.assertFalse(Appointment.objects.exclude(status='completed').exclude(notes_hash='').exists())
+        self.assertFalse(DiabetesPrediction.objects.exclude(appointment__status='completed').exists())
+        attachment = AppointmentAttachment.objects.first()
+        self.assertEqual(attachment.file.size, attachment.file_size)
+
+    def test_accounts_can_log_in(self):
+        self.generate('--password', 'haslo12345')
+        username = Doctor.objects.select_related('user').first().user.username
+
+        self.assertTrue(self.client.login(username=username, password='haslo12345'))
+
+    def test_search_index_is_rebuilt(self):
+        self.generate()
+        appointment = Appointment.objects.exclude(notes_hash='').select_related('doctor').first()
+        word = appointment.notes_text.split()[0]
+
+        self.assertIn(appointment.id, [id for id, _ in search_notes(appointment.doctor, word)])
+
+    def test_same_seed_same_data(self):
+        self.generate('--seed', '7')
+        first = list(Appointment.objects.order_by('id').values_list('status', 'reason', 'appointment_date'))
+        Appointment.objects.all().delete()
+        Patient.objects.all().delete()
+        Doctor.objects.all().delete()
+        User.objects.filter(username__startswith='load_').delete()
+
+        self.generate('--seed', '7')
+        second = list(Appointment.objects.order_by('id').values_list('status', 'reason', 'appointment_date'))
+        self.assertEqual(first, second)
+
+    def test_copy_requires_postgresql(self):
+        with self.assertRaises(CommandError):
+            self.generate('--copy')
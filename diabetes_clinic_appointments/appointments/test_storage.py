@@ -0,0 +1,213 @@
+"""
+Tests for content-addressed attachment storage.
+"""
+
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, time as dtime, timedelta
+from io import StringIO
+
+from django.apps import apps as django_apps
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment, AppointmentAttachment
+from appointments.storage import attachment_storage, blob_name
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+PDF = b'%PDF-1.4 wyniki badan'
+PDF_SHA256 = hashlib.sha256(PDF).hexdigest()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    """Test deduplication, upload hashing and gc_attachments"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'attachments'), ignore_errors=True)
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'appointments'), ignore_errors=True)
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+        self.appointments = [
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                appointment_date=timezone.now() - timedelta(days=i + 1),
+                reason='Kontrola',
+                status='completed'
+            )
+            for i in range(2)
+        ]
+
+    def attach(self, appointment, name='wyniki.pdf', content=PDF):
+        return AppointmentAttachment.objects.create(
+            appointment=appointment,
+            file=SimpleUploadedFile(name, content),
+            file_type='test_result',
+            uploaded_by=self.doctor
+        )
+
+    def test_file_stored_under_content_hash(self):
+        """Test the file name is the sharded SHA-256 and the original name is kept"""
+        attachment = self.attach(self.appointments[0], name='Wyniki badań.pdf')
+
+        self.assertEqual(attachment.sha256, PDF_SHA256)
+        self.assertEqual(attachment.file.name, f'attachments/sha256/{PDF_SHA256[:2]}/{PDF_SHA256[2:4]}/{PDF_SHA256}')
+        self.assertEqual(attachment.filename, 'Wyniki badań.pdf')
+        self.assertTrue(attachment.is_pdf)
+        with attachment.file.open('rb') as f:
+            self.assertEqual(f.read(), PDF)
+
+    def test_identical_files_deduplicated(self):
+        """Test the same content attached twice is stored once and referenced twice"""
+        first = self.attach(self.appointments[0], name='a.pdf')
+        second = self.attach(self.appointments[1], name='b.pdf')
+
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.reference_count, 2)
+        blob_dir = os.path.dirname(attachment_storage.path(blob_name(PDF_SHA256)))
+        self.assertEqual(os.listdir(blob_dir), [PDF_SHA256])
+        self.assertEqual(second.filename, 'b.pdf')
+
+    def test_upload_hashed_while_received(self):
+        """Test the upload handlers attach the digest to uploaded files"""
+        self.client.login(username='doctor_test', password='testpass123')
+        url = reverse('doctors:edit_appointment_notes', kwargs={'appointment_id': self.appointments[0].id})
+
+        self.client.post(url, {
+            'upload_attachment': '1',
+            'file': SimpleUploadedFile('skan.pdf', PDF),
+            'file_type': 'test_result',
+            'description': '',
+        })
+
+        attachment = AppointmentAttachment.objects.get()
+        self.assertEqual(attachment.sha256, PDF_SHA256)
+        self.assertEqual(attachment.filename, 'skan.pdf')
+
+    def test_delete_keeps_shared_blob(self):
+        """Test deleting one attachment leaves the blob for the other"""
+        first = self.attach(self.appointments[0])
+        second = self.attach(self.appointments[1])
+        self.client.login(username='doctor_test', password='testpass123')
+
+        self.client.post(reverse('doctors:delete_attachment', kwargs={'attachment_id': first.id}))
+
+        self.assertFalse(AppointmentAttachment.objects.filter(id=first.id).exists())
+        self.assertTrue(second.file.storage.exists(second.file.name))
+
+    def test_gc_removes_only_old_unreferenced_blobs(self):
+        """Test gc_attachments deletes unreferenced blobs past the grace period"""
+        kept = self.attach(self.appointments[0])
+        orphan = self.attach(self.appointments[1], content=b'orphan')
+        recent = self.attach(self.appointments[1], content=b'recent orphan')
+        orphan_path, recent_path = orphan.file.path, recent.file.path
+        AppointmentAttachment.objects.filter(id__in=[orphan.id, recent.id]).delete()
+        old = time.time() - 48 * 3600
+        os.utime(orphan_path, (old, old))
+        os.utime(kept.file.path, (old, old))
+
+        out = StringIO()
+        call_command('gc_attachments', '--dry-run', stdout=out)
+        self.assertTrue(os.path.exists(orphan_path))
+        self.assertIn('Do usunięcia: 1', out.getvalue())
+
+        call_command('gc_attachments', stdout=StringIO())
+        self.assertFalse(os.path.exists(orphan_path))
+        self.assertTrue(os.path.exists(recent_path))
+        self.assertTrue(os.path.exists(kept.file.path))
+
+    def legacy_attachment(self, appointment, sha256=PDF_SHA256, content=PDF):
+        """Attachment stored under the pre-content-addressed path"""
+        name = f'appointments/patient_{self.patient.id}/appointment_{appointment.id}/skan.pdf'
+        path = attachment_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        attachment = self.attach(appointment)
+        AppointmentAttachment.objects.filter(id=attachment.id).update(file=name, sha256=sha256)
+        os.remove(attachment.file.path)
+        attachment.refresh_from_db()
+        return attachment
+
+    def test_legacy_files_moved_to_blobs(self):
+        """Test migration 0013 moves legacy files into the blob layout"""
+        migration = importlib.import_module('appointments.migrations.0013_move_legacy_attachments')
+        legacy = self.legacy_attachment(self.appointments[0])
+        legacy_path = legacy.file.path
+
+        migration.move_legacy_files(django_apps, None)
+
+        legacy.refresh_from_db()
+        self.assertEqual(legacy.file.name, blob_name(PDF_SHA256))
+        self.assertFalse(os.path.exists(legacy_path))
+        with legacy.file.open('rb') as f:
+            self.assertEqual(f.read(), PDF)
+
+        # Once moved, deleting the row leaves the file to gc_attachments
+        legacy.delete()
+        old = time.time() - 48 * 3600
+        os.utime(attachment_storage.path(blob_name(PDF_SHA256)), (old, old))
+        call_command('gc_attachments', stdout=StringIO())
+        self.assertFalse(attachment_storage.exists(blob_name(PDF_SHA256)))
+
+    def test_legacy_file_deleted_with_last_row(self):
+        """Test a legacy file that was not moved is removed with its last attachment"""
+        legacy = self.legacy_attachment(self.appointments[0], sha256='')
+        shared = self.attach(self.appointments[1])
+        AppointmentAttachment.objects.filter(id=shared.id).update(file=legacy.file.name)
+        legacy_path = legacy.file.path
+        self.client.login(username='doctor_test', password='testpass123')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('doctors:delete_attachment', kwargs={'attachment_id': legacy.id}))
+        self.assertTrue(os.path.exists(legacy_path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('doctors:delete_attachment', kwargs={'attachment_id': shared.id}))
+        self.assertFalse(os.path.exists(legacy_path))
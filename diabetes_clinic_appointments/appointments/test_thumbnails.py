@@ -0,0 +1,204 @@
+"""
+Tests for attachment thumbnails.
+"""
+
+import os
+import shutil
+import tempfile
+from datetime import date, time as dtime, timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
+
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment, AppointmentAttachment
+from appointments.storage import attachment_storage
+from appointments.thumbnails import generate_thumbnail, thumbnail_name
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_scan(size=(800, 600)):
+    """A noisy (badly compressible) PNG, like a photographed document"""
+    output = BytesIO()
+    Image.effect_noise(size, 64).convert('RGB').save(output, 'PNG')
+    return output.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, THUMBNAIL_SIZE=320, THUMBNAIL_WORKERS=0)
+class AttachmentThumbnailTest(TestCase):
+    """Test thumbnail generation, serving and cleanup"""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        shutil.rmtree(os.path.join(MEDIA_ROOT, 'attachments'), ignore_errors=True)
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient'
+        )
+        self.patient = Patient.objects.create(
+            user=patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() - timedelta(days=1),
+            reason='Kontrola',
+            status='completed'
+        )
+        self.scan = make_scan()
+
+    def create_attachment(self, name='stopa.png', content=None):
+        return AppointmentAttachment.objects.create(
+            appointment=self.appointment,
+            file=SimpleUploadedFile(name, content or self.scan),
+            file_type='image',
+            uploaded_by=self.doctor
+        )
+
+    def test_thumbnail_generated_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment = self.create_attachment()
+
+        attachment.refresh_from_db()
+        self.assertTrue(attachment.has_thumbnail)
+        name = thumbnail_name(attachment.sha256)
+        self.assertEqual(name, attachment.file.name + '.thumb.webp')
+        with attachment_storage.open(name, 'rb') as f:
+            data = f.read()
+        with Image.open(BytesIO(data)) as thumbnail:
+            self.assertEqual(thumbnail.format, 'WEBP')
+            self.assertEqual(max(thumbnail.size), 320)
+        # The list page loads the thumbnail instead of the original
+        self.assertLess(len(data), len(self.scan) * 0.1)
+
+    def test_shared_file_shares_thumbnail(self):
+        first = self.create_attachment()
+        generate_thumbnail(first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            second = self.create_attachment(name='kopia.png')
+
+        second.refresh_from_db()
+        self.assertTrue(second.has_thumbnail)
+
+    def test_pdf_without_renderer_keeps_icon(self):
+        with patch('appointments.thumbnails._pdf_renderer', return_value=None):
+            with self.captureOnCommitCallbacks(execute=True):
+                attachment = self.create_attachment(name='wyniki.pdf', content=b'%PDF-1.4 wyniki')
+
+        attachment.refresh_from_db()
+        self.assertFalse(attachment.has_thumbnail)
+
+    def test_thumbnail_view_sets_long_cache_headers(self):
+        attachment = self.create_attachment()
+        generate_thumbnail(attachment)
+        self.client.login(username='doctor_test', password='testpass123')
+        url = reverse('doctors:attachment_thumbnail', args=[attachment.id])
+
+        response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+        self.assertIn('immutable', response['Cache-Control'])
+        response.close()
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(reverse('doctors:edit_appointment_notes', args=[self.appointment.id]))
+        self.assertContains(response, url)
+
+    def test_thumbnail_view_404_without_thumbnail(self):
+        attachment = self.create_attachment()
+        self.client.login(username='doctor_test', password='testpass123')
+
+        response = self.client.get(reverse('doctors:attachment_thumbnail', args=[attachment.id]))
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_gc_keeps_thumbnail_of_referenced_blob(self):
+        attachment = self.create_attachment()
+        generate_thumbnail(attachment)
+        name = thumbnail_name(attachment.sha256)
+        os.utime(attachment_storage.path(name), (0, 0))
+
+        call_command('gc_attachments', stdout=StringIO())
+        self.assertTrue(attachment_storage.exists(name))
+
+        attachment.delete()
+        os.utime(attachment_storage.path(attachment.file.name), (0, 0))
+        call_command('gc_attachments', stdout=StringIO())
+        self.assertFalse(attachment_storage.exists(name))
+
+    def test_gc_keeps_thumbnail_of_legacy_attachment(self):
+        attachment = self.create_attachment()
+        generate_thumbnail(attachment)
+        name = thumbnail_name(attachment.sha256)
+        # Row still pointing at a pre-content-addressed path
+        legacy_name = f'appointments/patient_{self.patient.id}/stopa.png'
+        os.makedirs(os.path.dirname(attachment_storage.path(legacy_name)), exist_ok=True)
+        os.replace(attachment.file.path, attachment_storage.path(legacy_name))
+        AppointmentAttachment.objects.filter(id=attachment.id).update(file=legacy_name)
+        os.utime(attachment_storage.path(name), (0, 0))
+
+        call_command('gc_attachments', stdout=StringIO())
+
+        self.assertTrue(attachment_storage.exists(name))
+
+    def test_thumbnail_view_404_for_missing_file(self):
+        attachment = self.create_attachment()
+        generate_thumbnail(attachment)
+        attachment_storage.delete(thumbnail_name(attachment.sha256))
+        self.client.login(username='doctor_test', password='testpass123')
+
+        response = self.client.get(reverse('doctors:attachment_thumbnail', args=[attachment.id]))
+
+        self.assertEqual(response.status_code, 404)
+        attachment.refresh_from_db()
+        self.assertFalse(attachment.has_thumbnail)
+
+    def test_generate_thumbnails_command(self):
+        attachment = self.create_attachment()
+
+        call_command('generate_thumbnails', stdout=StringIO())
+
+        attachment.refresh_from_db()
+        self.assertTrue(attachment.has_thumbnail)
@@ -501,6 +501,88 @@ class AppointmentNotesTest(TestCase):
             'Appointment completed successfully. Patient healthy.'
         )
 
+    def test_rendered_notes_stored_on_save(self):
+        """Test sanitized HTML, excerpt and hash are computed at save"""
+        appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() + timedelta(days=1),
+            reason='Test visit',
+            notes='<p onclick="x()">Dawka <strong>insuliny</strong></p><script>alert(1)</script>'
+        )
+
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.notes_html, '<p>Dawka <strong>insuliny</strong></p>')
+        self.assertEqual(appointment.notes_text, 'Dawka insuliny')
+        self.assertEqual(appointment.notes_excerpt, 'Dawka insuliny')
+        self.assertEqual(len(appointment.notes_hash), 64)
+        self.assertTrue(appointment.has_notes)
+
+    def test_rendered_notes_follow_update_fields(self):
+        """Test saving only notes also saves the renderings"""
+        appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() + timedelta(days=1),
+            reason='Test visit'
+        )
+        self.assertFalse(appointment.has_notes)
+
+        appointment.notes = '<p>Nowa notatka</p>'
+        appointment.save(update_fields=['notes'])
+
+        appointment.refresh_from_db()
+        self.assertEqual(appointment.notes_excerpt, 'Nowa notatka')
+        self.assertTrue(appointment.has_notes)
+
+    def test_rendered_notes_not_recomputed_when_unchanged(self):
+        """Test renderings are only recomputed when the notes hash changes"""
+        appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() + timedelta(days=1),
+            reason='Test visit',
+            notes='<p>Notatka</p>'
+        )
+
+        self.assertFalse(appointment.refresh_rendered_notes())
+        appointment.notes = '<p>Zmieniona notatka</p>'
+        self.assertTrue(appointment.refresh_rendered_notes())
+
+    def test_backfill_command_populates_existing_rows(self):
+        """Test backfill_rendered_notes fills renderings for rows saved without them"""
+        from io import StringIO
+        from django.core.management import call_command
+
+        appointments = [
+            Appointment.objects.create(
+                patient=self.patient,
+                doctor=self.doctor,
+                appointment_date=timezone.now() + timedelta(days=i + 1),
+                reason='Test visit',
+                notes=f'<p>Notatka {i}</p>'
+            )
+            for i in range(3)
+        ]
+        # Simulate rows written before the rendering columns existed
+        Appointment.objects.update(notes_html='', notes_excerpt='', notes_hash='')
+        self.assertFalse(Appointment.objects.get(pk=appointments[0].pk).has_notes)
+        self.assertEqual(Appointment.objects.get(pk=appointments[0].pk).safe_notes, '<p>Notatka 0</p>')
+
+        out = StringIO()
+        call_command('backfill_rendered_notes', chunk_size=2, stdout=out)
+
+        self.assertIn('zaktualizowano 3 z 3', out.getvalue())
+        for appointment in appointments:
+            appointment.refresh_from_db()
+            self.assertEqual(appointment.notes_html, appointment.notes)
+            self.assertTrue(appointment.has_notes)
+
+        # Second run has nothing to do
+        out = StringIO()
+        call_command('backfill_rendered_notes', stdout=out)
+        self.assertIn('zaktualizowano 0 z 3', out.getvalue())
+
 
 class AppointmentTimestampsTest(TestCase):
     """Test created_at and updated_at timestamps"""
@@ -631,3 +713,98 @@ class AppointmentReasonTest(TestCase):
             )
 
             self.assertEqual(appointment.reason, reason)
+
+
+class AppointmentProjectionsTest(TestCase):
+    """Test the for_listing/for_calendar/for_detail queryset projections"""
+
+    def setUp(self):
+        self.patient_user = User.objects.create_user(
+            username='patient',
+            password='pass',
+            user_type='patient'
+        )
+        self.patient = Patient.objects.create(
+            user=self.patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1',
+            current_medications='Insulina'
+        )
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor',
+            password='pass',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start='08:00',
+            working_hours_end='16:00',
+            education='Medical University'
+        )
+
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() + timedelta(days=1),
+            reason='Test visit',
+            notes='<p>Długa notatka</p>'
+        )
+
+    def test_for_listing_defers_notes_body(self):
+        """Test listing loads excerpt and related names in one query, without the notes body"""
+        with self.assertNumQueries(1):
+            appointment = Appointment.objects.for_listing().get(pk=self.appointment.pk)
+            self.assertEqual(appointment.notes_excerpt, 'Długa notatka')
+            self.assertTrue(appointment.has_notes)
+            self.assertEqual(appointment.patient.user.username, 'patient')
+            self.assertEqual(appointment.doctor.user.username, 'doctor')
+
+        self.assertTrue({'notes', 'notes_text', 'notes_html'} <= appointment.get_deferred_fields())
+        self.assertIn('current_medications', appointment.patient.get_deferred_fields())
+        self.assertIn('education', appointment.doctor.get_deferred_fields())
+
+    def test_for_calendar_loads_only_schedule_columns(self):
+        """Test calendar projection loads only the scheduling columns"""
+        appointment = Appointment.objects.for_calendar().get(pk=self.appointment.pk)
+
+        self.assertIn('reason', appointment.get_deferred_fields())
+        self.assertIn('notes', appointment.get_deferred_fields())
+        with self.assertNumQueries(0):
+            self.assertEqual(appointment.appointment_date, self.appointment.appointment_date)
+            self.assertEqual(appointment.duration_minutes, 30)
+
+    def test_for_detail_loads_full_row(self):
+        """Test detail projection loads notes and related profiles"""
+        with self.assertNumQueries(1):
+            appointment = Appointment.objects.for_detail().get(pk=self.appointment.pk)
+            self.assertEqual(appointment.notes, '<p>Długa notatka</p>')
+            self.assertEqual(appointment.patient.current_medications, 'Insulina')
+
+    def test_saving_listing_row_keeps_renderings(self):
+        """Test saving a row loaded without notes does not touch the renderings"""
+        appointment = Appointment.objects.for_listing().get(pk=self.appointment.pk)
+        appointment.status = 'completed'
+        appointment.save()
+
+        self.appointment.refresh_from_db()
+        self.assertEqual(self.appointment.status, 'completed')
+        self.assertEqual(self.appointment.notes_html, '<p>Długa notatka</p>')
+
+    def test_patient_for_listing_defers_free_text(self):
+        """Test patient listing projection skips free-text columns"""
+        patient = Patient.objects.for_listing().get(pk=self.patient.pk)
+
+        self.assertEqual(
+            patient.get_deferred_fields(),
+            {'address', 'current_medications', 'allergies'}
+        )
@@ -0,0 +1,160 @@
+"""
+Thumbnails for image and PDF attachments.
+
+Attachment lists show a small WebP preview instead of loading the original
+scans. Thumbnails are generated after upload in a background thread pool
+and stored next to the original blob:
+
+    attachments/sha256/ab/cd/<sha256>.thumb.webp
+
+Like the blob itself, a thumbnail depends only on the file content, so
+attachments sharing a file share the thumbnail and it can be cached by
+browsers indefinitely. The first page of a PDF is rendered with PyMuPDF
+when installed, otherwise with ``pdftoppm`` (poppler-utils); without
+either, PDFs keep the icon.
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+
+from .storage import attachment_storage, blob_name
+
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SUFFIX = '.thumb.webp'
+THUMBNAIL_QUALITY = 75
+
+# Thumbnails never change for a given content hash (one year)
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+
+# Resolution PDFs are rendered at before downscaling
+PDF_RENDER_SIZE = 1024
+
+# Decompression-bomb guard for uploaded images (pixels)
+MAX_IMAGE_PIXELS = 100_000_000
+
+_executor = None
+
+
+def thumbnail_name(sha256):
+    """Return the storage name of the thumbnail for the given content hash"""
+    return blob_name(sha256) + THUMBNAIL_SUFFIX
+
+
+def supports_thumbnail(attachment):
+    """Whether a thumbnail can be generated for the attachment"""
+    if not attachment.sha256 or attachment.file_extension == '.svg':
+        return False
+    if attachment.is_pdf:
+        return _pdf_renderer() is not None
+    return attachment.is_image
+
+
+def generate_thumbnail(attachment):
+    """
+    Create the attachment's thumbnail (unless it exists) and mark it as available.
+
+    Returns:
+        bool: True if the attachment has a thumbnail afterwards
+    """
+    from PIL import Image, ImageOps
+
+    if not supports_thumbnail(attachment):
+        return False
+
+    name = thumbnail_name(attachment.sha256)
+    if not attachment_storage.exists(name):
+        Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+        if attachment.is_pdf:
+            image = _render_pdf_first_page(attachment.file.path)
+        else:
+            with attachment.file.open('rb') as f:
+                image = Image.open(f)
+                image.draft('RGB', (settings.THUMBNAIL_SIZE * 2, settings.THUMBNAIL_SIZE * 2))
+                image = ImageOps.exif_transpose(image)
+                image.load()
+
+        image.thumbnail((settings.THUMBNAIL_SIZE, settings.THUMBNAIL_SIZE))
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+
+        output = BytesIO()
+        image.save(output, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        attachment_storage.save(name, ContentFile(output.getvalue()))
+
+    type(attachment).objects.filter(sha256=attachment.sha256).update(has_thumbnail=True)
+    attachment.has_thumbnail = True
+    return True
+
+
+def _pdf_renderer():
+    try:
+        import fitz  # noqa: F401 (PyMuPDF)
+        return 'pymupdf'
+    except ImportError:
+        pass
+    if shutil.which('pdftoppm'):
+        return 'pdftoppm'
+    return None
+
+
+def _render_pdf_first_page(path):
+    from PIL import Image
+
+    if _pdf_renderer() == 'pymupdf':
+        import fitz
+        with fitz.open(path) as document:
+            page = document[0]
+            zoom = PDF_RENDER_SIZE / max(page.rect.width, page.rect.height)
+            pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+            return Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+
+    with tempfile.TemporaryDirectory() as directory:
+        prefix = os.path.join(directory, 'page')
+        subprocess.run(
+            ['pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+             '-scale-to', str(PDF_RENDER_SIZE), path, prefix],
+            check=True, capture_output=True, timeout=60,
+        )
+        with Image.open(prefix + '.png') as image:
+            image.load()
+            return image
+
+
+def _generate_in_background(attachment_id):
+    from .models import AppointmentAttachment
+
+    try:
+        attachment = AppointmentAttachment.objects.filter(id=attachment_id).first()
+        if attachment is not None:
+            generate_thumbnail(attachment)
+    except Exception:
+        logger.exception('Thumbnail generation failed for attachment %s', attachment_id)
+    finally:
+        close_old_connections()
+
+
+def schedule_thumbnail(attachment):
+    """Generate the thumbnail in the worker pool once the upload is committed"""
+    global _executor
+
+    if not supports_thumbnail(attachment):
+        return
+    if settings.THUMBNAIL_WORKERS <= 0:
+        transaction.on_commit(lambda: _generate_in_background(attachment.id))
+        return
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails'
+        )
+    transaction.on_commit(lambda: _executor.submit(_generate_in_background, attachment.id))
@@ -10,6 +10,7 @@ from dateutil.relativedelta import relativedelta
 from .models import Appointment
 from .forms import AppointmentBookingForm, AppointmentEditForm
 from doctors.models import Doctor
+from utilities.replica import use_replica
 
 
 def generate_recurring_appointments(parent_appointment, recurrence_pattern, end_date):
@@ -81,6 +82,7 @@ def generate_recurring_appointments(parent_appointment, recurrence_pattern, end_
     return created_appointments
 
 @login_required
+@use_replica
 def patient_appointment_history(request):
     if not request.user.is_patient():
         return redirect('authentication:login')
@@ -98,7 +100,7 @@ def patient_appointment_history(request):
     date_to = request.GET.get('date_to', '')
     search_query = request.GET.get('search', '')
 
-    appointments = Appointment.objects.filter(patient=patient).select_related('doctor__user')
+    appointments = Appointment.objects.for_listing().filter(patient=patient)
 
     # Apply search filter
     if search_query:
@@ -186,8 +188,8 @@ def appointment_detail(request, appointment_id):
         return redirect('authentication:login')
     
     appointment = get_object_or_404(
-        Appointment, 
-        id=appointment_id, 
+        Appointment.objects.for_detail(),
+        id=appointment_id,
         patient=request.user.patient_profile
     )
     
@@ -297,7 +299,7 @@ def upcoming_appointments(request):
         return redirect('authentication:login')
 
     patient = request.user.patient_profile
-    appointments = Appointment.objects.filter(
+    appointments = Appointment.objects.for_listing().filter(
         patient=patient,
         status='scheduled',
         appointment_date__gte=timezone.now()
@@ -428,10 +430,12 @@ def cancel_appointment(request, appointment_id):
 
 
 @login_required
-def get_available_time_slots(request):
+async def get_available_time_slots(request):
     """
     API endpoint that returns available time slots for a specific doctor on a specific date.
     Returns JSON with available hours and suggestions based on patient history.
+
+    Async: under ASGI the queries do not hold a worker while waiting.
     """
     doctor_id = request.GET.get('doctor_id')
     date_str = request.GET.get('date')  # Format: YYYY-MM-DD
@@ -441,7 +445,7 @@ def get_available_time_slots(request):
         return JsonResponse({'error': 'Missing required parameters'}, status=400)
 
     try:
-        doctor = Doctor.objects.get(id=doctor_id)
+        doctor = await Doctor.objects.select_related('user').aget(id=doctor_id)
         selected_date = datetime.strptime(date_str, '%Y-%m-%d').date()
     except (Doctor.DoesNotExist, ValueError):
         return JsonResponse({'error': 'Invalid doctor or date'}, status=400)
@@ -452,17 +456,18 @@ def get_available_time_slots(request):
 
     # Analyze patient history for suggestions
     suggested_slots = []
-    if request.user.is_authenticated and hasattr(request.user, 'patient_profile'):
-        patient = request.user.patient_profile
-
+    user = await request.auser()
+    if user.is_authenticated and user.is_patient():
         # Get completed appointments from the past
-        past_appointments = Appointment.objects.filter(
-            patient=patient,
-            status='completed',
-            appointment_date__lt=timezone.now()
-        ).order_by('-appointment_date')[:10]  # Last 10 appointments
-
-        if past_appointments.exists():
+        past_appointments = [
+            appt async for appt in Appointment.objects.for_calendar().filter(
+                patient__user_id=user.pk,
+                status='completed',
+                appointment_date__lt=timezone.now()
+            ).order_by('-appointment_date')[:10]  # Last 10 appointments
+        ]
+
+        if past_appointments:
             # Analyze preferred days of week
             weekday_counts = {}
             hour_counts = {}
@@ -505,7 +510,7 @@ def get_available_time_slots(request):
     start_datetime = timezone.make_aware(start_datetime)
     end_datetime = timezone.make_aware(end_datetime)
 
-    existing_appointments = Appointment.objects.filter(
+    existing_appointments = Appointment.objects.for_calendar().filter(
         doctor=doctor,
         appointment_date__range=(start_datetime, end_datetime),
         status='scheduled'
@@ -517,7 +522,7 @@ def get_available_time_slots(request):
 
     # Mark occupied slots (including buffer time)
     occupied_slots = set()
-    for appointment in existing_appointments:
+    async for appointment in existing_appointments:
         appointment_time = appointment.appointment_date.astimezone(timezone.get_current_timezone())
 
         # Block the exact time slot and 45 minutes after (30 min appointment + 15 min buffer)
@@ -1,6 +1,34 @@
-from django.apps import AppConfig
+from django.apps import AppConfig, apps
+from django.core import checks
+from django.db.models.signals import post_save, post_delete
+
+
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Drop the user cached by CachedAuthenticationMiddleware and their cached pages"""
+    from utilities.view_cache import bump_version
+    from .middleware import invalidate_user
+    invalidate_user(instance.pk)
+    bump_version(f'user:{instance.pk}', 'users')
+
+
+def invalidate_cached_profile_user(sender, instance, **kwargs):
+    """Drop the cached pages of the user whose doctor/patient profile changed"""
+    from utilities.view_cache import bump_version
+    bump_version(f'user:{instance.user_id}')
 
 
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from .lockout import check_lockout_cache
+        checks.register(check_lockout_cache, checks.Tags.caches)
+
+        User = self.get_model('User')
+        post_save.connect(invalidate_cached_user, sender=User)
+        post_delete.connect(invalidate_cached_user, sender=User)
+
+        for model in (apps.get_model('doctors', 'Doctor'), apps.get_model('patients', 'Patient')):
+            post_save.connect(invalidate_cached_profile_user, sender=model)
+            post_delete.connect(invalidate_cached_profile_user, sender=model)
@@ -0,0 +1,186 @@
+"""
+Login lockout backed by the cache.
+
+Failed login attempts are counted with cache increments over a sliding
+window, separately per username and per client IP, so a burst of wrong
+passwords never touches the users table. The ``User`` lockout fields
+are written only on state transitions:
+
+* when a username becomes locked (one UPDATE, also for the admin panel),
+* when a user with a recorded failure or lock logs in successfully.
+
+The sliding window is approximated with two fixed buckets: the count of
+the current window plus the previous window's count weighted by how much
+of it still overlaps the last ``LOGIN_LOCKOUT_WINDOW`` seconds.
+
+The counts are only exact with a backend whose ``incr()`` is atomic across
+workers (Redis, memcached). The file-based and database caches read and
+rewrite the value, so parallel guesses can overwrite each other's counts;
+``check_lockout_cache`` reports such a configuration as a system check
+warning (``manage.py check``, ``runserver``, ``migrate``).
+"""
+
+import hashlib
+import time
+from collections import namedtuple
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import checks
+from django.utils import timezone
+
+from utilities.cache import CacheNamespace
+from utilities.metrics import Counter
+from utilities.view_cache import bump_version
+
+from .middleware import invalidate_user
+
+
+lockout_cache = CacheNamespace('login_lockout')
+
+login_failures = Counter('clinic_login_failures_total', 'Failed login attempts')
+login_lockouts = Counter('clinic_login_lockouts_total', 'Usernames and client IPs locked out', ['scope'])
+
+# Backends whose incr() reads and rewrites the value (not atomic across processes)
+NON_ATOMIC_BACKENDS = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+
+Failure = namedtuple('Failure', ['attempts', 'remaining', 'locked_until', 'scope'])
+
+
+def check_lockout_cache(app_configs, **kwargs):
+    """System check: warn when failed logins are counted with a non-atomic cache"""
+    backend = settings.CACHES[lockout_cache.alias]['BACKEND']
+    if backend not in NON_ATOMIC_BACKENDS:
+        return []
+    return [checks.Warning(
+        f'Login lockout counters are stored in {backend}, whose incr() is not atomic: '
+        'parallel failed logins can be lost and an attacker gets more attempts than '
+        'LOGIN_LOCKOUT_ATTEMPTS.',
+        hint='Set CACHE_URL to a Redis server (redis://...).',
+        id='authentication.W001',
+    )]
+
+
+def client_ip(request):
+    """Return the client address (see the CLIENT_IP_HEADER setting)"""
+    address = request.META.get(settings.CLIENT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+    return address.split(',')[0].strip()
+
+
+def _key(kind, scope, ident, *parts):
+    # Usernames may contain characters memcached does not accept in keys
+    digest = hashlib.sha256(ident.encode('utf-8')).hexdigest()[:32]
+    return (kind, scope, digest, *parts)
+
+
+def _count(scope, ident, now, increment):
+    window = settings.LOGIN_LOCKOUT_WINDOW
+    index, elapsed = divmod(now, window)
+    index = int(index)
+    key = _key('attempts', scope, ident, index)
+
+    if increment:
+        lockout_cache.add(key, 0, timeout=2 * window)
+        try:
+            current = lockout_cache.incr(key)
+        except ValueError:
+            # Expired between add() and incr()
+            lockout_cache.set(key, 1, timeout=2 * window)
+            current = 1
+    else:
+        current = lockout_cache.get(key, 0)
+
+    previous = lockout_cache.get(_key('attempts', scope, ident, index - 1), 0)
+    return current + int(previous * (1 - elapsed / window))
+
+
+def _limit(scope):
+    if scope == 'ip':
+        return settings.LOGIN_LOCKOUT_IP_ATTEMPTS
+    return settings.LOGIN_LOCKOUT_ATTEMPTS
+
+
+def locked_until(scope, ident):
+    """
+    Return when the lock of a username ('user') or IP ('ip') expires.
+
+    Returns:
+        datetime: End of the lock, or None when not locked
+    """
+    until = lockout_cache.get(_key('lock', scope, ident))
+    if until is None or until <= time.time():
+        return None
+    return datetime.fromtimestamp(until, tz=dt_timezone.utc)
+
+
+def failed_attempts(username):
+    """Number of failed attempts for a username within the current window"""
+    return _count('user', username, time.time(), increment=False)
+
+
+def register_failure(username, ip):
+    """
+    Count a failed login for the username and the client IP.
+
+    Locks whichever reached its limit. The first request to lock a username
+    also stores the lock on the ``User`` row.
+
+    Returns:
+        Failure: Attempts and remaining attempts for the username, the end
+        of the lock (None if neither the username nor the IP is locked) and
+        what is locked - 'user' (also when the IP is) or 'ip'
+    """
+    from .models import User
+
+    now = time.time()
+    attempts = _count('user', username, now, increment=True)
+    until = scope = None
+    login_failures.inc()
+
+    if ip and _count('ip', ip, now, increment=True) >= _limit('ip'):
+        until, scope = now + settings.LOGIN_LOCKOUT_DURATION, 'ip'
+        if lockout_cache.add(_key('lock', 'ip', ip), until, timeout=settings.LOGIN_LOCKOUT_DURATION):
+            login_lockouts.inc(scope='ip')
+
+    if attempts >= _limit('user'):
+        until, scope = now + settings.LOGIN_LOCKOUT_DURATION, 'user'
+        # add() succeeds for exactly one request - the unlocked -> locked transition
+        if lockout_cache.add(_key('lock', 'user', username), until, timeout=settings.LOGIN_LOCKOUT_DURATION):
+            login_lockouts.inc(scope='user')
+            users = User.objects.filter(username=username)
+            users.update(
+                failed_login_attempts=attempts,
+                last_failed_login=timezone.now(),
+                account_locked_until=datetime.fromtimestamp(until, tz=dt_timezone.utc),
+            )
+            # update() sends no signals - drop the cached row and refresh the locked-accounts count
+            for user_id in users.values_list('pk', flat=True):
+                invalidate_user(user_id)
+            bump_version('users')
+
+    return Failure(
+        attempts=attempts,
+        remaining=max(_limit('user') - attempts, 0),
+        locked_until=datetime.fromtimestamp(until, tz=dt_timezone.utc) if until else None,
+        scope=scope,
+    )
+
+
+def clear_failures(username):
+    """Forget failed attempts and the lock of a username"""
+    now = time.time()
+    index = int(now // settings.LOGIN_LOCKOUT_WINDOW)
+    lockout_cache.delete_many([
+        _key('attempts', 'user', username, index),
+        _key('attempts', 'user', username, index - 1),
+        _key('lock', 'user', username),
+    ])
+
+
+def register_success(user):
+    """Reset lockout state after a successful login (writes the row only if needed)"""
+    clear_failures(user.username)
+    user.reset_failed_login()
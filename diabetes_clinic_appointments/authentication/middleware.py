@@ -0,0 +1,144 @@
+"""
+Authentication middleware loading the user from the cache.
+
+Django's ``AuthenticationMiddleware`` queries the user on every request.
+``CachedAuthenticationMiddleware`` keeps the values of the user row (without
+the password hash) in the cache, so with a cached session backend an authenticated request needs no
+query at all before the view runs. Only the ``User`` row is cached: the
+doctor and patient profiles (PESEL, medications, allergies) never go into
+the shared cache and are queried by the views that use them.
+
+Cached users are dropped whenever the user is saved or deleted (signals
+connected in ``apps.py``) and by code changing the row with
+``queryset.update()`` (``authentication/lockout.py``). Session verification
+(password change invalidating sessions, SECRET_KEY_FALLBACKS) works as in
+``django.contrib.auth.get_user``, against session auth hashes cached with
+the row.
+"""
+
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.db import router
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from utilities.cache import CacheNamespace
+
+
+# The timeout is a safety net for changes made without signals (queryset.update())
+USER_CACHE_TIMEOUT = 300
+
+user_cache = CacheNamespace('auth_user', timeout=USER_CACHE_TIMEOUT)
+
+# Backends whose users are plain rows of the user table
+CACHEABLE_BACKENDS = {'django.contrib.auth.backends.ModelBackend'}
+
+
+def load_user(user_id):
+    """
+    Return the active user with the given id.
+
+    Returns:
+        User: The user, or None if it does not exist or is inactive
+    """
+    user, _ = _load_user(user_id)
+    return user
+
+
+def _load_user(user_id):
+    """
+    Return the active user with the given id and its session auth hashes.
+
+    The cache holds the user's field values without the password hash and,
+    next to them, the session auth hashes derived from it. A user rebuilt
+    from the cache has ``password`` deferred (loaded on first access), so
+    sessions are verified against the cached hashes.
+
+    Returns:
+        tuple: (User or None, (session auth hash, fallback hashes) or None)
+    """
+    User = get_user_model()
+    cached = user_cache.get(user_id)
+    if cached is None:
+        try:
+            user = User._default_manager.get(pk=user_id)
+        except (User.DoesNotExist, ValueError):
+            return None, None
+        cached = {
+            # Plain field values, not the pickled instance with its related objects
+            'fields': {
+                field.attname: getattr(user, field.attname)
+                for field in User._meta.concrete_fields
+                if field.attname != 'password'
+            },
+            'session_auth_hash': user.get_session_auth_hash(),
+            'session_auth_fallback_hashes': list(user.get_session_auth_fallback_hash()),
+        }
+        user_cache.set(user_id, cached)
+    else:
+        fields = cached['fields']
+        user = User.from_db(router.db_for_read(User), list(fields), list(fields.values()))
+    if not user.is_active:
+        return None, None
+    return user, (cached['session_auth_hash'], cached['session_auth_fallback_hashes'])
+
+
+def invalidate_user(user_id):
+    """Drop the cached user (after the user row changed)"""
+    user_cache.delete(user_id)
+
+
+def _verify_session(request, session_auth_hash, fallback_hashes):
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if session_hash and constant_time_compare(session_hash, session_auth_hash):
+        return True
+    # Sessions created with a previous SECRET_KEY (see SECRET_KEY_FALLBACKS)
+    if session_hash and any(
+        constant_time_compare(session_hash, fallback_hash)
+        for fallback_hash in fallback_hashes
+    ):
+        request.session.cycle_key()
+        request.session[HASH_SESSION_KEY] = session_auth_hash
+        return True
+    request.session.flush()
+    return False
+
+
+def get_user(request):
+    """Return the session's user (cached), or an AnonymousUser"""
+    if hasattr(request, '_cached_user'):
+        return request._cached_user
+
+    backend_path = request.session.get(BACKEND_SESSION_KEY)
+    if backend_path not in CACHEABLE_BACKENDS or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        request._cached_user = auth.get_user(request)
+        return request._cached_user
+
+    user = None
+    if SESSION_KEY in request.session:
+        user, session_hashes = _load_user(request.session[SESSION_KEY])
+        if user is not None and not _verify_session(request, *session_hashes):
+            user = None
+
+    request._cached_user = user or AnonymousUser()
+    return request._cached_user
+
+
+async def aget_user(request):
+    """Async ``get_user`` for async views (``await request.auser()``)"""
+    return await sync_to_async(get_user)(request)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """Drop-in replacement for AuthenticationMiddleware using ``get_user`` above"""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_user(request))
+        request.auser = partial(aget_user, request)
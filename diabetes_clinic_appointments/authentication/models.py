@@ -36,7 +36,7 @@ class User(AbstractUser):
                 # Odblokuj konto po upływie czasu
                 self.failed_login_attempts = 0
                 self.account_locked_until = None
-                self.save()
+                self.save(update_fields=['failed_login_attempts', 'account_locked_until'])
                 return False
         return False
 
@@ -49,11 +49,14 @@ class User(AbstractUser):
             # Blokada na 15 minut po 5 nieudanych próbach
             self.account_locked_until = timezone.now() + timedelta(minutes=15)
 
-        self.save()
+        self.save(update_fields=['failed_login_attempts', 'last_failed_login', 'account_locked_until'])
 
     def reset_failed_login(self):
-        """Resetuje licznik nieudanych prób logowania"""
+        """Resetuje licznik nieudanych prób logowania (zapis tylko gdy jest co resetować)"""
+        if not (self.failed_login_attempts or self.last_failed_login or self.account_locked_until):
+            return
+
         self.failed_login_attempts = 0
         self.last_failed_login = None
         self.account_locked_until = None
-        self.save()
+        self.save(update_fields=['failed_login_attempts', 'last_failed_login', 'account_locked_until'])
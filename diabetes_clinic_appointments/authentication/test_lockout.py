@@ -0,0 +1,137 @@
+"""
+Tests for the cache-backed login lockout.
+"""
+
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from authentication import lockout
+from authentication.models import User
+
+
+def user_table_writes(queries):
+    return [q['sql'] for q in queries if q['sql'].startswith('UPDATE "authentication_user"')]
+
+
+@override_settings(
+    LOGIN_LOCKOUT_ATTEMPTS=5,
+    LOGIN_LOCKOUT_IP_ATTEMPTS=8,
+    LOGIN_LOCKOUT_WINDOW=900,
+    LOGIN_LOCKOUT_DURATION=900,
+)
+class LoginLockoutTest(TestCase):
+    """Test counting failures in the cache and persisting only state transitions"""
+
+    def setUp(self):
+        cache.clear()
+        self.login_url = reverse('authentication:login')
+        self.user = User.objects.create_user(username='jan', password='testpass123')
+
+    def post(self, username='jan', password='wrong', ip='10.0.0.1'):
+        return self.client.post(
+            self.login_url, {'username': username, 'password': password}, REMOTE_ADDR=ip
+        )
+
+    def test_failed_attempts_do_not_write_user_row(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(4):
+                self.post()
+
+        self.assertEqual(user_table_writes(queries), [])
+        self.assertEqual(lockout.failed_attempts('jan'), 4)
+
+    def test_lock_is_persisted_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(5):
+                self.post()
+            response = self.post(password='testpass123')
+
+        self.assertEqual(len(user_table_writes(queries)), 1)
+        self.assertContains(response, 'zablokowane')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.failed_login_attempts, 5)
+        self.assertTrue(self.user.is_account_locked())
+
+    def test_successful_login_of_clean_user_skips_reset(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(password='testpass123')
+
+        self.assertEqual(response.status_code, 302)
+        # Only Django's own last_login update
+        writes = user_table_writes(queries)
+        self.assertEqual(len(writes), 1)
+        self.assertIn('"last_login"', writes[0])
+        self.assertNotIn('failed_login_attempts', writes[0])
+
+    def test_successful_login_clears_counter(self):
+        self.post()
+        self.post()
+
+        self.post(password='testpass123')
+
+        self.assertEqual(lockout.failed_attempts('jan'), 0)
+
+    def test_ip_locked_across_usernames(self):
+        for number in range(8):
+            self.post(username=f'user{number}')
+
+        response = self.post(password='testpass123')
+        self.assertContains(response, 'Zbyt wiele nieudanych prób logowania z Twojego adresu')
+        # The account itself is not locked
+        self.assertNotContains(response, 'Twoje konto')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+        # Other addresses are not affected
+        response = self.post(password='testpass123', ip='10.0.0.2')
+        self.assertEqual(response.status_code, 302)
+
+    def test_sliding_window_weights_previous_window(self):
+        with patch('authentication.lockout.time.time', return_value=900 * 1000 + 899):
+            for _ in range(4):
+                lockout.register_failure('jan', '10.0.0.1')
+
+        # Half of the previous window still overlaps the last 15 minutes
+        with patch('authentication.lockout.time.time', return_value=900 * 1001 + 450):
+            self.assertEqual(lockout.failed_attempts('jan'), 2)
+        # A whole window later the old failures no longer count
+        with patch('authentication.lockout.time.time', return_value=900 * 1002 + 450):
+            self.assertEqual(lockout.failed_attempts('jan'), 0)
+
+    def test_database_lock_is_respected(self):
+        """Locks set by the administrator (User row only) still block login"""
+        self.user.account_locked_until = timezone.now() + timedelta(hours=24)
+        self.user.save()
+
+        response = self.post(password='testpass123')
+
+        self.assertContains(response, 'zablokowane')
+        self.assertNotIn('_auth_user_id', self.client.session)
+
+    def test_ip_lock_message_on_failure(self):
+        for number in range(7):
+            self.post(username=f'user{number}')
+
+        response = self.post()
+
+        self.assertContains(response, 'Zbyt wiele nieudanych prób logowania z Twojego adresu')
+        self.assertNotContains(response, 'Twoje konto')
+
+    def test_non_atomic_cache_warning(self):
+        with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': '/tmp/clinic_lockout_check',
+        }}):
+            warnings = lockout.check_lockout_cache(None)
+        self.assertEqual([warning.id for warning in warnings], ['authentication.W001'])
+        self.assertEqual(lockout.check_lockout_cache(None), [])
+
+    def test_reset_failed_login_without_state_is_noop(self):
+        with self.assertNumQueries(0):
+            self.user.reset_failed_login()
+            self.assertFalse(self.user.is_account_locked())
@@ -0,0 +1,131 @@
+"""
+Tests for CachedAuthenticationMiddleware and the cached session backend.
+"""
+
+import pickle
+from datetime import time as dtime
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore
+from django.core.cache import cache
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from authentication import lockout
+from authentication.middleware import CachedAuthenticationMiddleware, user_cache
+from authentication.models import User
+from doctors.models import Doctor
+
+
+class CachedAuthenticationMiddlewareTest(TestCase):
+    """Test loading the user and its profile without per-request queries"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University'
+        )
+        self.client.login(username='doctor_test', password='testpass123')
+        self.session_key = self.client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    def authenticate(self):
+        request = RequestFactory().get('/')
+        request.session = SessionStore(self.session_key)
+        CachedAuthenticationMiddleware(lambda r: HttpResponse()).process_request(request)
+        return request
+
+    def test_uses_cached_session_backend(self):
+        self.assertEqual(settings.SESSION_ENGINE, 'django.contrib.sessions.backends.cached_db')
+
+    def test_user_loaded_in_one_query_then_cached(self):
+        with self.assertNumQueries(1):
+            request = self.authenticate()
+            self.assertEqual(request.user, self.user)
+
+        with self.assertNumQueries(0):
+            request = self.authenticate()
+            self.assertEqual(request.user, self.user)
+            self.assertEqual(request.user.username, 'doctor_test')
+
+        # Profiles are not cached, they are loaded by the views using them
+        with self.assertNumQueries(1):
+            self.assertEqual(request.user.doctor_profile.license_number, 'DOC123')
+
+    def test_only_user_row_is_cached(self):
+        self.authenticate().user.doctor_profile
+
+        cached = user_cache.get(self.user.pk)
+        self.assertIsInstance(cached['fields'], dict)
+        self.assertEqual(cached['fields']['username'], 'doctor_test')
+        self.assertNotIn('doctor_profile', cached['fields'])
+        self.assertNotIn('license_number', pickle.dumps(cached).decode('latin-1'))
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate().user.is_authenticated
+
+        cached = user_cache.get(self.user.pk)
+        self.assertNotIn('password', cached['fields'])
+        self.assertNotIn(self.user.password, pickle.dumps(cached).decode('latin-1'))
+        self.assertEqual(cached['session_auth_hash'], self.user.get_session_auth_hash())
+
+        # Verifying the session from the cache does not load the password
+        with self.assertNumQueries(0):
+            self.assertTrue(self.authenticate().user.is_authenticated)
+
+    def test_page_request_does_not_query_session_or_user(self):
+        self.client.get(reverse('doctors:doctor_profile'))
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('doctors:doctor_profile'))
+
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(q['sql'] for q in queries)
+        self.assertNotIn('"django_session"', tables)
+        self.assertNotIn('FROM "authentication_user"', tables)
+
+    def test_profile_save_invalidates_cache(self):
+        self.authenticate().user.doctor_profile
+
+        self.doctor.license_number = 'DOC456'
+        self.doctor.save()
+
+        request = self.authenticate()
+        self.assertEqual(request.user.doctor_profile.license_number, 'DOC456')
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.authenticate().user.is_authenticated
+
+        self.user.set_password('newpass456')
+        self.user.save()
+
+        self.assertFalse(self.authenticate().user.is_authenticated)
+
+    def test_lock_drops_cached_user(self):
+        self.authenticate().user.is_authenticated
+
+        with self.settings(LOGIN_LOCKOUT_ATTEMPTS=1):
+            lockout.register_failure('doctor_test', '10.0.0.1')
+
+        self.assertIsNone(user_cache.get(self.user.pk))
+        self.assertTrue(self.authenticate().user.is_account_locked())
+
+    def test_inactive_user_is_anonymous(self):
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertFalse(self.authenticate().user.is_authenticated)
@@ -2,11 +2,13 @@
 Integration tests for authentication views.
 """
 
+from django.core.cache import cache
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.messages import get_messages
 from django.utils import timezone
 from datetime import timedelta, date
+from authentication.lockout import failed_attempts
 from authentication.models import User
 from patients.models import Patient
 
@@ -15,6 +17,7 @@ class LoginViewTest(TestCase):
     """Test login_view"""
 
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.login_url = reverse('authentication:login')
 
@@ -116,9 +119,11 @@ class LoginViewTest(TestCase):
         messages = list(get_messages(response.wsgi_request))
         self.assertTrue(any('Nieprawidłowa nazwa użytkownika lub hasło' in str(m) for m in messages))
 
-        # Verify failed login attempt was incremented
+        # Verify failed login attempt was counted (in the cache - the row is
+        # written only when the account gets locked)
+        self.assertEqual(failed_attempts('patient_test'), 1)
         self.patient_user.refresh_from_db()
-        self.assertEqual(self.patient_user.failed_login_attempts, 1)
+        self.assertEqual(self.patient_user.failed_login_attempts, 0)
 
     def test_account_lockout_after_5_attempts(self):
         """Test account locks after 5 failed login attempts"""
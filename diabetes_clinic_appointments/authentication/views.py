@@ -10,26 +10,32 @@ from django.utils import timezone
 
 def login_view(request):
     if request.method == 'POST':
-        username = request.POST.get('username')
+        from . import lockout
 
-        # Sprawdź czy użytkownik istnieje
-        try:
-            user = User.objects.get(username=username)
+        username = request.POST.get('username', '')
+        ip = lockout.client_ip(request)
 
-            # Sprawdź czy konto jest zablokowane
-            if user.is_account_locked():
-                time_remaining = (user.account_locked_until - timezone.now()).seconds // 60 + 1
-                messages.error(request, f'Twoje konto jest zablokowane z powodu zbyt wielu nieudanych prób logowania. Spróbuj ponownie za {time_remaining} minut.')
-                return render(request, 'authentication/login.html', {'form': AuthenticationForm()})
-        except User.DoesNotExist:
-            pass
+        # Sprawdź blokadę w cache (bez zapytania do bazy i bez sprawdzania hasła)
+        locked_until = lockout.locked_until('user', username)
+        if locked_until:
+            messages.error(request, _locked_message(locked_until))
+            return render(request, 'authentication/login.html', {'form': AuthenticationForm()})
+        locked_until = lockout.locked_until('ip', ip)
+        if locked_until:
+            messages.error(request, _ip_locked_message(locked_until))
+            return render(request, 'authentication/login.html', {'form': AuthenticationForm()})
 
         form = AuthenticationForm(request, data=request.POST)
         if form.is_valid():
             user = form.get_user()
 
+            # Blokada zapisana w bazie (np. ręczna blokada przez administratora)
+            if user.is_account_locked():
+                messages.error(request, _locked_message(user.account_locked_until))
+                return render(request, 'authentication/login.html', {'form': AuthenticationForm()})
+
             # Resetuj licznik nieudanych prób logowania
-            user.reset_failed_login()
+            lockout.register_success(user)
 
             login(request, user)
 
@@ -41,23 +47,32 @@ def login_view(request):
             elif user.is_doctor():
                 return redirect('doctors:dashboard')
         else:
-            # Zwiększ licznik nieudanych prób logowania
-            try:
-                user = User.objects.get(username=username)
-                user.increment_failed_login()
+            # Zwiększ licznik nieudanych prób logowania (w cache - bez zapisu do bazy)
+            failure = lockout.register_failure(username, ip)
 
-                remaining_attempts = 5 - user.failed_login_attempts
-                if remaining_attempts > 0:
-                    messages.error(request, f'Nieprawidłowa nazwa użytkownika lub hasło. Pozostało prób: {remaining_attempts}')
-                else:
-                    messages.error(request, 'Twoje konto zostało zablokowane na 15 minut z powodu zbyt wielu nieudanych prób logowania.')
-            except User.DoesNotExist:
-                messages.error(request, 'Nieprawidłowa nazwa użytkownika lub hasło.')
+            if failure.scope == 'user':
+                from django.conf import settings
+                minutes = settings.LOGIN_LOCKOUT_DURATION // 60
+                messages.error(request, f'Twoje konto zostało zablokowane na {minutes} minut z powodu zbyt wielu nieudanych prób logowania.')
+            elif failure.scope == 'ip':
+                messages.error(request, _ip_locked_message(failure.locked_until))
+            else:
+                messages.error(request, f'Nieprawidłowa nazwa użytkownika lub hasło. Pozostało prób: {failure.remaining}')
     else:
         form = AuthenticationForm()
 
     return render(request, 'authentication/login.html', {'form': form})
 
+
+def _locked_message(locked_until):
+    time_remaining = int((locked_until - timezone.now()).total_seconds()) // 60 + 1
+    return f'Twoje konto jest zablokowane z powodu zbyt wielu nieudanych prób logowania. Spróbuj ponownie za {time_remaining} minut.'
+
+def _ip_locked_message(locked_until):
+    # Blokada adresu IP nie oznacza, że konto (podana nazwa użytkownika) jest zablokowane
+    time_remaining = int((locked_until - timezone.now()).total_seconds()) // 60 + 1
+    return f'Zbyt wiele nieudanych prób logowania z Twojego adresu. Spróbuj ponownie za {time_remaining} minut.'
+
 def register_choice(request):
     return render(request, 'authentication/register_choice.html')
 
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Benchmark: per-request cost of opening database connections.
+
+Replays the request lifecycle Django runs in a worker (``request_started``,
+a few queries, ``request_finished``) with three connection strategies:
+
+* ``CONN_MAX_AGE=0`` - a new connection for every request,
+* persistent connections (``CONN_MAX_AGE`` > 0, optionally with health checks),
+* the psycopg connection pool (PostgreSQL only, needs ``psycopg[pool]``).
+
+Runs against a throw-away test database of the configured backend. The
+difference is largest on PostgreSQL over TCP/TLS (set DATABASE_URL with
+DJANGO_ENVIRONMENT=production); on SQLite opening a connection is cheap
+but still measurable. With the pool, "Connections" counts checkouts from
+the pool rather than new server connections.
+
+Usage:
+    python benchmarks/bench_connections.py [--requests 500] [--queries 3]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.core import signals
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from authentication.models import User
+
+
+def run(requests, queries):
+    """Return per-request latencies (ms) and the number of connections opened"""
+    opened = []
+
+    def count(sender, **kwargs):
+        opened.append(1)
+
+    connection_created.connect(count)
+    latencies = []
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            signals.request_started.send(sender=None)
+            for _ in range(queries):
+                User.objects.filter(pk=1).exists()
+            signals.request_finished.send(sender=None)
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        connection_created.disconnect(count)
+        connection.close()
+    return latencies, len(opened)
+
+
+def configure(max_age, health_checks, pool=False):
+    connection.close()
+    if connection.vendor == 'postgresql':
+        connection.close_pool()
+    connection.settings_dict['CONN_MAX_AGE'] = max_age
+    connection.settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+    options = connection.settings_dict.setdefault('OPTIONS', {})
+    if pool:
+        options['pool'] = {'min_size': 1, 'max_size': 1}
+    else:
+        options.pop('pool', None)
+
+
+def pool_available():
+    if connection.vendor != 'postgresql':
+        return False
+    try:
+        import psycopg_pool  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--queries', type=int, default=3, help='Queries per request')
+    args = parser.parse_args()
+
+    setup_test_environment()
+    if connection.vendor == 'sqlite':
+        # In-memory test databases are never closed, use a file instead
+        connection.settings_dict['TEST']['NAME'] = os.path.join(tempfile.mkdtemp(), 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    original = {
+        'CONN_MAX_AGE': connection.settings_dict.get('CONN_MAX_AGE', 0),
+        'CONN_HEALTH_CHECKS': connection.settings_dict.get('CONN_HEALTH_CHECKS', False),
+        'OPTIONS': dict(connection.settings_dict.get('OPTIONS', {})),
+    }
+    try:
+        User.objects.create_user(username='bench_user', password='x', user_type='patient')
+
+        scenarios = [
+            ('new connection per request', dict(max_age=0, health_checks=False)),
+            ('persistent', dict(max_age=600, health_checks=False)),
+            ('persistent + health checks', dict(max_age=600, health_checks=True)),
+        ]
+        if pool_available():
+            scenarios.append(('psycopg pool', dict(max_age=0, health_checks=False, pool=True)))
+        else:
+            print('psycopg pool: skipped (needs PostgreSQL and psycopg[pool])')
+
+        print(f'Backend: {connection.vendor}, {args.requests} requests x {args.queries} queries')
+        print(f'{"Strategy":<28} {"Connections":>11} {"mean":>8} {"p50":>8} {"p95":>8}')
+        for name, options in scenarios:
+            configure(**options)
+            run(min(20, args.requests), args.queries)  # warm-up
+            latencies, opened = run(args.requests, args.queries)
+            p95 = statistics.quantiles(latencies, n=20)[-1]
+            print(
+                f'{name:<28} {opened:>11} {statistics.mean(latencies):>6.3f}ms '
+                f'{statistics.median(latencies):>6.3f}ms {p95:>6.3f}ms'
+            )
+    finally:
+        configure(original['CONN_MAX_AGE'], original['CONN_HEALTH_CHECKS'])
+        connection.settings_dict['OPTIONS'] = original['OPTIONS']
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
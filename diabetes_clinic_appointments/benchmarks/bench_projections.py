@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""
+Benchmark: bytes transferred per page by list-view queries.
+
+Compares plain ``Appointment.objects`` / ``Patient.objects`` queries (full
+rows) with the ``for_listing()`` / ``for_calendar()`` projections. Runs
+against a throw-away test database filled with synthetic data, so it never
+touches the configured database.
+
+Usage:
+    python benchmarks/bench_projections.py [--patients 50] [--appointments 20]
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment
+
+
+NOTE_PARAGRAPH = (
+    '<p>Pacjent zgłasza okresowe hipoglikemie w godzinach nocnych. '
+    '<strong>HbA1c 7,2%</strong>. Zalecono modyfikację dawki insuliny bazalnej '
+    'oraz kontrolę glikemii o 3:00 przez kolejne 7 dni.</p>'
+)
+
+
+def populate(patients, appointments_per_patient):
+    doctor_user = User.objects.create_user(username='bench_doctor', password='x', user_type='doctor')
+    doctor = Doctor.objects.create(
+        user=doctor_user,
+        license_number='BENCH1',
+        specialization='diabetologist',
+        years_of_experience=10,
+        office_address='ul. Lekarska 1\n00-001 Warszawa',
+        consultation_fee=200,
+        working_hours_start='08:00',
+        working_hours_end='16:00',
+        education='Uniwersytet Medyczny\n' * 10,
+        bio='Specjalista diabetolog. ' * 40,
+    )
+
+    now = timezone.now()
+    batch = []
+    for i in range(patients):
+        user = User.objects.create_user(
+            username=f'bench_patient_{i}', password='x', user_type='patient',
+            first_name='Jan', last_name=f'Kowalski{i}',
+        )
+        patient = Patient.objects.create(
+            user=user,
+            date_of_birth=date(1980, 1, 1),
+            pesel=f'{80010100000 + i:011d}',
+            address='ul. Długa 1/2\n00-001 Warszawa',
+            emergency_contact_name='Anna Kowalska',
+            emergency_contact_phone='600700800',
+            diabetes_type='type2',
+            current_medications='Metformina 1000 mg 2x dziennie\n' * 10,
+            allergies='Penicylina\n' * 5,
+        )
+        for j in range(appointments_per_patient):
+            appointment = Appointment(
+                patient=patient,
+                doctor=doctor,
+                appointment_date=now - timedelta(days=j * 7 + 1),
+                status='completed',
+                reason='Wizyta kontrolna',
+                notes=NOTE_PARAGRAPH * 20,
+            )
+            # bulk_create bypasses save(), compute the stored renderings here
+            appointment.refresh_rendered_notes()
+            batch.append(appointment)
+    Appointment.objects.bulk_create(batch, batch_size=500)
+    return doctor
+
+
+def transferred_bytes(queryset):
+    """Execute the queryset's SQL and sum the size of every returned value"""
+    sql, params = queryset.query.sql_with_params()
+    total = 0
+    rows = 0
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        for row in cursor.fetchall():
+            rows += 1
+            for value in row:
+                if value is None:
+                    continue
+                if isinstance(value, (bytes, memoryview)):
+                    total += len(value)
+                else:
+                    total += len(str(value).encode('utf-8'))
+    return rows, total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--appointments', type=int, default=20, help='Appointments per patient')
+    parser.add_argument('--page-size', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        doctor = populate(args.patients, args.appointments)
+        patient = Patient.objects.first()
+        page = args.page_size
+
+        scenarios = [
+            (
+                'patient_detail history',
+                Appointment.objects.select_related('patient__user', 'doctor__user').filter(doctor=doctor, patient=patient)[:page],
+                Appointment.objects.for_listing().filter(doctor=doctor, patient=patient)[:page],
+            ),
+            (
+                'patient history',
+                Appointment.objects.select_related('doctor__user').filter(patient=patient)[:page],
+                Appointment.objects.for_listing().filter(patient=patient)[:page],
+            ),
+            (
+                'doctor appointments (all)',
+                Appointment.objects.select_related('patient__user').filter(doctor=doctor),
+                Appointment.objects.for_listing().filter(doctor=doctor),
+            ),
+            (
+                'time slot lookup',
+                Appointment.objects.filter(doctor=doctor),
+                Appointment.objects.for_calendar().filter(doctor=doctor),
+            ),
+            (
+                'patients list',
+                Patient.objects.select_related('user').filter(appointments__doctor=doctor).distinct(),
+                Patient.objects.for_listing().filter(appointments__doctor=doctor).distinct(),
+            ),
+        ]
+
+        print(f'{"Query":<26} {"Rows":>6} {"Before":>12} {"After":>12} {"Saved":>7}')
+        for name, before, after in scenarios:
+            rows, before_bytes = transferred_bytes(before)
+            _, after_bytes = transferred_bytes(after)
+            saved = 100 * (before_bytes - after_bytes) / before_bytes if before_bytes else 0
+            print(f'{name:<26} {rows:>6} {before_bytes:>10} B {after_bytes:>10} B {saved:>6.1f}%')
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+if __name__ == '__main__':
+    main()
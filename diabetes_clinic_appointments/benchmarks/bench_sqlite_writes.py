@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+"""
+Benchmark: SQLite under concurrent writes from several worker processes.
+
+Simulates Gunicorn workers sharing one SQLite file during a booking burst:
+every process repeatedly lists appointments (reads) and books slots (a
+transaction that checks the slot and inserts the appointment), through
+Django's SQLite backend. Compares the default connection options with the
+tuned ``SQLITE_OPTIONS`` of the settings (WAL, synchronous=NORMAL, busy
+timeout, IMMEDIATE transactions, mmap, cache size).
+
+Reports operations per second, "database is locked" failures and latency
+percentiles per configuration. Uses throw-away files in a temp directory.
+
+Usage:
+    python benchmarks/bench_sqlite_writes.py [--processes 8] [--duration 10] [--write-ratio 0.3]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.sqlite3.base import DatabaseWrapper
+
+
+DOCTORS = 20
+SLOTS_PER_DAY = 36
+
+SCHEMA = [
+    'CREATE TABLE appointment (id INTEGER PRIMARY KEY, doctor_id INTEGER, patient_id INTEGER, '
+    'slot INTEGER, reason TEXT, created_at REAL)',
+    'CREATE INDEX appointment_doctor_slot ON appointment (doctor_id, slot)',
+    'CREATE TABLE patient (id INTEGER PRIMARY KEY, last_booking_at REAL)',
+]
+
+
+def connect(path, options):
+    return DatabaseWrapper({
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': dict(options),
+        'TIME_ZONE': None,
+        'CONN_MAX_AGE': None,
+        'CONN_HEALTH_CHECKS': False,
+        'AUTOCOMMIT': True,
+        'ATOMIC_REQUESTS': False,
+    }, alias='bench')
+
+
+def prepare(path, options):
+    connection = connect(path, options)
+    with connection.cursor() as cursor:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+        cursor.executemany('INSERT INTO patient (id) VALUES (%s)', [(i,) for i in range(1000)])
+    connection.close()
+
+
+def list_appointments(connection, rng):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT id, patient_id, slot, reason FROM appointment WHERE doctor_id = %s ORDER BY slot DESC LIMIT 50',
+            [rng.randrange(DOCTORS)],
+        )
+        cursor.fetchall()
+
+
+def book(connection, rng):
+    """Check a slot and book it in one transaction, like transaction.atomic()"""
+    doctor, slot, patient = rng.randrange(DOCTORS), rng.randrange(SLOTS_PER_DAY * 30), rng.randrange(1000)
+    connection.set_autocommit(False, force_begin_transaction_with_broken_autocommit=True)
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM appointment WHERE doctor_id = %s AND slot = %s', [doctor, slot])
+            if cursor.fetchone()[0] == 0:
+                cursor.execute(
+                    'INSERT INTO appointment (doctor_id, patient_id, slot, reason, created_at) '
+                    'VALUES (%s, %s, %s, %s, %s)',
+                    [doctor, patient, slot, 'Wizyta kontrolna', time.time()],
+                )
+                cursor.execute('UPDATE patient SET last_booking_at = %s WHERE id = %s', [time.time(), patient])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    finally:
+        connection.set_autocommit(True)
+
+
+def worker(path, options, deadline, write_ratio, seed, queue):
+    rng = random.Random(seed)
+    connection = connect(path, options)
+    latencies = {'read': [], 'write': []}
+    locked = 0
+    while time.monotonic() < deadline:
+        kind = 'write' if rng.random() < write_ratio else 'read'
+        start = time.perf_counter()
+        try:
+            if kind == 'write':
+                book(connection, rng)
+            else:
+                list_appointments(connection, rng)
+        except OperationalError as e:
+            if 'locked' not in str(e) and 'busy' not in str(e):
+                raise
+            locked += 1
+            continue
+        latencies[kind].append((time.perf_counter() - start) * 1000)
+    connection.close()
+    queue.put((latencies, locked))
+
+
+def run(name, options, args):
+    directory = tempfile.mkdtemp(prefix='bench_sqlite_')
+    path = os.path.join(directory, 'db.sqlite3')
+    try:
+        prepare(path, options)
+        queue = multiprocessing.Queue()
+        deadline = time.monotonic() + args.duration
+        processes = [
+            multiprocessing.Process(target=worker, args=(path, options, deadline, args.write_ratio, seed, queue))
+            for seed in range(args.processes)
+        ]
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    locked = sum(result[1] for result in results)
+    for kind in ('read', 'write'):
+        latencies = [value for result in results for value in result[0][kind]] or [0]
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(
+            f'{name:<9} {kind:<6} {len(latencies) / args.duration:>9.1f} '
+            f'{statistics.median(latencies):>8.2f}ms {p95:>8.2f}ms {max(latencies):>9.2f}ms'
+        )
+    print(f'{name:<9} "database is locked": {locked}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--processes', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per configuration')
+    parser.add_argument('--write-ratio', type=float, default=0.3, help='Share of booking transactions')
+    args = parser.parse_args()
+
+    configurations = [
+        # Django's defaults: rollback journal, synchronous=FULL, 5 s timeout, deferred transactions
+        ('default', {}),
+        ('tuned', settings.SQLITE_OPTIONS),
+    ]
+    print(f'{args.processes} processes, {args.write_ratio:.0%} writes, {args.duration:.0f} s per configuration')
+    print(f'{"Config":<9} {"Op":<6} {"ops/s":>9} {"p50":>10} {"p95":>10} {"max":>11}')
+    for name, options in configurations:
+        run(name, options, args)
+
+
+if __name__ == '__main__':
+    main()
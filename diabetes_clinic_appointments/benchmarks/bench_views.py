@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+"""
+Benchmark: latency, queries and memory of the hot views on generated datasets.
+
+For every dataset size a throw-away test database is filled with
+``manage.py generate_load_data`` and each scenario is requested through the
+full middleware stack (Django test client):
+
+* slots            - free time slots of a doctor (patient, JSON API)
+* book             - booking a single appointment (patient, POST)
+* book_series      - booking a weekly series (patient, POST)
+* patients_list    - the doctor's patient list
+* patient_detail   - the card of the doctor's patient with the longest history
+* doctor_dashboard, patient_dashboard
+* login            - POST of valid credentials (includes password hashing)
+* risk_assessment  - diabetes risk prediction for a completed visit (POST)
+
+The busiest doctor and their most frequent patient are used. Writes are
+rolled back after every request, so each iteration sees the same data.
+
+Reports latency percentiles (timed iterations), the number of queries and
+the tracemalloc peak (one extra, separately instrumented iteration each) and
+saves the results as JSON. ``--compare`` prints the change against a
+previous results file, e.g. from another commit.
+
+Usage:
+    python benchmarks/bench_views.py [--sizes small,medium] [--iterations 30] \\
+        [--scenarios slots,book] [--output results.json] [--compare old.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from datetime import time as day_time
+from io import StringIO
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointment
+from doctors.models import Doctor
+from patients.models import Patient
+
+
+PASSWORD = 'bench12345'
+
+SIZES = {
+    'small': {'doctors': 10, 'patients': 1000, 'appointments': 20000},
+    'medium': {'doctors': 50, 'patients': 10000, 'appointments': 200000},
+    'large': {'doctors': 200, 'patients': 50000, 'appointments': 1000000},
+}
+
+WRAPPER_SQL = {'BEGIN', 'ROLLBACK'}
+
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+
+
+def free_weekday(days_ahead):
+    """A weekday beyond the generated bookings (they end two months ahead)"""
+    day = timezone.localdate() + timedelta(days=days_ahead)
+    while day.weekday() >= 5:
+        day += timedelta(days=1)
+    return day
+
+
+def build_scenarios(doctor, patient):
+    """Return {name: (user, method, url, data, expected status)}"""
+    completed = Appointment.objects.filter(doctor=doctor, status='completed').order_by('-appointment_date').first()
+    booking_day = free_weekday(90)
+    booking = {
+        'doctor': doctor.id,
+        'appointment_date': datetime.combine(booking_day, day_time(10)).strftime('%Y-%m-%d %H:%M'),
+        'reason': 'Wizyta kontrolna',
+    }
+    series = dict(
+        booking,
+        is_recurring='on',
+        recurrence_pattern='weekly',
+        recurrence_end_date=(booking_day + timedelta(weeks=8)).isoformat(),
+    )
+    prediction = {
+        'pregnancies': 1, 'glucose': 148, 'blood_pressure': 72, 'skin_thickness': 35,
+        'insulin': 120, 'bmi': 33.6, 'diabetes_pedigree': 0.627, 'age': 50,
+    }
+    slots_url = reverse('appointments:available_time_slots') + (
+        f'?doctor_id={doctor.id}&date={free_weekday(7).isoformat()}'
+    )
+    return {
+        'slots': (patient.user, 'get', slots_url, None, 200),
+        'book': (patient.user, 'post', reverse('appointments:book_appointment'), booking, 302),
+        'book_series': (patient.user, 'post', reverse('appointments:book_appointment'), series, 302),
+        'patients_list': (doctor.user, 'get', reverse('doctors:patients_list'), None, 200),
+        'patient_detail': (doctor.user, 'get', reverse('doctors:patient_detail', args=[patient.id]), None, 200),
+        'doctor_dashboard': (doctor.user, 'get', reverse('doctors:dashboard'), None, 200),
+        'patient_dashboard': (patient.user, 'get', reverse('patients:dashboard'), None, 200),
+        'login': (None, 'post', reverse('authentication:login'),
+                  {'username': doctor.user.username, 'password': PASSWORD}, 302),
+        'risk_assessment': (doctor.user, 'post',
+                            reverse('doctors:diabetes_risk_assessment', args=[completed.id]), prediction, 200),
+    }
+
+
+def request(client, method, url, data):
+    """Send one request and undo whatever it wrote"""
+    with transaction.atomic():
+        response = getattr(client, method)(url, data) if data is not None else getattr(client, method)(url)
+        transaction.set_rollback(True)
+    return response
+
+
+def run_scenario(name, scenario, iterations, warmup):
+    user, method, url, data, expected = scenario
+    client = Client()
+    if user is not None:
+        client.force_login(user)
+    cache.clear()
+
+    def send():
+        if user is None:
+            # Every login starts without a session, like a new visitor
+            client.cookies.clear()
+        return request(client, method, url, data)
+
+    for _ in range(warmup):
+        response = send()
+        if response.status_code != expected:
+            raise RuntimeError(f'{name}: HTTP {response.status_code}, expected {expected}')
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        send()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # request_started clears the query log, so it must start empty
+    reset_queries()
+    with CaptureQueriesContext(connection) as queries:
+        send()
+    # Transaction statements of the rollback wrapper are not the view's queries
+    query_count = sum(1 for query in queries.captured_queries if query['sql'] not in WRAPPER_SQL)
+
+    tracemalloc.start()
+    send()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'scenario': name,
+        'iterations': iterations,
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentiles[94], 3),
+        'p99_ms': round(percentiles[98], 3),
+        'max_ms': round(max(latencies), 3),
+        'queries': query_count,
+        'peak_memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run_size(size, args):
+    volumes = SIZES[size]
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        start = time.monotonic()
+        call_command(
+            'generate_load_data',
+            '--doctors', str(volumes['doctors']),
+            '--patients', str(volumes['patients']),
+            '--appointments', str(volumes['appointments']),
+            '--seed', str(args.seed),
+            '--password', PASSWORD,
+            stdout=StringIO(),
+        )
+        print(f'\n{size}: {volumes} (generated in {time.monotonic() - start:.0f} s)')
+
+        doctor = Doctor.objects.select_related('user').annotate(n=Count('appointments')).order_by('-n').first()
+        patient = Patient.objects.select_related('user').filter(appointments__doctor=doctor).annotate(
+            n=Count('appointments')
+        ).order_by('-n').first()
+        scenarios = build_scenarios(doctor, patient)
+
+        print(f'{"Scenario":<18} {"p50":>9} {"p95":>9} {"p99":>9} {"queries":>8} {"peak mem":>10}')
+        results = []
+        for name in args.scenarios or scenarios:
+            result = run_scenario(name, scenarios[name], args.iterations, args.warmup)
+            result.update(size=size, volumes=volumes)
+            results.append(result)
+            print(
+                f'{name:<18} {result["p50_ms"]:>7.2f}ms {result["p95_ms"]:>7.2f}ms {result["p99_ms"]:>7.2f}ms '
+                f'{result["queries"]:>8} {result["peak_memory_kb"]:>8.0f}KB'
+            )
+        return results
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r['size'], r['scenario']): r for r in baseline['results']}
+    print(f'\nCompared with {baseline_path} (commit {baseline.get("commit")}):')
+    print(f'{"Size":<8} {"Scenario":<18} {"p50":>17} {"queries":>12}')
+    for result in results:
+        old = previous.get((result['size'], result['scenario']))
+        if old is None:
+            continue
+        change = (result['p50_ms'] - old['p50_ms']) / old['p50_ms'] * 100 if old['p50_ms'] else 0
+        print(
+            f'{result["size"]:<8} {result["scenario"]:<18} {old["p50_ms"]:>6.2f} -> {result["p50_ms"]:>6.2f}ms '
+            f'({change:+.0f}%) {old["queries"]:>4} -> {result["queries"]:<4}'
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--sizes', default='small,medium', help=f'Comma-separated: {", ".join(SIZES)}')
+    parser.add_argument('--scenarios', default='', help='Comma-separated subset of scenarios (default: all)')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated data')
+    parser.add_argument('--output', help='JSON results file (default: benchmarks/results/views-<commit>.json)')
+    parser.add_argument('--compare', help='Previous JSON results file to compare with')
+    args = parser.parse_args()
+    args.scenarios = [name for name in args.scenarios.split(',') if name]
+
+    commit = git_commit()
+    setup_test_environment(debug=False)
+    try:
+        results = []
+        for size in args.sizes.split(','):
+            results += run_size(size, args)
+    finally:
+        teardown_test_environment()
+
+    output = args.output or os.path.join(RESULTS_DIR, f'views-{commit or "unknown"}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({
+            'commit': commit,
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'results': results,
+        }, f, indent=2)
+    print(f'\nResults saved to {output}')
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+"""
+Benchmark: throughput of Gunicorn worker profiles under mixed load.
+
+Starts the application with each profile (see deploy/systemd/profiles) on a
+local port and runs, for a fixed time:
+
+* fast clients - free slot lookups (60%), status updates (20%) and
+  attachment downloads (20%) over keep-alive connections,
+* slow clients - status updates whose body arrives a byte at a time,
+  like uploads over a poor connection, occupying whatever serves them.
+
+Reports completed requests per second and latency percentiles of the fast
+clients. With sync workers every slow client holds a whole worker; gthread
+loses one thread and uvicorn only a coroutine.
+
+Runs against the configured database: log in as a doctor with at least one
+appointment and attachment (e.g. from create_sample_data.py). Needs gunicorn
+(and uvicorn + uvicorn-worker for the asgi profile).
+
+Usage:
+    python benchmarks/bench_workers.py --username dr_kowalski --password ... \\
+        [--profiles sync,gthread,asgi] [--duration 20] [--clients 32] [--slow-clients 6]
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode
+
+import django
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.urls import reverse
+from django.utils import timezone
+
+from appointments.models import Appointment, AppointmentAttachment
+
+
+HOST = '127.0.0.1'
+
+PROFILES = {
+    'sync': ['--workers', '3', 'clinic_system.wsgi:application'],
+    'gthread': ['--worker-class', 'gthread', '--workers', '3', '--threads', '8', 'clinic_system.wsgi:application'],
+    'asgi': ['--worker-class', 'uvicorn_worker.UvicornWorker', '--workers', '3', 'clinic_system.asgi:application'],
+}
+
+
+def start_server(profile, port):
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'{HOST}:{port}', '--timeout', '60', *PROFILES[profile]]
+    process = subprocess.Popen(command, cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'{profile}: gunicorn exited with code {process.returncode}')
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{profile}: server did not start')
+
+
+def login(port, username, password):
+    """Return the Cookie header and CSRF token of a logged-in session"""
+    connection = http.client.HTTPConnection(HOST, port, timeout=30)
+    url = reverse('authentication:login')
+    connection.request('GET', url)
+    response = connection.getresponse()
+    response.read()
+    cookies = SimpleCookie()
+    for header in response.headers.get_all('Set-Cookie', []):
+        cookies.load(header)
+    csrf = cookies['csrftoken'].value
+
+    body = urlencode({'username': username, 'password': password, 'csrfmiddlewaretoken': csrf})
+    connection.request('POST', url, body, {
+        'Content-Type': 'application/x-www-form-urlencoded',
+        'Cookie': f'csrftoken={csrf}',
+    })
+    response = connection.getresponse()
+    response.read()
+    for header in response.headers.get_all('Set-Cookie', []):
+        cookies.load(header)
+    if 'sessionid' not in cookies:
+        raise RuntimeError('Login failed - check --username/--password')
+    connection.close()
+    return f'csrftoken={csrf}; sessionid={cookies["sessionid"].value}', csrf
+
+
+def build_requests(doctor, appointment, attachment, session):
+    cookie, csrf = session
+    day = timezone.localdate(appointment.appointment_date).isoformat()
+    slots = reverse('appointments:available_time_slots') + '?' + urlencode({'doctor_id': doctor.id, 'date': day})
+    status = reverse('doctors:update_appointment_status', args=[appointment.id])
+    # Re-sending the current status leaves the data unchanged
+    status_body = json.dumps({'status': appointment.status})
+    headers = {'Cookie': cookie}
+    post_headers = {'Cookie': cookie, 'X-CSRFToken': csrf, 'Content-Type': 'application/json'}
+
+    mix = [('slots', 'GET', slots, None, headers)] * 6 + [('status', 'POST', status, status_body, post_headers)] * 2
+    if attachment is not None:
+        download = reverse('doctors:download_attachment', args=[attachment.id])
+        mix += [('download', 'GET', download, None, headers)] * 2
+    return mix, (status, status_body, post_headers)
+
+
+def fast_client(port, mix, deadline, results, errors):
+    connection = http.client.HTTPConnection(HOST, port, timeout=60)
+    while time.monotonic() < deadline:
+        name, method, url, body, headers = random.choice(mix)
+        start = time.perf_counter()
+        try:
+            connection.request(method, url, body, headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors[name] += 1
+                continue
+        except (OSError, http.client.HTTPException):
+            errors[name] += 1
+            connection.close()
+            connection = http.client.HTTPConnection(HOST, port, timeout=60)
+            continue
+        results[name].append((time.perf_counter() - start) * 1000)
+    connection.close()
+
+
+def slow_client(port, status_request, deadline, byte_delay):
+    url, body, headers = status_request
+    body = body.encode()
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((HOST, port), timeout=60) as sock:
+                head = f'POST {url} HTTP/1.1\r\nHost: {HOST}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n'
+                head += ''.join(f'{key}: {value}\r\n' for key, value in headers.items())
+                sock.sendall((head + '\r\n').encode())
+                for byte in body:
+                    sock.sendall(bytes([byte]))
+                    time.sleep(byte_delay)
+                while sock.recv(65536):
+                    pass
+        except OSError:
+            time.sleep(0.1)
+
+
+def run_profile(profile, args, targets):
+    process = start_server(profile, args.port)
+    try:
+        session = login(args.port, args.username, args.password)
+        mix, status_request = build_requests(*targets, session)
+        results = defaultdict(list)
+        errors = defaultdict(int)
+        deadline = time.monotonic() + args.duration
+        threads = [
+            threading.Thread(target=fast_client, args=(args.port, mix, deadline, results, errors))
+            for _ in range(args.clients)
+        ] + [
+            threading.Thread(target=slow_client, args=(args.port, status_request, deadline, args.byte_delay))
+            for _ in range(args.slow_clients)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--username', required=True, help='Doctor account used by the clients')
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--profiles', default='sync,gthread,asgi')
+    parser.add_argument('--duration', type=float, default=20, help='Seconds per profile')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--slow-clients', type=int, default=6)
+    parser.add_argument('--byte-delay', type=float, default=0.2, help='Seconds between body bytes of slow clients')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    appointment = Appointment.objects.select_related('doctor').filter(
+        doctor__user__username=args.username
+    ).order_by('-appointment_date').first()
+    if appointment is None:
+        parser.error(f'{args.username} has no appointments')
+    attachment = AppointmentAttachment.objects.filter(appointment__doctor=appointment.doctor).first()
+    targets = (appointment.doctor, appointment, attachment)
+
+    print(f'{args.clients} clients + {args.slow_clients} slow clients, {args.duration:.0f} s per profile')
+    print(f'{"Profile":<9} {"Request":<9} {"req/s":>8} {"p50":>9} {"p95":>9} {"errors":>7}')
+    for profile in args.profiles.split(','):
+        try:
+            results, errors = run_profile(profile, args, targets)
+        except RuntimeError as e:
+            print(f'{profile:<9} skipped: {e}')
+            continue
+        total = sum(len(latencies) for latencies in results.values())
+        print(f'{profile:<9} {"all":<9} {total / args.duration:>8.1f}')
+        for name in sorted(set(results) | set(errors)):
+            latencies = results[name] or [0]
+            p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+            print(
+                f'{"":<9} {name:<9} {len(results[name]) / args.duration:>8.1f} '
+                f'{statistics.median(latencies):>7.1f}ms {p95:>7.1f}ms {errors[name]:>7}'
+            )
+
+
+if __name__ == '__main__':
+    main()
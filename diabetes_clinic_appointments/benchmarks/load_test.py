@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+"""
+Load test: scripted clinic traffic against a running server over HTTP.
+
+Virtual users (an asyncio HTTP/1.1 keep-alive client with cookies and CSRF
+tokens, no extra dependencies) replay three kinds of sessions:
+
+* patient  - login, dashboard, booking form, probing free slots of the
+             popular doctors for the next two weeks and booking the first
+             free slot, upcoming appointments, logout
+* doctor   - login, dashboard, pages of the patient list, patient cards and
+             the notes of their visits, logout
+* admin    - login, superadmin dashboard, user list filtered by type and
+             searched by name, user details, logout
+
+The number of concurrent users grows in stages (``--users 5,10,20,40``);
+throughput stops growing when the server saturates. Start the server with
+``deploy/scripts/load_test_stack.sh``, which also writes the accounts file.
+
+Reports throughput, error rate and latency percentiles per stage, the
+latency per URL name (from the ``urls.py`` files), and the booking outcome:
+successful bookings, conflicts (slot taken by another patient between the
+probe and the POST) and other rejections. ``--check-db`` (with the stack's
+``stack.env`` sourced) counts double bookings that reached the database.
+
+Usage:
+    python benchmarks/load_test.py --accounts /tmp/clinic-load/accounts.json \\
+        [--url http://127.0.0.1:8800] [--users 5,10,20,40] [--stage-duration 30] \\
+        [--mix patient=70,doctor=25,admin=5] [--think 0.5] [--output results.json] [--check-db]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import statistics
+import sys
+import time
+from collections import Counter, defaultdict
+from datetime import timedelta
+from functools import lru_cache
+from urllib.parse import urlencode, urlsplit
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'clinic_system.settings')
+django.setup()
+
+from django.urls import Resolver404, resolve, reverse
+from django.utils import timezone
+
+
+CONFLICT_MESSAGE = 'jest już zajęty'
+
+DOCTOR_OPTION = re.compile(r'<option value="(\d+)"')
+PAGE_LINK = re.compile(r'\?page=(\d+)')
+
+
+def link_pattern(name):
+    """Regex of the links to a URL that takes one numeric id"""
+    return re.compile(re.escape(reverse(name, args=[987654321])).replace('987654321', r'\d+'))
+
+
+PATIENT_LINK = link_pattern('doctors:patient_detail')
+NOTES_LINK = link_pattern('doctors:view_appointment_notes')
+USER_LINK = link_pattern('superadmin:user_detail')
+
+
+def url_name(path):
+    """Group requests by the name of the matching URL pattern"""
+    return _resolve_name(urlsplit(path).path)
+
+
+@lru_cache(maxsize=None)
+def _resolve_name(path):
+    try:
+        return resolve(path).view_name
+    except Resolver404:
+        return path
+
+
+def percentile(values, n):
+    if len(values) < 2:
+        return values[0] if values else 0
+    return statistics.quantiles(values, n=100)[n - 1]
+
+
+class Response:
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    @property
+    def text(self):
+        return self.body.decode('utf-8', 'replace')
+
+    def header(self, name):
+        return self.headers.get(name.lower(), '')
+
+
+class RequestFailed(Exception):
+    pass
+
+
+class Stats:
+    """Samples of the running stage and of the whole test"""
+
+    def __init__(self):
+        self.stage = None
+        self.stages = defaultdict(lambda: {'latencies': [], 'errors': 0})
+        self.urls = defaultdict(lambda: {'latencies': [], 'errors': 0})
+        self.error_kinds = Counter()
+        self.bookings = Counter()
+
+    def record(self, path, latency, error=None):
+        name = url_name(path)
+        for bucket in (self.stages[self.stage], self.urls[name]):
+            bucket['latencies'].append(latency)
+            if error:
+                bucket['errors'] += 1
+        if error:
+            self.error_kinds[f'{name}: {error}'] += 1
+
+
+class Browser:
+    """One virtual user's HTTP/1.1 keep-alive connection and cookies"""
+
+    def __init__(self, host, port, stats, timeout):
+        self.host = host
+        self.port = port
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = {}
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path, expect=(200,)):
+        return await self.request('GET', path, expect=expect)
+
+    async def post(self, path, data, expect=(302,)):
+        return await self.request('POST', path, data, expect)
+
+    async def request(self, method, path, data=None, expect=(200,)):
+        start = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(self._send(method, path, data), self.timeout)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError) as e:
+            await self.close()
+            self.stats.record(path, (time.perf_counter() - start) * 1000, type(e).__name__)
+            raise RequestFailed(f'{method} {path}: {e!r}')
+        error = None if response.status in expect else f'HTTP {response.status}'
+        self.stats.record(path, (time.perf_counter() - start) * 1000, error)
+        if error:
+            raise RequestFailed(f'{method} {path}: {error}')
+        return response
+
+    async def _send(self, method, path, data):
+        body = urlencode(data).encode() if data is not None else b''
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'User-Agent: clinic-load-test',
+        ]
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{name}={value}' for name, value in self.cookies.items()))
+        if method == 'POST':
+            lines += [
+                'Content-Type: application/x-www-form-urlencoded',
+                f'Content-Length: {len(body)}',
+                f'X-CSRFToken: {self.cookies.get("csrftoken", "")}',
+            ]
+        message = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+        # The server may have closed an idle kept-alive connection: retry once
+        for attempt in range(2):
+            reused = self.writer is not None
+            if not reused:
+                self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                self.writer.write(message)
+                await self.writer.drain()
+                status_line = await self.reader.readline()
+                if not status_line:
+                    raise ConnectionResetError('connection closed by the server')
+            except (ConnectionError, asyncio.IncompleteReadError):
+                await self.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            return await self._read_response(status_line)
+
+    async def _read_response(self, status_line):
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                self._store_cookie(value)
+            else:
+                headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    # Trailers end with an empty line
+                    while (await self.reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await self.reader.readexactly(int(headers['content-length']))
+        elif status in (204, 304):
+            body = b''
+        else:
+            body = await self.reader.read()
+            headers['connection'] = 'close'
+
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return Response(status, headers, body)
+
+    def _store_cookie(self, value):
+        pair, *attributes = value.split(';')
+        name, _, cookie = pair.strip().partition('=')
+        expired = any(a.strip().lower() in ('max-age=0', 'max-age=-1') for a in attributes)
+        if expired:
+            self.cookies.pop(name, None)
+        else:
+            self.cookies[name] = cookie
+
+
+class VirtualUser:
+
+    def __init__(self, kind, browser, accounts, rng, think):
+        self.kind = kind
+        self.browser = browser
+        self.accounts = accounts
+        self.rng = rng
+        self.think_time = think
+
+    async def think(self):
+        if self.think_time:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.think_time)
+
+    async def login(self, username):
+        login_url = reverse('authentication:login')
+        await self.browser.get(login_url)
+        await self.think()
+        await self.browser.post(login_url, {'username': username, 'password': self.accounts['password']})
+
+    async def logout(self):
+        await self.browser.get(reverse('authentication:logout'), expect=(302,))
+        self.browser.cookies.clear()
+
+    async def run(self, stop):
+        session = getattr(self, f'{self.kind}_session')
+        while not stop.is_set():
+            try:
+                await session()
+            except RequestFailed:
+                # Start over with a fresh session, like a user who gave up
+                self.browser.cookies.clear()
+                await asyncio.sleep(0.1)
+            await self.think()
+
+    async def patient_session(self):
+        browser, rng = self.browser, self.rng
+        await self.login(rng.choice(self.accounts['patients']))
+        await browser.get(reverse('patients:dashboard'))
+        await self.think()
+
+        book_url = reverse('appointments:book_appointment')
+        form = await browser.get(book_url)
+        doctors = sorted({int(id) for id in DOCTOR_OPTION.findall(form.text)})
+        if not doctors:
+            raise RequestFailed('no doctors on the booking form')
+        # A few doctors get most of the demand, which creates contention
+        doctor = rng.choices(doctors, weights=[1 / (rank + 1) for rank in range(len(doctors))])[0]
+
+        for probe in range(4):
+            await self.think()
+            day = timezone.localdate() + timedelta(days=rng.randint(1, 14))
+            if day.weekday() >= 5:
+                continue
+            slots_url = reverse('appointments:available_time_slots') + '?' + urlencode(
+                {'doctor_id': doctor, 'date': day.isoformat()}
+            )
+            slots = json.loads((await browser.get(slots_url)).body).get('available_slots', [])
+            if slots:
+                break
+        else:
+            self.browser.stats.bookings['no_free_slot'] += 1
+            await self.logout()
+            return
+
+        # Most patients take one of the earliest free slots
+        slot = rng.choice(slots[:3])
+        await self.think()
+        response = await browser.post(book_url, {
+            'doctor': doctor,
+            'appointment_date': f'{day.isoformat()} {slot}',
+            'reason': 'Wizyta kontrolna',
+        }, expect=(200, 302))
+        stats = self.browser.stats
+        stats.bookings['attempts'] += 1
+        if response.status == 302 and response.header('location').startswith(
+            reverse('appointments:patient_history')
+        ):
+            stats.bookings['booked'] += 1
+        elif CONFLICT_MESSAGE in response.text:
+            stats.bookings['conflicts'] += 1
+        else:
+            stats.bookings['rejected'] += 1
+
+        await browser.get(reverse('appointments:upcoming'))
+        await self.think()
+        await self.logout()
+
+    async def doctor_session(self):
+        browser, rng = self.browser, self.rng
+        await self.login(rng.choice(self.accounts['doctors']))
+        await browser.get(reverse('doctors:dashboard'))
+        await self.think()
+
+        list_url = reverse('doctors:patients_list')
+        page = await browser.get(list_url)
+        pages = [int(number) for number in PAGE_LINK.findall(page.text)]
+        if pages and rng.random() < 0.5:
+            await self.think()
+            page = await browser.get(f'{list_url}?page={rng.randint(1, max(pages))}')
+
+        patients = sorted(set(PATIENT_LINK.findall(page.text)))
+        for path in rng.sample(patients, min(3, len(patients))):
+            await self.think()
+            card = await browser.get(path)
+            notes = sorted(set(NOTES_LINK.findall(card.text)))
+            for notes_path in rng.sample(notes, min(2, len(notes))):
+                await self.think()
+                await browser.get(notes_path)
+        await self.logout()
+
+    async def admin_session(self):
+        browser, rng = self.browser, self.rng
+        await self.login(self.accounts['superadmin'])
+        await browser.get(reverse('superadmin:dashboard'))
+        await self.think()
+
+        list_url = reverse('superadmin:user_list')
+        await browser.get(f'{list_url}?type=doctor')
+        await self.think()
+        username = rng.choice(self.accounts['patients'] + self.accounts['doctors'])
+        found = await browser.get(f'{list_url}?' + urlencode({'search': username}))
+        for path in sorted(set(USER_LINK.findall(found.text)))[:2]:
+            await self.think()
+            await browser.get(path)
+        await self.logout()
+
+
+async def run_stage(users, args, accounts, stats, rng):
+    stats.stage = users
+    stop = asyncio.Event()
+    kinds = list(args.mix)
+    weights = [args.mix[kind] for kind in kinds]
+    virtual_users = [
+        VirtualUser(
+            rng.choices(kinds, weights)[0],
+            Browser(args.host, args.port, stats, args.timeout),
+            accounts, random.Random(rng.random()), args.think,
+        )
+        for _ in range(users)
+    ]
+    tasks = [asyncio.create_task(user.run(stop)) for user in virtual_users]
+    await asyncio.sleep(args.stage_duration)
+    stop.set()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    for user in virtual_users:
+        await user.browser.close()
+
+
+def summarize(stats, duration):
+    stages = []
+    for users, bucket in stats.stages.items():
+        latencies = bucket['latencies']
+        stages.append({
+            'users': users,
+            'requests': len(latencies),
+            'rps': round(len(latencies) / duration, 1),
+            'error_rate': round(bucket['errors'] / len(latencies), 4) if latencies else 0,
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+        })
+    urls = []
+    for name, bucket in sorted(stats.urls.items(), key=lambda item: -len(item[1]['latencies'])):
+        latencies = bucket['latencies']
+        urls.append({
+            'url_name': name,
+            'requests': len(latencies),
+            'errors': bucket['errors'],
+            'p50_ms': round(percentile(latencies, 50), 1),
+            'p95_ms': round(percentile(latencies, 95), 1),
+            'p99_ms': round(percentile(latencies, 99), 1),
+            'max_ms': round(max(latencies), 1),
+        })
+    return stages, urls
+
+
+def count_double_bookings(since):
+    """
+    Appointments booked during the test that the booking form should have
+    rejected: another scheduled visit created before them falls into their
+    conflict window (15 minutes before to 45 minutes after).
+    """
+    from appointments.models import Appointment
+
+    overlapping = 0
+    booked = Appointment.objects.filter(created_at__gte=since, status='scheduled')
+    for appointment in booked.only('id', 'doctor_id', 'appointment_date', 'created_at'):
+        start = appointment.appointment_date
+        overlapping += Appointment.objects.filter(
+            doctor_id=appointment.doctor_id,
+            status='scheduled',
+            appointment_date__range=(start - timedelta(minutes=15), start + timedelta(minutes=45)),
+            created_at__lt=appointment.created_at,
+        ).exists()
+    return booked.count(), overlapping
+
+
+def report(stages, urls, stats, args):
+    print(f'\n{"Users":>6} {"requests":>9} {"req/s":>8} {"errors":>7} {"p50":>9} {"p95":>9}')
+    for stage in stages:
+        print(
+            f'{stage["users"]:>6} {stage["requests"]:>9} {stage["rps"]:>8.1f} {stage["error_rate"]:>7.1%} '
+            f'{stage["p50_ms"]:>7.1f}ms {stage["p95_ms"]:>7.1f}ms'
+        )
+    best = max(stages, key=lambda stage: stage['rps'])
+    if best is stages[-1]:
+        print(f'Throughput still grows at {best["users"]} users ({best["rps"]} req/s): add more users')
+    else:
+        print(f'Saturation: {best["rps"]} req/s at {best["users"]} users (more users only add latency)')
+
+    print(f'\n{"URL name":<42} {"requests":>9} {"errors":>7} {"p50":>9} {"p95":>9} {"p99":>9}')
+    for url in urls:
+        print(
+            f'{url["url_name"]:<42} {url["requests"]:>9} {url["errors"]:>7} '
+            f'{url["p50_ms"]:>7.1f}ms {url["p95_ms"]:>7.1f}ms {url["p99_ms"]:>7.1f}ms'
+        )
+
+    bookings = stats.bookings
+    attempts = bookings['attempts']
+    print(
+        f'\nBookings: {attempts} attempts, {bookings["booked"]} booked, '
+        f'{bookings["conflicts"]} conflicts ({bookings["conflicts"] / attempts if attempts else 0:.1%}), '
+        f'{bookings["rejected"]} rejected otherwise, {bookings["no_free_slot"]} sessions without a free slot'
+    )
+    if stats.error_kinds:
+        print('\nErrors:')
+        for error, count in stats.error_kinds.most_common(10):
+            print(f'  {count:>6}  {error}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--accounts', required=True, help='accounts.json written by load_test_stack.sh')
+    parser.add_argument('--url', default='http://127.0.0.1:8800')
+    parser.add_argument('--users', default='5,10,20,40', help='Concurrent users of the consecutive stages')
+    parser.add_argument('--stage-duration', type=float, default=30, help='Seconds per stage')
+    parser.add_argument('--mix', default='patient=70,doctor=25,admin=5', help='Weights of the session kinds')
+    parser.add_argument('--think', type=float, default=0.5, help='Mean pause between steps in seconds')
+    parser.add_argument('--timeout', type=float, default=30, help='Request timeout in seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='JSON results file')
+    parser.add_argument('--check-db', action='store_true', help='Count double bookings in the stack database')
+    args = parser.parse_args()
+
+    url = urlsplit(args.url)
+    args.host, args.port = url.hostname, url.port or 80
+    args.mix = {kind: int(weight) for kind, weight in (item.split('=') for item in args.mix.split(','))}
+    with open(args.accounts) as f:
+        accounts = json.load(f)
+
+    stats = Stats()
+    rng = random.Random(args.seed)
+    started = timezone.now()
+    stages = [int(users) for users in args.users.split(',')]
+    print(f'{args.url}: stages of {args.users} users, {args.stage_duration:.0f} s each, mix {args.mix}')
+    for users in stages:
+        asyncio.run(run_stage(users, args, accounts, stats, rng))
+        print(f'  {users} users: {len(stats.stages[users]["latencies"])} requests')
+
+    stage_results, url_results = summarize(stats, args.stage_duration)
+    report(stage_results, url_results, stats, args)
+
+    results = {
+        'url': args.url,
+        'started': started.isoformat(),
+        'stage_duration': args.stage_duration,
+        'mix': args.mix,
+        'think': args.think,
+        'stages': stage_results,
+        'urls': url_results,
+        'bookings': dict(stats.bookings),
+        'errors': dict(stats.error_kinds),
+    }
+    if args.check_db:
+        booked, overlapping = count_double_bookings(started)
+        print(f'Database: {booked} scheduled appointments booked during the test, {overlapping} double-booked')
+        results['double_bookings'] = overlapping
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'\nResults saved to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
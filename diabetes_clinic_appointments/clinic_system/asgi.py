@@ -2,6 +2,8 @@
 ASGI config for clinic_system project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Served by Gunicorn with uvicorn workers in the ASGI deployment profile
+(deploy/systemd/profiles/asgi.conf).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
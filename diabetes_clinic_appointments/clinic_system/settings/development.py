@@ -19,6 +19,9 @@ DATABASES = {
     }
 }
 
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = replica_database(DATABASE_REPLICA_URL)
+
 # Logging configuration for development (verbose)
 LOGGING = {
     'version': 1,
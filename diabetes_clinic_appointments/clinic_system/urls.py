@@ -20,6 +20,8 @@ from django.shortcuts import redirect
 from django.conf import settings
 from django.conf.urls.static import static
 
+from utilities.metrics import metrics_view
+
 def home_redirect(request):
     return redirect('authentication:login')
 
@@ -32,6 +34,7 @@ urlpatterns = [
     path('appointments/', include('appointments.urls')),
     path('superadmin/', include('superadmin.urls')),
     path('ckeditor/', include('ckeditor_uploader.urls')),
+    path('metrics', metrics_view, name='metrics'),
 ]
 
 # Serve media files in development
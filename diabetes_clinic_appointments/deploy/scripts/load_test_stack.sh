@@ -0,0 +1,115 @@
+#!/bin/bash
+# Local stack for load tests: Gunicorn + production settings + generated data
+#
+# Prepares a throw-away database (SQLite file in the work directory, or the
+# PostgreSQL database given by DATABASE_URL), fills it with
+# `manage.py generate_load_data`, creates a superadmin and starts Gunicorn on
+# 127.0.0.1 without HTTPS. Then run the scenarios from another terminal:
+#
+#   python benchmarks/load_test.py --accounts /tmp/clinic-load/accounts.json
+#
+# Usage:
+#   deploy/scripts/load_test_stack.sh [small|medium|large]
+#
+# Environment:
+#   LOAD_DIR       work directory (default /tmp/clinic-load)
+#   PORT           Gunicorn port (default 8800)
+#   WORKER_CLASS   sync or gthread (default gthread)
+#   WORKERS        worker processes (default: number of CPU cores)
+#   THREADS        threads per gthread worker (default 4)
+#   DATABASE_URL   PostgreSQL instead of SQLite (the database is flushed!)
+#   REUSE_DATA=1   skip data generation when the work directory has it
+
+set -e
+
+RED='\033[0;31m'
+GREEN='\033[0;32m'
+NC='\033[0m' # No Color
+
+SIZE="${1:-small}"
+case "$SIZE" in
+    small)  VOLUMES="--doctors 10 --patients 1000 --appointments 20000" ;;
+    medium) VOLUMES="--doctors 50 --patients 10000 --appointments 200000" ;;
+    large)  VOLUMES="--doctors 200 --patients 50000 --appointments 1000000" ;;
+    *)
+        echo -e "${RED}Error: unknown size '$SIZE' (small, medium, large)${NC}"
+        exit 1
+        ;;
+esac
+
+PROJECT_PATH="$(cd "$(dirname "$0")/../.." && pwd)"
+LOAD_DIR="${LOAD_DIR:-/tmp/clinic-load}"
+PORT="${PORT:-8800}"
+WORKER_CLASS="${WORKER_CLASS:-gthread}"
+WORKERS="${WORKERS:-$(nproc 2>/dev/null || echo 2)}"
+THREADS="${THREADS:-4}"
+PASSWORD="loadtest123"
+
+if ! command -v gunicorn > /dev/null; then
+    echo -e "${RED}Error: gunicorn is not installed (pip install -r requirements.txt)${NC}"
+    exit 1
+fi
+
+mkdir -p "$LOAD_DIR"
+cd "$PROJECT_PATH"
+
+# Production settings over plain HTTP on localhost
+export DJANGO_ENVIRONMENT=production
+export SECRET_KEY="${SECRET_KEY:-load-test-$(date +%s)-$RANDOM$RANDOM}"
+export ALLOWED_HOSTS=127.0.0.1,localhost
+export SECURE_SSL_REDIRECT=False
+export ATTACHMENT_DELIVERY=django
+export CACHE_URL="${CACHE_URL:-file://$LOAD_DIR/cache}"
+if [ -z "$DATABASE_URL" ]; then
+    export SQLITE_PATH="$LOAD_DIR/db.sqlite3"
+fi
+
+# Lets `python benchmarks/load_test.py --check-db` reach the same database
+cat > "$LOAD_DIR/stack.env" << EOF
+export DJANGO_ENVIRONMENT=production
+export SECRET_KEY='$SECRET_KEY'
+export ALLOWED_HOSTS=$ALLOWED_HOSTS
+export SECURE_SSL_REDIRECT=False
+export CACHE_URL='$CACHE_URL'
+${DATABASE_URL:+export DATABASE_URL='$DATABASE_URL'}
+${SQLITE_PATH:+export SQLITE_PATH='$SQLITE_PATH'}
+EOF
+
+if [ "$REUSE_DATA" = "1" ] && [ -f "$LOAD_DIR/accounts.json" ]; then
+    echo -e "${GREEN}Reusing data in $LOAD_DIR${NC}"
+else
+    echo -e "${GREEN}Preparing $SIZE dataset in ${DATABASE_URL:+PostgreSQL}${SQLITE_PATH}...${NC}"
+    rm -f "$LOAD_DIR"/db.sqlite3*
+    python manage.py migrate --noinput > /dev/null
+    if [ -n "$DATABASE_URL" ]; then
+        python manage.py flush --noinput
+    fi
+    python manage.py generate_load_data $VOLUMES --password "$PASSWORD"
+
+    DJANGO_SUPERUSER_PASSWORD="$PASSWORD" python manage.py createsuperuser --noinput \
+        --username load_admin --email load_admin@example.com > /dev/null
+    python manage.py shell -c "
+import json
+from authentication.models import User
+accounts = {
+    'password': '$PASSWORD',
+    'superadmin': 'load_admin',
+    'doctors': list(User.objects.filter(username__startswith='load_doctor_').values_list('username', flat=True)),
+    'patients': list(User.objects.filter(username__startswith='load_patient_').values_list('username', flat=True)),
+}
+with open('$LOAD_DIR/accounts.json', 'w') as f:
+    json.dump(accounts, f)
+" > /dev/null
+fi
+
+echo -e "${GREEN}Gunicorn: $WORKERS x $WORKER_CLASS worker(s) on http://127.0.0.1:$PORT${NC}"
+echo "Accounts: $LOAD_DIR/accounts.json"
+exec gunicorn clinic_system.wsgi:application \
+    --worker-class "$WORKER_CLASS" \
+    --workers "$WORKERS" \
+    --threads "$THREADS" \
+    --bind "127.0.0.1:$PORT" \
+    --timeout 60 \
+    --keep-alive 5 \
+    --access-logfile "$LOAD_DIR/access.log" \
+    --error-logfile "$LOAD_DIR/error.log"
@@ -1,4 +1,5 @@
 from django import forms
+from django.conf import settings
 from django.core.exceptions import ValidationError
 from appointments.models import Appointment, AppointmentAttachment, NoteTemplate, DiabetesPrediction
 from doctors.models import Doctor
@@ -36,8 +37,8 @@ class AppointmentNotesForm(forms.ModelForm):
 class AppointmentAttachmentForm(forms.ModelForm):
     """Formularz do przesyłania załączników do wizyty"""
 
-    # Maksymalny rozmiar pliku: 10MB
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB in bytes
+    # Maksymalny rozmiar pliku: 10MB (większe pliki - chunked upload, appointments/chunked.py)
+    MAX_FILE_SIZE = settings.ATTACHMENT_MAX_SIZE
 
     # Dozwolone rozszerzenia plików
     ALLOWED_EXTENSIONS = [
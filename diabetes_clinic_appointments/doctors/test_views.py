@@ -10,6 +10,7 @@ from authentication.models import User
 from patients.models import Patient
 from doctors.models import Doctor
 from appointments.models import Appointment
+from utilities.search import search_patients
 
 
 class DoctorDashboardViewTest(TestCase):
@@ -331,6 +332,23 @@ class DoctorPatientsListViewTest(TestCase):
         self.assertEqual(len(page_obj), 5)
         self.assertFalse(page_obj.has_next())
 
+    def test_patients_list_search_pages_ranked_results(self):
+        """Test search results larger than a page are paged in relevance order"""
+        self.client.login(username='doctor_test', password='testpass123')
+        url = self.patients_list_url + '?search=Patient'
+
+        response = self.client.get(url)
+        self.assertEqual(response.context['sort_by'], 'relevance')
+        self.assertEqual(response.context['total_patients'], 15)
+        first_page = [data['patient'].id for data in response.context['page_obj']]
+        self.assertEqual(len(first_page), 10)
+
+        response = self.client.get(url + '&page=2')
+        second_page = [data['patient'].id for data in response.context['page_obj']]
+        self.assertEqual(len(second_page), 5)
+
+        self.assertEqual(first_page + second_page, search_patients(self.doctor, 'Patient', limit=None))
+
     def test_patients_list_shows_statistics(self):
         """Test patients list shows appointment statistics"""
         self.client.login(username='doctor_test', password='testpass123')
@@ -339,6 +357,14 @@ class DoctorPatientsListViewTest(TestCase):
         self.assertEqual(response.context['total_patients'], 15)
         self.assertIn('patients_with_scheduled', response.context)
 
+    def test_patients_list_search(self):
+        """Test patients list search by name"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.patients_list_url + '?search=Test12')
+
+        self.assertEqual(response.context['total_patients'], 1)
+        self.assertEqual(response.context['page_obj'][0]['patient'], self.patients[12])
+
 
 class DoctorPatientDetailViewTest(TestCase):
     """Test patient_detail view for doctors"""
@@ -435,6 +461,17 @@ class DoctorPatientDetailViewTest(TestCase):
 
         self.assertEqual(response.status_code, 404)
 
+    def test_patient_detail_shows_notes_excerpt(self):
+        """Test appointment history shows the stored plain-text notes preview"""
+        self.appointment.notes = '<p>Glikemia <strong>w normie</strong></p>'
+        self.appointment.save()
+        self.client.login(username='doctor_test', password='testpass123')
+
+        response = self.client.get(self.patient_detail_url)
+
+        self.assertContains(response, 'Glikemia w normie')
+        self.assertNotContains(response, '<strong>w normie</strong>', html=False)
+
     def test_patient_detail_shows_appointment_history(self):
         """Test view shows appointment history"""
         self.client.login(username='doctor_test', password='testpass123')
@@ -484,3 +521,163 @@ class DoctorPatientDetailViewTest(TestCase):
         self.assertIn('cancelled_appointments', response.context)
         self.assertIn('scheduled_appointments', response.context)
         self.assertGreaterEqual(response.context['total_appointments'], 3)
+
+
+class DoctorNotesSearchViewTest(TestCase):
+    """Test notes_search view for doctors"""
+
+    def setUp(self):
+        self.client = Client()
+        self.search_url = reverse('doctors:notes_search')
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University'
+        )
+
+        self.patient_user = User.objects.create_user(
+            username='patient_test',
+            password='testpass123',
+            user_type='patient',
+            first_name='Jan',
+            last_name='Kowalski'
+        )
+        self.patient = Patient.objects.create(
+            user=self.patient_user,
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1'
+        )
+
+        self.appointment = Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() - timedelta(days=10),
+            reason='Kontrola',
+            status='completed',
+            notes='<p>Zalecono zmianę dawki <em>insuliny</em>.</p>'
+        )
+
+    def test_notes_search_requires_doctor(self):
+        """Test view redirects patients"""
+        self.client.login(username='patient_test', password='testpass123')
+        response = self.client.get(self.search_url)
+
+        self.assertRedirects(response, reverse('authentication:login'))
+
+    def test_notes_search_without_query(self):
+        """Test empty search shows no results"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.search_url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, 'doctors/notes_search.html')
+        self.assertEqual(response.context['total_notes'], 0)
+
+    def test_notes_search_returns_highlighted_results(self):
+        """Test matching notes are listed with highlighted snippets"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.search_url + '?q=insulin')
+
+        self.assertEqual(response.context['total_notes'], 1)
+        result = response.context['page_obj'][0]
+        self.assertEqual(result['appointment'], self.appointment)
+        self.assertContains(response, '<mark>insuliny</mark>', html=False)
+
+
+class DoctorTemplateContentViewTest(TestCase):
+    """Test get_template_content AJAX endpoint"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from appointments.models import NoteTemplate
+
+        cache.clear()
+        self.client = Client()
+
+        self.doctor_user = User.objects.create_user(
+            username='doctor_test',
+            password='testpass123',
+            user_type='doctor'
+        )
+        self.doctor = Doctor.objects.create(
+            user=self.doctor_user,
+            license_number='DOC123',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University'
+        )
+        self.template = NoteTemplate.objects.create(
+            name='Kontrola',
+            content='<p>Treść szablonu</p>',
+            category='checkup'
+        )
+        self.url = reverse('doctors:get_template_content', kwargs={'template_id': self.template.id})
+
+    def test_returns_content_with_etag(self):
+        """Test content is returned with an ETag and revalidation headers"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['content'], '<p>Treść szablonu</p>')
+        self.assertTrue(response['ETag'].startswith('"'))
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_if_none_match_returns_304(self):
+        """Test matching If-None-Match returns 304 until the template changes"""
+        self.client.login(username='doctor_test', password='testpass123')
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.template.content = '<p>Nowa treść</p>'
+        self.template.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_inactive_template_returns_404(self):
+        """Test inactive templates are not served"""
+        self.template.is_active = False
+        self.template.save()
+        self.client.login(username='doctor_test', password='testpass123')
+
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_patient_forbidden(self):
+        """Test non-doctors get 403"""
+        User.objects.create_user(username='patient_test', password='testpass123', user_type='patient')
+        self.client.login(username='patient_test', password='testpass123')
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_list_templates_uses_catalog(self):
+        """Test template list is rendered from the cached catalog"""
+        self.client.login(username='doctor_test', password='testpass123')
+        response = self.client.get(reverse('doctors:list_templates'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Kontrola')
+        self.assertContains(response, 'Treść szablonu')
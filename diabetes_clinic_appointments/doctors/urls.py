@@ -14,12 +14,21 @@ urlpatterns = [
     path('appointment/<int:appointment_id>/notes/view/', views.view_appointment_notes, name='view_appointment_notes'),
     path('attachment/<int:attachment_id>/delete/', views.delete_attachment, name='delete_attachment'),
     path('attachment/<int:attachment_id>/download/', views.download_attachment, name='download_attachment'),
+    path('attachment/<int:attachment_id>/thumbnail/', views.attachment_thumbnail, name='attachment_thumbnail'),
+    path('appointment/<int:appointment_id>/attachments.zip', views.download_appointment_attachments, name='download_appointment_attachments'),
+    path('patient/<int:patient_id>/attachments.zip', views.download_patient_attachments, name='download_patient_attachments'),
+    # Chunked attachment uploads
+    path('appointment/<int:appointment_id>/uploads/', views.start_attachment_upload, name='start_attachment_upload'),
+    path('uploads/<uuid:upload_id>/', views.attachment_upload, name='attachment_upload'),
+    path('uploads/<uuid:upload_id>/finish/', views.finish_attachment_upload, name='finish_attachment_upload'),
     # Note Templates
     path('templates/', views.list_templates, name='list_templates'),
     path('templates/create/', views.create_template, name='create_template'),
     path('templates/<int:template_id>/edit/', views.edit_template, name='edit_template'),
     path('templates/<int:template_id>/delete/', views.delete_template, name='delete_template'),
     path('templates/<int:template_id>/content/', views.get_template_content, name='get_template_content'),
+    # Notes search
+    path('notes/search/', views.notes_search, name='notes_search'),
     # Diabetes Risk Assessment
     path('appointment/<int:appointment_id>/diabetes-risk/', views.diabetes_risk_assessment, name='diabetes_risk_assessment'),
     # AJAX endpoints
@@ -1,13 +1,50 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.conf import settings
 from django.utils import timezone
 from django.core.paginator import Paginator
-from django.db.models import Count, Q
-from django.http import Http404, JsonResponse, FileResponse, HttpResponseForbidden
+from django.db.models import Count, Exists, F, Max, Min, OuterRef, Q
+from django.db.models.functions import Lower
+from django.http import Http404, JsonResponse, HttpResponseForbidden
+from django.utils.cache import get_conditional_response
+from django.views.decorators.cache import cache_control
+from utilities.search import SearchResults, filter_matches, search_notes, search_templates
+from utilities.replica import use_replica
+from utilities.view_cache import cache_response
+from utilities.metrics import Histogram, register_collector
 from .forms import AppointmentNotesForm, AppointmentAttachmentForm, NoteTemplateForm, DoctorProfileForm, DiabetesPredictionForm
+import functools
+import hashlib
 import sys
 import os
+import time
+
+ML_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'ml')
+
+predictor_duration = Histogram(
+    'clinic_predictor_duration_seconds', 'Diabetes risk prediction time, model loading included'
+)
+
+
+@functools.lru_cache(maxsize=4)
+def _model_version(path, mtime):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:12]
+
+
+@register_collector
+def predictor_model_info():
+    """Wersja (skrót sha256 pliku) wdrożonego modelu cukrzycy dla /metrics"""
+    path = os.path.join(ML_DIR, 'diabetes_model.pkl')
+    try:
+        version = _model_version(path, os.path.getmtime(path))
+    except OSError:
+        return []
+    return [('clinic_predictor_model_info', 'Deployed diabetes model (sha256 prefix of the model file)',
+             [({'version': version}, 1)])]
+
 
 @login_required
 def dashboard(request):
@@ -42,7 +79,7 @@ def dashboard(request):
     ).values('patient').distinct().count()
 
     # Next appointment
-    next_appointment = Appointment.objects.filter(
+    next_appointment = Appointment.objects.for_listing().filter(
         doctor=doctor,
         status='scheduled',
         appointment_date__gte=timezone.now()
@@ -70,11 +107,11 @@ def upcoming_appointments(request):
     # Get upcoming appointments (scheduled, in future)
     from appointments.models import Appointment
 
-    appointments = Appointment.objects.filter(
+    appointments = Appointment.objects.for_listing().filter(
         doctor=doctor,
         status='scheduled',
         appointment_date__gte=timezone.now()
-    ).select_related('patient__user').order_by('appointment_date')
+    ).order_by('appointment_date')
 
     # Group appointments by date for better display
     appointments_by_date = {}
@@ -85,11 +122,11 @@ def upcoming_appointments(request):
         appointments_by_date[date_key].append(appointment)
 
     # Get today's appointments separately
-    today_appointments = Appointment.objects.filter(
+    today_appointments = Appointment.objects.for_listing().filter(
         doctor=doctor,
         status='scheduled',
         appointment_date__date=timezone.now().date()
-    ).select_related('patient__user').order_by('appointment_date')
+    ).order_by('appointment_date')
 
     # Statistics
     total_upcoming = appointments.count()
@@ -113,6 +150,7 @@ def upcoming_appointments(request):
 
 
 @login_required
+@use_replica
 def patients_list(request):
     """FR-13: Spis pacjentów lekarza"""
     if not request.user.is_doctor():
@@ -124,103 +162,56 @@ def patients_list(request):
     from appointments.models import Appointment
     from patients.models import Patient
 
-    # Get sort parameters
-    sort_by = request.GET.get('sort', 'name')
-    sort_order = request.GET.get('order', 'asc')
-
     # Get filter parameters
     diabetes_filter = request.GET.get('diabetes_type', '')
     appointment_status_filter = request.GET.get('appointment_status', '')
     search_query = request.GET.get('search', '')
 
-    # Get unique patients with their appointment statistics
-    patients_query = Patient.objects.filter(
-        appointments__doctor=doctor
-    )
+    # Get sort parameters (search results default to relevance order)
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'name')
+    sort_order = request.GET.get('order', 'asc')
 
-    # Apply search filter
-    if search_query:
-        patients_query = patients_query.filter(
-            Q(user__first_name__icontains=search_query) |
-            Q(user__last_name__icontains=search_query) |
-            Q(user__email__icontains=search_query)
-        )
+    # Patients who had appointments with this doctor
+    patients_query = Patient.objects.for_listing().filter(
+        Exists(Appointment.objects.filter(patient=OuterRef('pk'), doctor=doctor))
+    )
 
     # Apply diabetes type filter
     if diabetes_filter:
         patients_query = patients_query.filter(diabetes_type=diabetes_filter)
 
-    patients_with_appointments = patients_query.annotate(
-        total_appointments=Count('appointments', filter=Q(appointments__doctor=doctor)),
-        scheduled_appointments=Count(
-            'appointments',
-            filter=Q(appointments__doctor=doctor, appointments__status='scheduled', appointments__appointment_date__gte=timezone.now())
-        ),
-        completed_appointments=Count(
-            'appointments',
-            filter=Q(appointments__doctor=doctor, appointments__status='completed')
-        )
-    ).select_related('user').distinct()
-
-    # Get last and next appointments for each patient
-    patients_data = []
-    for patient in patients_with_appointments:
-        last_appointment = Appointment.objects.filter(
-            doctor=doctor,
-            patient=patient,
-            status='completed'
-        ).order_by('-appointment_date').first()
-
-        next_appointment = Appointment.objects.filter(
-            doctor=doctor,
-            patient=patient,
-            status='scheduled',
-            appointment_date__gte=timezone.now()
-        ).order_by('appointment_date').first()
-
-        patient_info = {
-            'patient': patient,
-            'total_appointments': patient.total_appointments,
-            'scheduled_appointments': patient.scheduled_appointments,
-            'completed_appointments': patient.completed_appointments,
-            'last_appointment': last_appointment,
-            'next_appointment': next_appointment,
-        }
-
-        # Apply appointment status filter
-        if appointment_status_filter == 'with_upcoming':
-            if patient.scheduled_appointments > 0:
-                patients_data.append(patient_info)
-        elif appointment_status_filter == 'without_upcoming':
-            if patient.scheduled_appointments == 0:
-                patients_data.append(patient_info)
-        else:
-            patients_data.append(patient_info)
-
-    # Apply sorting to patients_data
-    reverse = (sort_order == 'desc')
+    # Apply appointment status filter
+    upcoming = Exists(Appointment.objects.filter(
+        patient=OuterRef('pk'),
+        doctor=doctor,
+        status='scheduled',
+        appointment_date__gte=timezone.now()
+    ))
+    if appointment_status_filter == 'with_upcoming':
+        patients_query = patients_query.filter(upcoming)
+    elif appointment_status_filter == 'without_upcoming':
+        patients_query = patients_query.filter(~upcoming)
+
+    # Apply search filter (indexed search, see utilities.search): matches are
+    # a subquery, and in relevance order only the current page is ranked
+    matching = patients_query
+    if search_query:
+        matching = filter_matches(patients_query, search_query, user_field='user')
 
-    if sort_by == 'name':
-        patients_data.sort(key=lambda x: (x['patient'].user.last_name.lower(), x['patient'].user.first_name.lower()), reverse=reverse)
-    elif sort_by == 'email':
-        patients_data.sort(key=lambda x: x['patient'].user.email.lower(), reverse=reverse)
-    elif sort_by == 'diabetes_type':
-        patients_data.sort(key=lambda x: x['patient'].diabetes_type or '', reverse=reverse)
-    elif sort_by == 'total_appointments':
-        patients_data.sort(key=lambda x: x['total_appointments'], reverse=reverse)
-    elif sort_by == 'last_appointment':
-        patients_data.sort(key=lambda x: (x['last_appointment'].appointment_date if x['last_appointment'] else timezone.datetime.min.replace(tzinfo=timezone.get_current_timezone())), reverse=reverse)
-    elif sort_by == 'next_appointment':
-        patients_data.sort(key=lambda x: (x['next_appointment'].appointment_date if x['next_appointment'] else timezone.datetime.max.replace(tzinfo=timezone.get_current_timezone())), reverse=reverse)
+    if sort_by == 'relevance' and search_query:
+        patients = SearchResults(patients_query, search_query, user_field='user')
+    else:
+        patients = _sorted_patients(matching, doctor, sort_by, sort_order == 'desc')
 
     # Pagination
-    paginator = Paginator(patients_data, 10)  # 10 patients per page
+    paginator = Paginator(patients, 10)  # 10 patients per page
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
+    page_obj.object_list = _patient_rows(doctor, list(page_obj.object_list))
 
     # Statistics
-    total_patients = len(patients_data)
-    patients_with_scheduled = sum(1 for p in patients_data if p['scheduled_appointments'] > 0)
+    total_patients = paginator.count
+    patients_with_scheduled = matching.filter(upcoming).count()
 
     # Build filter params string for pagination and sorting
     filter_params = ''
@@ -247,7 +238,91 @@ def patients_list(request):
     return render(request, 'doctors/patients_list.html', context)
 
 
+def _sorted_patients(patients, doctor, sort_by, descending):
+    """Sortowanie listy pacjentów w bazie danych"""
+    def direction(expression):
+        return expression.desc() if descending else expression.asc()
+
+    mine = Q(appointments__doctor=doctor)
+
+    if sort_by == 'name':
+        keys = [direction(Lower('user__last_name')), direction(Lower('user__first_name'))]
+    elif sort_by == 'email':
+        keys = [direction(Lower('user__email'))]
+    elif sort_by == 'diabetes_type':
+        keys = [direction(F('diabetes_type'))]
+    elif sort_by == 'total_appointments':
+        patients = patients.annotate(total_appointments=Count('appointments', filter=mine))
+        keys = [direction(F('total_appointments'))]
+    elif sort_by == 'last_appointment':
+        patients = patients.annotate(last_appointment_date=Max(
+            'appointments__appointment_date', filter=mine & Q(appointments__status='completed')
+        ))
+        # Patients without a completed appointment count as the oldest
+        keys = [F('last_appointment_date').desc(nulls_last=True) if descending
+                else F('last_appointment_date').asc(nulls_first=True)]
+    elif sort_by == 'next_appointment':
+        patients = patients.annotate(next_appointment_date=Min(
+            'appointments__appointment_date',
+            filter=mine & Q(appointments__status='scheduled', appointments__appointment_date__gte=timezone.now())
+        ))
+        # Patients without an upcoming appointment count as the latest
+        keys = [F('next_appointment_date').desc(nulls_first=True) if descending
+                else F('next_appointment_date').asc(nulls_last=True)]
+    else:
+        keys = []
+
+    return patients.order_by(*keys, 'id')
+
+
+def _patient_rows(doctor, patients):
+    """Statystyki wizyt pacjentów z jednej strony listy"""
+    from appointments.models import Appointment
+    from patients.models import Patient
+
+    now = timezone.now()
+    mine = Q(appointments__doctor=doctor)
+    counts = {
+        row['id']: row
+        for row in Patient.objects.filter(id__in=[patient.id for patient in patients]).annotate(
+            total_appointments=Count('appointments', filter=mine),
+            scheduled_appointments=Count(
+                'appointments',
+                filter=mine & Q(appointments__status='scheduled', appointments__appointment_date__gte=now)
+            ),
+            completed_appointments=Count('appointments', filter=mine & Q(appointments__status='completed')),
+        ).values('id', 'total_appointments', 'scheduled_appointments', 'completed_appointments')
+    }
+
+    # Get last and next appointments for each patient
+    rows = []
+    for patient in patients:
+        last_appointment = Appointment.objects.for_listing().filter(
+            doctor=doctor,
+            patient=patient,
+            status='completed'
+        ).order_by('-appointment_date').first()
+
+        next_appointment = Appointment.objects.for_listing().filter(
+            doctor=doctor,
+            patient=patient,
+            status='scheduled',
+            appointment_date__gte=now
+        ).order_by('appointment_date').first()
+
+        rows.append({
+            'patient': patient,
+            'total_appointments': counts[patient.id]['total_appointments'],
+            'scheduled_appointments': counts[patient.id]['scheduled_appointments'],
+            'completed_appointments': counts[patient.id]['completed_appointments'],
+            'last_appointment': last_appointment,
+            'next_appointment': next_appointment,
+        })
+    return rows
+
+
 @login_required
+@use_replica
 def patient_detail(request, patient_id):
     """FR-14: Podejrzenie karty pacjenta przez lekarza"""
     if not request.user.is_doctor():
@@ -259,7 +334,7 @@ def patient_detail(request, patient_id):
     from appointments.models import Appointment
     from patients.models import Patient
 
-    patient = get_object_or_404(Patient, id=patient_id)
+    patient = get_object_or_404(Patient.objects.for_detail(), id=patient_id)
 
     # Verify doctor has access to this patient (had appointments together)
     has_access = Appointment.objects.filter(
@@ -278,7 +353,7 @@ def patient_detail(request, patient_id):
     status_filter = request.GET.get('status', '')
 
     # Get appointment history for this patient-doctor combination
-    appointments_history = Appointment.objects.filter(
+    appointments_history = Appointment.objects.for_listing().filter(
         doctor=doctor,
         patient=patient
     )
@@ -335,7 +410,7 @@ def patient_detail(request, patient_id):
 
     # Get appointments with ML predictions for the Tests tab
     from appointments.models import DiabetesPrediction
-    appointments_with_predictions = Appointment.objects.filter(
+    appointments_with_predictions = Appointment.objects.for_listing().filter(
         doctor=doctor,
         patient=patient,
         diabetes_prediction__isnull=False
@@ -373,7 +448,7 @@ def edit_appointment_notes(request, appointment_id):
     # Get appointment and verify doctor has access
     from appointments.models import Appointment, AppointmentAttachment
 
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(Appointment.objects.for_detail(), id=appointment_id)
 
     # Verify this appointment belongs to this doctor
     if appointment.doctor != doctor:
@@ -422,9 +497,9 @@ def edit_appointment_notes(request, appointment_id):
     # Get existing attachments
     attachments = appointment.attachments.all()
 
-    # Get available note templates
-    from appointments.models import NoteTemplate
-    templates = NoteTemplate.objects.filter(is_active=True).order_by('category', 'name')
+    # Get available note templates (cached catalog, without content)
+    from appointments.catalog import get_templates
+    templates = get_templates()
 
     # Pass return_to parameter to template
     return_to = request.GET.get('return_to', 'patient_detail')
@@ -435,6 +510,8 @@ def edit_appointment_notes(request, appointment_id):
         'form': form,
         'attachment_form': attachment_form,
         'attachments': attachments,
+        'attachment_chunk_size': settings.ATTACHMENT_CHUNK_SIZE,
+        'attachment_imaging_max_mb': settings.ATTACHMENT_IMAGING_MAX_SIZE // (1024 * 1024),
         'templates': templates,
         'patient': appointment.patient,
         'return_to': return_to,
@@ -454,7 +531,7 @@ def view_appointment_notes(request, appointment_id):
     # Get appointment and verify doctor has access
     from appointments.models import Appointment
 
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(Appointment.objects.for_detail(), id=appointment_id)
 
     # Verify this appointment belongs to this doctor
     if appointment.doctor != doctor:
@@ -493,11 +570,9 @@ def delete_attachment(request, attachment_id):
         appointment_id = attachment.appointment.id
         filename = attachment.filename
 
-        # Delete the file from storage
-        if attachment.file:
-            attachment.file.delete(save=False)
-
-        # Delete the database record
+        # Delete the database record; the stored file may be shared with other
+        # attachments and is removed by gc_attachments once unreferenced
+        # (legacy, not content-addressed files right away - see storage.py)
         attachment.delete()
 
         messages.success(request, f'Załącznik "{filename}" został usunięty.')
@@ -516,37 +591,264 @@ def delete_attachment(request, attachment_id):
 
 
 @login_required
-def download_attachment(request, attachment_id):
-    """Widok do pobierania załącznika"""
-    if not request.user.is_doctor():
+async def download_attachment(request, attachment_id):
+    """Widok do pobierania załącznika (asynchroniczny - nie blokuje workera ASGI)"""
+    user = await request.auser()
+    if not user.is_doctor():
         return HttpResponseForbidden("Nie masz uprawnień do wykonania tej akcji.")
 
-    doctor = request.user.doctor_profile
-
     from appointments.models import AppointmentAttachment
 
-    attachment = get_object_or_404(AppointmentAttachment, id=attachment_id)
+    attachment = await aget_object_or_404(
+        AppointmentAttachment.objects.select_related('appointment__doctor'), id=attachment_id
+    )
 
     # Verify doctor has access to this appointment
-    if attachment.appointment.doctor != doctor:
+    if attachment.appointment.doctor.user_id != user.pk:
         return HttpResponseForbidden("Nie masz uprawnień do pobrania tego załącznika.")
 
-    # Serve the file
+    # PDFs and images can be opened in the browser (?inline=1), e.g. by its
+    # PDF viewer, which then fetches large scans with Range requests
+    # (never SVG, which may carry scripts)
+    inline = (
+        request.GET.get('inline') == '1'
+        and (attachment.is_pdf or attachment.is_image)
+        and attachment.file_extension != '.svg'
+    )
+
+    # Serve the file (or delegate sending it to nginx/Apache)
+    from appointments.delivery import serve_attachment
+
     try:
-        response = FileResponse(attachment.file.open('rb'))
-        response['Content-Type'] = 'application/octet-stream'
-        response['Content-Disposition'] = f'attachment; filename="{attachment.filename}"'
-        return response
+        return await sync_to_async(serve_attachment)(request, attachment, as_attachment=not inline)
     except Exception as e:
         messages.error(request, f'Błąd podczas pobierania pliku: {str(e)}')
         return redirect('doctors:edit_appointment_notes', appointment_id=attachment.appointment.id)
 
 
+# Fields needed to put an attachment into a ZIP export
+ZIP_EXPORT_FIELDS = ('id', 'file', 'original_name', 'file_size', 'uploaded_at', 'appointment__appointment_date')
+
+
+@login_required
+@use_replica
+def download_appointment_attachments(request, appointment_id):
+    """Widok do pobierania wszystkich załączników wizyty jako archiwum ZIP"""
+    if not request.user.is_doctor():
+        return HttpResponseForbidden("Nie masz uprawnień do wykonania tej akcji.")
+
+    doctor = request.user.doctor_profile
+
+    from appointments.models import Appointment
+    from appointments.archive import appointment_entries, zip_response
+    from appointments.delivery import stream_for_asgi
+    from django.utils.text import slugify
+
+    appointment = get_object_or_404(Appointment.objects.select_related('patient__user'), id=appointment_id)
+
+    if appointment.doctor_id != doctor.id:
+        return HttpResponseForbidden("Nie masz uprawnień do pobrania tych załączników.")
+
+    attachments = appointment.attachments.select_related('appointment').only(*ZIP_EXPORT_FIELDS).order_by('uploaded_at')
+    if not attachments.exists():
+        messages.info(request, 'Ta wizyta nie ma załączników.')
+        return redirect('doctors:view_appointment_notes', appointment_id=appointment.id)
+
+    # The archive is built while it is sent - see appointments/archive.py
+    last_name = slugify(appointment.patient.user.last_name, allow_unicode=True) or 'pacjent'
+    filename = f'zalaczniki_{last_name}_{timezone.localtime(appointment.appointment_date):%Y-%m-%d}.zip'
+    return stream_for_asgi(request, zip_response(appointment_entries(attachments.iterator()), filename))
+
+
+@login_required
+@use_replica
+def download_patient_attachments(request, patient_id):
+    """Widok do pobierania załączników ze wszystkich wizyt pacjenta jako archiwum ZIP"""
+    if not request.user.is_doctor():
+        return HttpResponseForbidden("Nie masz uprawnień do wykonania tej akcji.")
+
+    doctor = request.user.doctor_profile
+
+    from appointments.models import AppointmentAttachment
+    from appointments.archive import patient_entries, zip_response
+    from appointments.delivery import stream_for_asgi
+    from patients.models import Patient
+    from django.utils.text import slugify
+
+    patient = get_object_or_404(Patient.objects.select_related('user'), id=patient_id)
+
+    # Only attachments from this doctor's appointments with the patient
+    attachments = AppointmentAttachment.objects.filter(
+        appointment__doctor=doctor,
+        appointment__patient=patient
+    ).select_related('appointment').only(*ZIP_EXPORT_FIELDS).order_by('appointment__appointment_date', 'uploaded_at')
+
+    if not attachments.exists():
+        messages.info(request, 'Brak załączników do pobrania.')
+        return redirect('doctors:patient_detail', patient_id=patient.id)
+
+    last_name = slugify(patient.user.last_name, allow_unicode=True) or 'pacjent'
+    filename = f'zalaczniki_{last_name}_{timezone.localdate():%Y-%m-%d}.zip'
+    return stream_for_asgi(request, zip_response(patient_entries(attachments.iterator()), filename))
+
+
+@login_required
+def attachment_thumbnail(request, attachment_id):
+    """Widok zwracający miniaturę załącznika (zdjęcie, pierwsza strona PDF)"""
+    if not request.user.is_doctor():
+        return HttpResponseForbidden("Nie masz uprawnień do wykonania tej akcji.")
+
+    from appointments.models import AppointmentAttachment
+
+    attachment = get_object_or_404(
+        AppointmentAttachment.objects.select_related('appointment'),
+        id=attachment_id,
+        has_thumbnail=True,
+    )
+
+    if attachment.appointment.doctor_id != request.user.doctor_profile.id:
+        return HttpResponseForbidden("Nie masz uprawnień do pobrania tego załącznika.")
+
+    from appointments.delivery import serve_thumbnail
+    return serve_thumbnail(request, attachment)
+
+
+def _upload_error_response(error):
+    """JSON response for a rejected chunked upload request"""
+    data = {'success': False, 'error': error.message, 'aborted': error.abort}
+    if error.offset is not None:
+        data['offset'] = error.offset
+    response = JsonResponse(data, status=error.status)
+    if error.offset is not None:
+        response['Upload-Offset'] = error.offset
+    return response
+
+
+@login_required
+def start_attachment_upload(request, appointment_id):
+    """AJAX endpoint rozpoczynający przesyłanie załącznika w częściach"""
+    if not request.user.is_doctor():
+        return JsonResponse({'success': False, 'error': 'Brak uprawnień'}, status=403)
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Metoda nie dozwolona'}, status=405)
+
+    doctor = request.user.doctor_profile
+
+    from appointments.models import Appointment
+    appointment = get_object_or_404(Appointment.objects.only('id', 'doctor_id'), id=appointment_id)
+
+    if appointment.doctor_id != doctor.id:
+        return JsonResponse({'success': False, 'error': 'Brak uprawnień do tej wizyty'}, status=403)
+
+    import json
+    try:
+        data = json.loads(request.body)
+        filename = str(data['filename'])
+        size = int(data['size'])
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Nieprawidłowe dane'}, status=400)
+
+    from appointments.chunked import UploadError, start_upload
+
+    try:
+        upload = start_upload(
+            appointment, doctor, filename, size,
+            file_type=data.get('file_type', 'other'),
+            description=data.get('description', ''),
+        )
+    except UploadError as e:
+        return _upload_error_response(e)
+
+    return JsonResponse({
+        'success': True,
+        'upload_id': str(upload.id),
+        'offset': 0,
+        'chunk_size': settings.ATTACHMENT_CHUNK_SIZE,
+    }, status=201)
+
+
+@login_required
+def attachment_upload(request, upload_id):
+    """
+    AJAX endpoint dla przesyłanego załącznika:
+    GET - liczba odebranych bajtów (wznowienie), PUT - kolejna część
+    (nagłówek Upload-Offset), DELETE - anulowanie
+    """
+    if not request.user.is_doctor():
+        return JsonResponse({'success': False, 'error': 'Brak uprawnień'}, status=403)
+
+    from appointments.models import AttachmentUpload
+    from appointments.chunked import UploadError, abort_upload, current_offset, write_chunk
+
+    upload = get_object_or_404(AttachmentUpload, id=upload_id, uploaded_by=request.user.doctor_profile)
+
+    if request.method == 'GET':
+        offset = current_offset(upload)
+        response = JsonResponse({'success': True, 'offset': offset, 'size': upload.size})
+        response['Upload-Offset'] = offset
+        return response
+
+    if request.method == 'DELETE':
+        abort_upload(upload)
+        return JsonResponse({'success': True})
+
+    if request.method != 'PUT':
+        return JsonResponse({'success': False, 'error': 'Metoda nie dozwolona'}, status=405)
+
+    try:
+        offset = int(request.headers['Upload-Offset'])
+        length = int(request.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return JsonResponse({'success': False, 'error': 'Brak nagłówka Upload-Offset lub Content-Length'}, status=400)
+
+    # The body is streamed into the temporary file, never loaded into memory
+    try:
+        offset = write_chunk(upload, offset, request, length)
+    except UploadError as e:
+        return _upload_error_response(e)
+
+    response = JsonResponse({'success': True, 'offset': offset, 'size': upload.size})
+    response['Upload-Offset'] = offset
+    return response
+
+
+@login_required
+def finish_attachment_upload(request, upload_id):
+    """AJAX endpoint kończący przesyłanie - tworzy załącznik z odebranego pliku"""
+    if not request.user.is_doctor():
+        return JsonResponse({'success': False, 'error': 'Brak uprawnień'}, status=403)
+
+    if request.method != 'POST':
+        return JsonResponse({'success': False, 'error': 'Metoda nie dozwolona'}, status=405)
+
+    from appointments.models import AttachmentUpload
+    from appointments.chunked import UploadError, finish_upload
+
+    upload = get_object_or_404(AttachmentUpload, id=upload_id, uploaded_by=request.user.doctor_profile)
+
+    try:
+        attachment = finish_upload(upload)
+    except UploadError as e:
+        return _upload_error_response(e)
+
+    messages.success(request, f'Załącznik "{attachment.filename}" został dodany pomyślnie!')
+    return JsonResponse({
+        'success': True,
+        'attachment': {
+            'id': attachment.id,
+            'filename': attachment.filename,
+            'file_size': attachment.file_size,
+        },
+    })
+
+
 # ============================================
 # Note Templates Management Views
 # ============================================
 
 @login_required
+@cache_response('user:{user.pk}', 'note_templates')
 def list_templates(request):
     """Lista szablonów notatek"""
     if not request.user.is_doctor():
@@ -554,15 +856,15 @@ def list_templates(request):
 
     doctor = request.user.doctor_profile
 
-    from appointments.models import NoteTemplate
+    from appointments.catalog import get_templates
 
-    # Get all active templates, grouped by category
-    templates = NoteTemplate.objects.filter(is_active=True).order_by('category', 'name')
+    # Get all active templates (cached catalog), grouped by category
+    templates = get_templates()
 
     # Group templates by category
     templates_by_category = {}
     for template in templates:
-        category = template.get_category_display()
+        category = template['category_display']
         if category not in templates_by_category:
             templates_by_category[category] = []
         templates_by_category[category].append(template)
@@ -570,7 +872,7 @@ def list_templates(request):
     context = {
         'doctor': doctor,
         'templates_by_category': templates_by_category,
-        'total_templates': templates.count(),
+        'total_templates': len(templates),
     }
 
     return render(request, 'doctors/list_templates.html', context)
@@ -662,20 +964,83 @@ def delete_template(request, template_id):
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
 def get_template_content(request, template_id):
-    """API endpoint do pobierania treści szablonu (AJAX)"""
+    """API endpoint do pobierania treści szablonu (AJAX, z obsługą ETag / 304)"""
     if not request.user.is_doctor():
         return JsonResponse({'error': 'Brak uprawnień'}, status=403)
 
-    from appointments.models import NoteTemplate
+    from appointments.catalog import get_template
 
-    template = get_object_or_404(NoteTemplate, id=template_id, is_active=True)
+    template = get_template(template_id)
+    if template is None:
+        raise Http404("Szablon nie istnieje.")
 
-    return JsonResponse({
+    # Browser revalidates with If-None-Match and gets 304 while unchanged
+    etag = f'"{template["etag"]}"'
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        return not_modified
+
+    response = JsonResponse({
         'success': True,
-        'content': template.content,
-        'name': template.name,
+        'content': template['content'],
+        'name': template['name'],
     })
+    response['ETag'] = etag
+    return response
+
+
+@login_required
+@use_replica
+def notes_search(request):
+    """Wyszukiwanie pełnotekstowe w notatkach z wizyt lekarza i szablonach"""
+    if not request.user.is_doctor():
+        return redirect('authentication:login')
+
+    doctor = request.user.doctor_profile
+
+    from appointments.models import Appointment, NoteTemplate
+
+    search_query = request.GET.get('q', '').strip()
+
+    note_results = []
+    template_results = []
+    if search_query:
+        # Only the doctor's own appointments are searched
+        note_hits = search_notes(doctor, search_query)
+        appointments = Appointment.objects.for_listing().filter(
+            id__in=[appointment_id for appointment_id, _ in note_hits]
+        ).in_bulk()
+        note_results = [
+            {'appointment': appointments[appointment_id], 'snippet': snippet}
+            for appointment_id, snippet in note_hits
+            if appointment_id in appointments
+        ]
+
+        template_hits = search_templates(search_query)
+        templates = NoteTemplate.objects.defer(
+            'content', 'content_text', 'content_html'
+        ).in_bulk([template_id for template_id, _ in template_hits])
+        template_results = [
+            {'template': templates[template_id], 'snippet': snippet}
+            for template_id, snippet in template_hits
+            if template_id in templates
+        ]
+
+    paginator = Paginator(note_results, 20)
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
+
+    context = {
+        'doctor': doctor,
+        'search_query': search_query,
+        'page_obj': page_obj,
+        'total_notes': len(note_results),
+        'template_results': template_results,
+    }
+
+    return render(request, 'doctors/notes_search.html', context)
 
 
 # ============================================
@@ -683,6 +1048,7 @@ def get_template_content(request, template_id):
 # ============================================
 
 @login_required
+@cache_response('user:{user.pk}')
 def doctor_profile(request):
     """Widok profilu lekarza (tylko do odczytu)"""
     if not request.user.is_doctor():
@@ -740,7 +1106,7 @@ def diabetes_risk_assessment(request, appointment_id):
     # Get appointment and verify doctor has access
     from appointments.models import Appointment, DiabetesPrediction
 
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = get_object_or_404(Appointment.objects.for_detail(), id=appointment_id)
 
     # Verify this appointment belongs to this doctor
     if appointment.doctor != doctor:
@@ -787,13 +1153,15 @@ def diabetes_risk_assessment(request, appointment_id):
             }
 
             # Import and use the predictor
-            sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'ml'))
+            sys.path.insert(0, ML_DIR)
             from diabetes_predictor import DiabetesPredictor
 
             try:
                 # Initialize predictor and get prediction
+                start = time.perf_counter()
                 predictor = DiabetesPredictor()
                 result = predictor.predict_with_interpretation(patient_data)
+                predictor_duration.observe(time.perf_counter() - start)
 
                 # Save prediction
                 prediction = form.save(commit=False)
@@ -844,21 +1212,20 @@ def diabetes_risk_assessment(request, appointment_id):
 
 
 @login_required
-def update_appointment_status(request, appointment_id):
-    """AJAX endpoint do szybkiej zmiany statusu wizyty"""
-    if not request.user.is_doctor():
+async def update_appointment_status(request, appointment_id):
+    """AJAX endpoint do szybkiej zmiany statusu wizyty (asynchroniczny)"""
+    user = await request.auser()
+    if not user.is_doctor():
         return JsonResponse({'success': False, 'error': 'Brak uprawnień'}, status=403)
 
     if request.method != 'POST':
         return JsonResponse({'success': False, 'error': 'Metoda nie dozwolona'}, status=405)
 
-    doctor = request.user.doctor_profile
-
     from appointments.models import Appointment
-    appointment = get_object_or_404(Appointment, id=appointment_id)
+    appointment = await aget_object_or_404(Appointment.objects.for_detail(), id=appointment_id)
 
     # Verify this appointment belongs to this doctor
-    if appointment.doctor != doctor:
+    if appointment.doctor.user_id != user.pk:
         return JsonResponse({'success': False, 'error': 'Brak uprawnień do tej wizyty'}, status=403)
 
     # Get new status from request
@@ -877,7 +1244,7 @@ def update_appointment_status(request, appointment_id):
     # Update status
     old_status = appointment.status
     appointment.status = new_status
-    appointment.save()
+    await appointment.asave()
 
     # Get display name for new status
     status_display = dict(Appointment.STATUS_CHOICES)[new_status]
@@ -1,6 +1,22 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index(sender, using, **kwargs):
+    """
+    Re-create search triggers after migrations.
+
+    SQLite migrations that remake ``authentication_user`` or
+    ``patients_patient`` silently drop the triggers maintaining the FTS index.
+    """
+    from django.db import connections
+    from utilities.search import repair_search_index
+    repair_search_index(connections[using], index='users')
 
 
 class PatientsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'patients'
+
+    def ready(self):
+        post_migrate.connect(repair_search_index, sender=self)
@@ -4,6 +4,22 @@ from django.utils import timezone
 from datetime import timedelta
 from utilities.validators import PESELValidator
 
+
+class PatientQuerySet(models.QuerySet):
+    """Named projections so list views do not load long free-text columns"""
+
+    # Free-text columns shown only on the patient card
+    DETAIL_ONLY_FIELDS = ('address', 'current_medications', 'allergies')
+
+    def for_listing(self):
+        """Patients for tables and lists (name, PESEL, diabetes type)"""
+        return self.select_related('user').defer(*self.DETAIL_ONLY_FIELDS)
+
+    def for_detail(self):
+        """Full patient rows with the user account"""
+        return self.select_related('user')
+
+
 class Patient(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='patient_profile')
     date_of_birth = models.DateField()
@@ -32,7 +48,9 @@ class Patient(models.Model):
     last_cancellation_time = models.DateTimeField(null=True, blank=True, help_text="Czas ostatniego anulowania wizyty")
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    
+
+    objects = PatientQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.first_name} {self.user.last_name} - {self.get_diabetes_type_display()}"
 
@@ -60,11 +78,11 @@ class Patient(models.Model):
 
     def get_last_appointment(self):
         """Zwraca ostatnią wizytę pacjenta"""
-        return self.appointments.filter(status='completed').order_by('-appointment_date').first()
+        return self.appointments.for_listing().filter(status='completed').order_by('-appointment_date').first()
 
     def get_next_appointment(self):
         """Zwraca najbliższą zaplanowaną wizytę"""
-        return self.appointments.filter(
+        return self.appointments.for_listing().filter(
             status='scheduled',
             appointment_date__gte=timezone.now()
         ).order_by('appointment_date').first()
@@ -1,6 +1,7 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from utilities.view_cache import cache_response
 from .forms import PatientProfileForm
 
 @login_required
@@ -51,6 +52,8 @@ def dashboard(request):
 
 
 @login_required
+# Short timeout: the next/last appointment changes as time passes
+@cache_response('user:{user.pk}', 'patient:{user.patient_profile.pk}', timeout=60)
 def profile(request):
     """FR-09: Karta z danymi pacjenta"""
     if not request.user.is_patient():
@@ -2,7 +2,11 @@
 Integration tests for superadmin views.
 """
 
-from django.test import TestCase, Client
+import re
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.messages import get_messages
 from django.utils import timezone
@@ -10,6 +14,7 @@ from datetime import date, timedelta
 from authentication.models import User
 from patients.models import Patient
 from doctors.models import Doctor
+from utilities.search import search_users
 
 
 class SuperadminDashboardViewTest(TestCase):
@@ -211,6 +216,40 @@ class SuperadminUserListViewTest(TestCase):
         users = response.context['users']
         self.assertIn(self.locked_user, users)
 
+    def test_user_list_search_pages_ranked_results(self):
+        """Test search results larger than a page keep relevance order and only one page of IDs is queried"""
+        User.objects.bulk_create([
+            User(username=f'bulk{i}', email=f'bulk{i}@example.com') for i in range(120)
+        ])
+        self.client.login(username='admin_test', password='testpass123')
+        url = self.user_list_url + '?search=example.com'
+
+        listed = []
+        with CaptureQueriesContext(connection) as queries:
+            for page in (1, 2, 3):
+                response = self.client.get(f'{url}&page={page}')
+                listed += [user.id for user in response.context['users']]
+
+        self.assertEqual(response.context['sort_by'], 'relevance')
+        self.assertEqual(response.context['page_obj'].paginator.count, len(listed))
+        self.assertGreater(len(listed), 120)
+        self.assertEqual(listed, search_users('example.com', limit=None))
+        # IDs passed back to the database never exceed one page
+        id_lists = re.findall(r' IN \(([^()]*)\)', ' '.join(q['sql'] for q in queries))
+        self.assertLessEqual(max(len(ids.split(',')) for ids in id_lists), 50)
+
+    def test_user_list_is_paginated(self):
+        """Test user list is paginated (50 per page)"""
+        User.objects.bulk_create([User(username=f'bulk{i}') for i in range(50)])
+        self.client.login(username='admin_test', password='testpass123')
+
+        response = self.client.get(self.user_list_url)
+        self.assertEqual(len(response.context['users']), 50)
+        self.assertEqual(response.context['page_obj'].paginator.count, 55)
+
+        response = self.client.get(self.user_list_url + '?page=2')
+        self.assertEqual(len(response.context['users']), 5)
+
 
 class SuperadminUserDetailViewTest(TestCase):
     """Test user_detail view for superadmin"""
@@ -787,3 +826,57 @@ class ResetUserPasswordViewTest(TestCase):
         # Verify error message
         messages = list(get_messages(response.wsgi_request))
         self.assertTrue(any('Podaj nowe hasło' in str(m) for m in messages))
+
+
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0.000001)
+class SlowQueriesViewTest(TestCase):
+    """Test slow query list in the superadmin panel"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.url = reverse('superadmin:slow_queries')
+        self.superuser = User.objects.create_superuser(
+            username='admin_test',
+            password='testpass123',
+            email='admin@test.com'
+        )
+        self.regular_user = User.objects.create_user(
+            username='regular_user',
+            password='testpass123',
+            user_type='doctor'
+        )
+
+    def test_requires_superuser(self):
+        """Test non-superusers are redirected"""
+        self.client.login(username='regular_user', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 302)
+
+    def test_lists_slow_queries(self):
+        """Test queries of earlier requests are listed with their call site"""
+        self.client.login(username='admin_test', password='testpass123')
+        with self.assertLogs('utilities.slow_queries', 'WARNING'):
+            self.client.get(reverse('superadmin:user_list'))
+            response = self.client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['offenders'])
+        self.assertContains(response, 'superadmin/views.py')
+        self.assertContains(response, 'superadmin:user_list')
+
+    def test_reset(self):
+        """Test POST clears the statistics"""
+        self.client.login(username='admin_test', password='testpass123')
+        with self.assertLogs('utilities.slow_queries', 'WARNING'):
+            self.client.get(reverse('superadmin:user_list'))
+            response = self.client.post(self.url)
+
+        self.assertRedirects(response, self.url)
+        messages = list(get_messages(response.wsgi_request))
+        self.assertIn('wyczyszczone', str(messages[0]))
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['offenders'], [])
+        self.assertContains(response, 'Brak zarejestrowanych wolnych zapytań')
@@ -15,4 +15,5 @@ urlpatterns = [
     path('users/<int:user_id>/toggle-superuser/', views.toggle_superuser_status, name='toggle_superuser_status'),
     path('users/<int:user_id>/delete/', views.delete_user, name='delete_user'),
     path('users/<int:user_id>/reset-password/', views.reset_user_password, name='reset_user_password'),
+    path('slow-queries/', views.slow_queries, name='slow_queries'),
 ]
@@ -1,12 +1,18 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from django.db.models import Q
+from django.core.paginator import Paginator
+from authentication.lockout import clear_failures
 from authentication.models import User
 from patients.models import Patient
 from doctors.models import Doctor
 from django.utils import timezone
 from datetime import timedelta
+from django.conf import settings
+from utilities.search import SearchResults, filter_matches
+from utilities.replica import use_replica
+from utilities.slow_queries import reset_slow_queries, top_offenders
+from utilities.view_cache import cache_response
 from .forms import CreateDoctorForm
 
 def is_superuser(user):
@@ -15,6 +21,9 @@ def is_superuser(user):
 
 @login_required
 @user_passes_test(is_superuser)
+# Short timeout: account locks expire without a write
+@cache_response('users', timeout=60)
+@use_replica
 def dashboard(request):
     """Panel główny superadmina"""
     total_users = User.objects.count()
@@ -32,24 +41,18 @@ def dashboard(request):
 
 @login_required
 @user_passes_test(is_superuser)
+@use_replica
 def user_list(request):
     """Lista wszystkich użytkowników"""
     search_query = request.GET.get('search', '')
     user_type = request.GET.get('type', '')
     status = request.GET.get('status', '')
-    sort_by = request.GET.get('sort', 'date_joined')
+    # Search results default to relevance order
+    sort_by = request.GET.get('sort', 'relevance' if search_query else 'date_joined')
     sort_order = request.GET.get('order', 'desc')
 
     users = User.objects.all()
 
-    if search_query:
-        users = users.filter(
-            Q(username__icontains=search_query) |
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query)
-        )
-
     if user_type:
         if user_type == 'superadmin':
             users = users.filter(is_superuser=True)
@@ -66,7 +69,14 @@ def user_list(request):
     # Apply sorting
     order_prefix = '-' if sort_order == 'desc' else ''
 
-    if sort_by == 'id':
+    # Search (indexed, see utilities.search): matches are a subquery, and in
+    # relevance order only the current page is ranked and loaded
+    if search_query and sort_by != 'relevance':
+        users = filter_matches(users, search_query)
+
+    if sort_by == 'relevance' and search_query:
+        users = SearchResults(users, search_query)
+    elif sort_by == 'id':
         users = users.order_by(f'{order_prefix}id')
     elif sort_by == 'username':
         users = users.order_by(f'{order_prefix}username')
@@ -81,8 +91,12 @@ def user_list(request):
     else:
         users = users.order_by('-date_joined')
 
+    paginator = Paginator(users, 50)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
     context = {
-        'users': users,
+        'users': page_obj,
+        'page_obj': page_obj,
         'search_query': search_query,
         'user_type': user_type,
         'status': status,
@@ -146,6 +160,7 @@ def unlock_user_account(request, user_id):
     if request.method == 'POST':
         user = get_object_or_404(User, id=user_id)
         user.reset_failed_login()
+        clear_failures(user.username)
         messages.success(request, f'Konto użytkownika {user.username} zostało odblokowane.')
 
     return redirect('superadmin:user_detail', user_id=user_id)
@@ -272,3 +287,19 @@ def create_doctor(request):
         'form': form,
     }
     return render(request, 'superadmin/create_doctor.html', context)
+
+@login_required
+@user_passes_test(is_superuser)
+def slow_queries(request):
+    """Najwolniejsze zapytania do bazy danych (wg łącznego czasu)"""
+    if request.method == 'POST':
+        reset_slow_queries()
+        messages.success(request, 'Statystyki wolnych zapytań zostały wyczyszczone.')
+        return redirect('superadmin:slow_queries')
+
+    context = {
+        'offenders': top_offenders(),
+        'threshold': settings.SLOW_QUERY_THRESHOLD_MS,
+        'explain_enabled': settings.SLOW_QUERY_EXPLAIN,
+    }
+    return render(request, 'superadmin/slow_queries.html', context)
@@ -0,0 +1,169 @@
+"""
+Namespaced access to the shared cache.
+
+Every feature keeps its entries under its own namespace::
+
+    templates = CacheNamespace('note_templates', timeout=3600)
+    templates.set(('content', 42), entry)      # key 'note_templates:content:42'
+    templates.get(('content', 42))
+
+Reads through a namespace are counted as hits or misses. Counters are
+kept per process and added to shared counters in the cache every few
+seconds (and at exit), so ``manage.py cache_stats`` can report hit rates
+per namespace across all workers - as long as the cache itself is shared
+(Redis or file based, see ``CACHE_URL`` in settings). Sampled requests
+also count them in their own metrics (``utilities.perf``), and ``/metrics``
+exposes them as ``clinic_cache_reads_total``.
+"""
+
+import atexit
+import threading
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+from .metrics import Counter
+from .perf import record_cache
+
+
+STATS_PREFIX = '_stats'
+STATS_NAMESPACES_KEY = f'{STATS_PREFIX}:namespaces'
+
+# Seconds between flushes of the process-local counters into the cache
+STATS_FLUSH_INTERVAL = 10
+
+_MISSING = object()
+
+cache_reads = Counter('clinic_cache_reads_total', 'Cache reads by namespace and result (hit/miss)', ['namespace', 'result'])
+
+_stats = {}
+_stats_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+
+
+class CacheNamespace:
+    """Keys, default timeout and hit/miss statistics for one group of cache entries"""
+
+    def __init__(self, name, timeout=DEFAULT_TIMEOUT, alias=DEFAULT_CACHE_ALIAS):
+        self.name = name
+        self.timeout = timeout
+        self.alias = alias
+
+    def __repr__(self):
+        return f'<CacheNamespace {self.name}>'
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def key(self, key):
+        """Full cache key for a key (string) or key parts (tuple) in this namespace"""
+        if isinstance(key, (tuple, list)):
+            key = ':'.join(map(str, key))
+        return f'{self.name}:{key}'
+
+    def get(self, key, default=None):
+        value = self.cache.get(self.key(key), _MISSING)
+        _record(self.name, hit=value is not _MISSING)
+        return default if value is _MISSING else value
+
+    def get_many(self, keys):
+        """Return ``{key: value}`` for the keys found (keys as passed in)"""
+        full_keys = {self.key(key): key for key in keys}
+        found = self.cache.get_many(list(full_keys))
+        _record(self.name, hits=len(found), misses=len(full_keys) - len(found))
+        return {full_keys[full_key]: value for full_key, value in found.items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.cache.set(self.key(key), value, self._timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT):
+        return self.cache.add(self.key(key), value, self._timeout(timeout))
+
+    def incr(self, key, delta=1):
+        return self.cache.incr(self.key(key), delta)
+
+    def delete(self, key):
+        return self.cache.delete(self.key(key))
+
+    def delete_many(self, keys):
+        self.cache.delete_many([self.key(key) for key in keys])
+
+    def _timeout(self, timeout):
+        return self.timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+
+def _record(name, hit=None, hits=0, misses=0):
+    if hit is not None:
+        hits, misses = (1, 0) if hit else (0, 1)
+    record_cache(hits, misses)
+    if hits:
+        cache_reads.inc(hits, namespace=name, result='hit')
+    if misses:
+        cache_reads.inc(misses, namespace=name, result='miss')
+    with _stats_lock:
+        counters = _stats.setdefault(name, [0, 0])
+        counters[0] += hits
+        counters[1] += misses
+    if time.monotonic() - _last_flush[0] >= STATS_FLUSH_INTERVAL:
+        flush_stats()
+
+
+def flush_stats(alias=DEFAULT_CACHE_ALIAS):
+    """Add this process's hit/miss counters to the shared counters in the cache"""
+    with _stats_lock:
+        pending = {name: counters for name, counters in _stats.items() if any(counters)}
+        _stats.clear()
+        _last_flush[0] = time.monotonic()
+    if not pending:
+        return
+
+    cache = caches[alias]
+    try:
+        known = cache.get(STATS_NAMESPACES_KEY) or set()
+        if not known.issuperset(pending):
+            cache.set(STATS_NAMESPACES_KEY, known | set(pending), timeout=None)
+        for name, (hits, misses) in pending.items():
+            for counter, value in (('hits', hits), ('misses', misses)):
+                if not value:
+                    continue
+                key = f'{STATS_PREFIX}:{name}:{counter}'
+                if not cache.add(key, value, timeout=None):
+                    cache.incr(key, value)
+    except Exception:
+        # Statistics must never break a request (e.g. cache server down)
+        pass
+
+
+def get_stats(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Return shared hit/miss counters per namespace.
+
+    Returns:
+        dict: ``{namespace: {'hits': int, 'misses': int}}``
+    """
+    cache = caches[alias]
+    names = sorted(cache.get(STATS_NAMESPACES_KEY) or ())
+    keys = [f'{STATS_PREFIX}:{name}:{counter}' for name in names for counter in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    return {
+        name: {
+            counter: values.get(f'{STATS_PREFIX}:{name}:{counter}', 0)
+            for counter in ('hits', 'misses')
+        }
+        for name in names
+    }
+
+
+def reset_stats(alias=DEFAULT_CACHE_ALIAS):
+    """Forget the shared hit/miss counters"""
+    cache = caches[alias]
+    names = cache.get(STATS_NAMESPACES_KEY) or ()
+    cache.delete_many(
+        [STATS_NAMESPACES_KEY]
+        + [f'{STATS_PREFIX}:{name}:{counter}' for name in names for counter in ('hits', 'misses')]
+    )
+
+
+atexit.register(flush_stats)
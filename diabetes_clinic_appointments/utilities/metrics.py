@@ -0,0 +1,365 @@
+"""
+Application metrics in the Prometheus text format.
+
+Counters and histograms are declared at module level of the code that
+updates them::
+
+    booking_conflicts = Counter('clinic_booking_conflicts_total', 'Rejected bookings', ['form'])
+    booking_conflicts.inc(form='book')
+
+Every process (Gunicorn worker) keeps its values in memory and writes all of
+them to its own file in ``METRICS_DIR`` every few seconds and at exit, with
+an atomic rename. ``/metrics`` adds up the files of all processes, so the
+result does not depend on which worker answers the scrape. Files of exited
+workers are merged into one file, so counters never go back when workers
+are recycled (``--max-requests``).
+
+Values of other workers may be up to ``FLUSH_INTERVAL`` seconds old. Gauges
+computed at scrape time (e.g. the model version) are registered with
+``register_collector``.
+
+``/metrics`` is available to the addresses in ``METRICS_ALLOWED_IPS`` and to
+requests with ``Authorization: Bearer <METRICS_TOKEN>``.
+"""
+
+import atexit
+import fcntl
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds between writes of the process's values to its file
+FLUSH_INTERVAL = 5
+
+MERGED_FILE = 'merged.json'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_metrics = {}
+_collectors = []
+_values = {}
+_lock = threading.Lock()
+_last_flush = [time.monotonic()]
+
+
+def _process_file_name():
+    # pid and start time: a recycled pid must not overwrite the file of an exited worker
+    return f'{os.getpid()}-{time.time_ns()}.json'
+
+
+_process_file = _process_file_name()
+
+
+def _after_fork():
+    # Workers forked from a preloaded master start with empty values and their own file
+    global _process_file, _lock
+    _lock = threading.Lock()
+    _values.clear()
+    _process_file = _process_file_name()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _metrics[name] = self
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return f'{self.name}|{json.dumps([str(labels[name]) for name in self.labelnames])}'
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with _lock:
+            _values[key] = _values.get(key, 0) + amount
+        _maybe_flush()
+
+
+class Histogram(Metric):
+    """Bucketed observations; the value is [bucket counts..., sum, count]"""
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with _lock:
+            series = _values.get(key)
+            if series is None:
+                series = _values[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+        _maybe_flush()
+
+
+def register_collector(collect):
+    """
+    Register a function returning gauges computed at scrape time.
+
+    The function returns ``[(name, documentation, [(labels dict, value), ...]), ...]``.
+    """
+    _collectors.append(collect)
+    return collect
+
+
+def metrics_dir():
+    return str(settings.METRICS_DIR)
+
+
+def _add(total, key, value):
+    if isinstance(value, list):
+        series = total.setdefault(key, [0] * len(value))
+        for index, item in enumerate(value):
+            series[index] += item
+    else:
+        total[key] = total.get(key, 0) + value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write(path, values):
+    fd, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(values, f)
+    os.replace(temporary, path)
+
+
+def flush():
+    """Write this process's values to its file in METRICS_DIR"""
+    with _lock:
+        values = {key: list(value) if isinstance(value, list) else value for key, value in _values.items()}
+        _last_flush[0] = time.monotonic()
+    if not values:
+        return
+    try:
+        os.makedirs(metrics_dir(), exist_ok=True)
+        _write(os.path.join(metrics_dir(), _process_file), values)
+    except OSError:
+        # Metrics must never break a request (e.g. a read-only directory)
+        pass
+
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+
+def _is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _merge_exited(directory, names):
+    """Fold the files of exited processes into MERGED_FILE (under the lock)"""
+    exited = [name for name in names if not _is_running(int(name.split('-')[0]))]
+    if not exited:
+        return
+    merged_path = os.path.join(directory, MERGED_FILE)
+    merged = _read(merged_path)
+    for name in exited:
+        for key, value in _read(os.path.join(directory, name)).items():
+            _add(merged, key, value)
+    _write(merged_path, merged)
+    for name in exited:
+        os.remove(os.path.join(directory, name))
+
+
+def collect():
+    """
+    Return the values added up over all processes.
+
+    Returns:
+        dict: ``{key: value}`` with keys ``'name|["label value", ...]'``
+    """
+    flush()
+    directory = metrics_dir()
+    if not os.path.isdir(directory):
+        return {}
+
+    total = {}
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        # Concurrent scrapes must not see a file both merged and still present
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        names = [name for name in os.listdir(directory) if name.endswith('.json')]
+        _merge_exited(directory, [name for name in names if name not in (MERGED_FILE, _process_file)])
+        for name in os.listdir(directory):
+            if name.endswith('.json'):
+                for key, value in _read(os.path.join(directory, name)).items():
+                    _add(total, key, value)
+    return total
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    series = {}
+    for key, value in collect().items():
+        name, _, labels = key.partition('|')
+        series.setdefault(name, []).append((json.loads(labels), value))
+
+    lines = []
+    for name, metric in sorted(_metrics.items()):
+        lines += [f'# HELP {name} {metric.documentation}', f'# TYPE {name} {metric.type}']
+        for values, value in sorted(series.get(name, []), key=lambda item: item[0]):
+            if metric.type == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric.buckets, value):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{_labels(metric.labelnames, values, [("le", _number(bound))])} {cumulative}'
+                    )
+                lines.append(f'{name}_bucket{_labels(metric.labelnames, values, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{_labels(metric.labelnames, values)} {_number(value[-2])}')
+                lines.append(f'{name}_count{_labels(metric.labelnames, values)} {value[-1]}')
+            else:
+                lines.append(f'{name}{_labels(metric.labelnames, values)} {_number(value)}')
+
+    for collector in _collectors:
+        for name, documentation, samples in collector():
+            lines += [f'# HELP {name} {documentation}', f'# TYPE {name} gauge']
+            for labels, value in samples:
+                lines.append(f'{name}{_labels(labels, labels.values())} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+def _allowed(request):
+    token = settings.METRICS_TOKEN
+    authorization = request.META.get('HTTP_AUTHORIZATION', '')
+    if token and constant_time_compare(authorization, f'Bearer {token}'):
+        return True
+    from authentication.lockout import client_ip
+    return client_ip(request) in settings.METRICS_ALLOWED_IPS
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint (IP allowlist or bearer token)"""
+    if not _allowed(request):
+        return HttpResponseForbidden()
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
+
+
+requests_total = Counter(
+    'clinic_http_requests_total', 'HTTP requests by URL name, method and status', ['view', 'method', 'status']
+)
+request_duration = Histogram(
+    'clinic_http_request_duration_seconds', 'Request latency by URL name', ['view']
+)
+request_queries = Histogram(
+    'clinic_http_request_queries', 'Database queries per request by URL name', ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+
+
+class QueryCounter:
+    """``execute_wrapper`` hook counting the queries of a request"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class MetricsMiddleware:
+    """
+    Count requests, their latency and queries per resolved URL name.
+
+    Sync and async capable, so async views are not run in a thread under
+    ASGI. Async requests are not given a query hook: their queries run in
+    other threads (with other connections) and installing it there would
+    cost a thread switch on every request, so the query histogram covers
+    sync requests only.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = QueryCounter()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        view = self.observe(request, response, time.perf_counter() - start)
+        request_queries.observe(queries.count, view=view)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - start)
+        return response
+
+    @staticmethod
+    def observe(request, response, duration):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        requests_total.inc(view=view, method=request.method, status=response.status_code)
+        request_duration.observe(duration, view=view)
+        return view
+
+
+atexit.register(flush)
@@ -0,0 +1,197 @@
+"""
+Sampled per-request performance metrics.
+
+``PerformanceMiddleware`` measures a random sample of requests
+(``PERF_SAMPLE_RATE``) and records, per resolved URL name:
+
+* wall time of the middleware below it and the view,
+* number and total time of database queries (``execute_wrapper`` on every
+  configured connection),
+* template render time, without the queries of querysets evaluated while
+  rendering (those count as database time),
+* cache hits and misses counted by ``CacheNamespace``,
+* response size.
+
+Each sampled request is logged as one JSON line on this module's logger
+(``logs/perf.log`` in production) and, with ``PERF_SERVER_TIMING``, sent in
+a ``Server-Timing`` header shown by the browser's developer tools. Requests
+outside the sample cost one random number.
+
+Template times need the ``TimedDjangoTemplates`` backend (see TEMPLATES in
+settings). Queries run while a streaming response is sent are not counted.
+
+The middleware supports both sync and async requests, so under ASGI the
+async views are not pushed into a thread. Django connections belong to one
+thread, so for a sampled async request the query hook is installed in the
+request's thread for sync code (``sync_to_async``, async ORM calls).
+"""
+
+import contextvars
+import json
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('perf_metrics', default=None)
+
+
+class RequestMetrics:
+    """Counters of one sampled request"""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - start
+
+    def as_dict(self, request, response, total):
+        match = request.resolver_match
+        if response.streaming:
+            size = int(response['Content-Length']) if response.has_header('Content-Length') else None
+        else:
+            size = len(response.content)
+        return {
+            'url_name': match.view_name if match else None,
+            'method': request.method,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 2),
+            'db_queries': self.queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            'cache_hits': self.cache_hits,
+            'cache_misses': self.cache_misses,
+            'response_bytes': size,
+        }
+
+
+def record_cache(hits, misses):
+    """Count cache reads of the current request (called by CacheNamespace)"""
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+def server_timing(record):
+    """Server-Timing header value for a logged record"""
+    app = record['total_ms'] - record['db_ms'] - record['template_ms']
+    return ', '.join([
+        f'db;dur={record["db_ms"]};desc="{record["db_queries"]} queries"',
+        f'tpl;dur={record["template_ms"]}',
+        f'app;dur={max(app, 0):.2f}',
+        f'cache;desc="{record["cache_hits"]} hits, {record["cache_misses"]} misses"',
+        f'total;dur={record["total_ms"]}',
+    ])
+
+
+class TimedTemplate(Template):
+    """Template that adds its render time to the sampled request's metrics"""
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        # Nested renders (render_to_string in a template tag) are already timed
+        if metrics is None or metrics.rendering:
+            return super().render(context, request)
+        metrics.rendering = True
+        db_time = metrics.db_time
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.rendering = False
+            metrics.template_time += time.perf_counter() - start - (metrics.db_time - db_time)
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """The Django template backend returning ``TimedTemplate``"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
+
+
+def _wrap_connections(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+class PerformanceMiddleware:
+    """Measure a sample of requests (PERF_SAMPLE_RATE) and log the metrics"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    @staticmethod
+    def sampled():
+        rate = settings.PERF_SAMPLE_RATE
+        return rate > 0 and random.random() < rate
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                _wrap_connections(stack, metrics)
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                await sync_to_async(_wrap_connections)(stack, metrics)
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        record = metrics.as_dict(request, response, total)
+        logger.info(json.dumps(record))
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(record)
+        return response
@@ -0,0 +1,122 @@
+"""
+Routing of read-only views to an optional read replica.
+
+With ``DATABASE_REPLICA_URL`` set, ``DATABASES['replica']`` holds a copy of
+the primary database. Reads go to the replica only inside views marked with
+``use_replica`` (listings, histories, statistics, exports); everything else
+- booking, notes, forms - reads and writes the primary.
+
+Replicas lag behind the primary, so a user must not read stale data right
+after changing it (read-your-writes):
+
+* after a user's POST/PUT/PATCH/DELETE request, ``ReplicaPinMiddleware``
+  pins the user to the primary for ``REPLICA_PIN_SECONDS`` (in the shared
+  cache, so the pin holds in every worker),
+* within a request, every read after the first write goes to the primary.
+
+Without a replica configured every query uses ``default``.
+"""
+
+import contextvars
+import functools
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.deprecation import MiddlewareMixin
+
+from .cache import CacheNamespace
+
+
+REPLICA_ALIAS = 'replica'
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+pins = CacheNamespace('replica_pin')
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+_wrote = contextvars.ContextVar('wrote', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+class ReplicaRouter:
+    """Send reads inside ``replica_reads()`` to the replica, all writes to the primary"""
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and not _wrote.get() and replica_configured():
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        return db != REPLICA_ALIAS
+
+
+class replica_reads:
+    """Context manager routing reads to the replica (unless a write happened)"""
+
+    def __enter__(self):
+        self._token = _use_replica.set(True)
+        return self
+
+    def __exit__(self, *exc_info):
+        _use_replica.reset(self._token)
+
+
+def pin_to_primary(user_id):
+    """Read from the primary for the user's next REPLICA_PIN_SECONDS"""
+    pins.set(user_id, True, settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(request):
+    user = getattr(request, 'user', None)
+    return bool(user and user.is_authenticated and pins.get(user.pk))
+
+
+def _stream_with_replica(iterable):
+    iterator = iter(iterable)
+    while True:
+        with replica_reads():
+            chunk = next(iterator, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def use_replica(view):
+    """Serve the view's reads from the replica (for read-only listing/report views)"""
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_configured() or is_pinned(request):
+            return view(request, *args, **kwargs)
+        with replica_reads():
+            response = view(request, *args, **kwargs)
+        # Querysets of streamed responses (exports) run while the body is sent
+        if response.streaming and not response.is_async:
+            response.streaming_content = _stream_with_replica(response.streaming_content)
+        return response
+    return wrapper
+
+
+class ReplicaPinMiddleware(MiddlewareMixin):
+    """Pin users to the primary after they write; track writes per request"""
+
+    def process_request(self, request):
+        # Contexts (threads) are reused between requests
+        _wrote.set(False)
+
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if request.method in UNSAFE_METHODS and replica_configured() and user and user.is_authenticated:
+            pin_to_primary(user.pk)
+        return response
@@ -0,0 +1,261 @@
+"""
+Helpers for rich-text (CKEditor HTML) content.
+
+Doctor notes and note templates are stored as HTML. Anything that needs
+to search, preview or display them should work on the renderings computed
+here once, at save time, instead of processing HTML per request.
+"""
+
+import hashlib
+import re
+from collections import namedtuple
+from html import escape
+from html.parser import HTMLParser
+
+
+# Tags whose boundaries separate words/lines in the rendered text
+BLOCK_TAGS = {
+    'p', 'div', 'br', 'li', 'ul', 'ol', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'table', 'tr', 'td', 'th', 'thead', 'tbody', 'blockquote', 'pre', 'hr',
+}
+
+# Tags whose content is never displayed
+SKIP_TAGS = {'script', 'style', 'head', 'title'}
+
+# Tags produced by the CKEditor toolbars configured in settings
+ALLOWED_TAGS = {
+    'p', 'div', 'span', 'br', 'hr', 'strong', 'b', 'em', 'i', 'u', 's', 'strike',
+    'sub', 'sup', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'blockquote', 'pre', 'a', 'table', 'caption', 'thead', 'tbody', 'tfoot',
+    'tr', 'td', 'th',
+}
+
+# Tags without a closing tag
+VOID_TAGS = {'br', 'hr'}
+
+ALLOWED_ATTRIBUTES = {
+    '*': {'style'},
+    'a': {'href', 'title'},
+    'table': {'border', 'cellpadding', 'cellspacing', 'summary'},
+    'td': {'colspan', 'rowspan'},
+    'th': {'colspan', 'rowspan', 'scope'},
+    'ol': {'start'},
+}
+
+# CSS properties set by the TextColor/BGColor, Justify, Indent and Table plugins
+ALLOWED_STYLES = {
+    'color', 'background-color', 'text-align', 'margin-left', 'width', 'height',
+}
+
+ALLOWED_URL_SCHEMES = {'http', 'https', 'mailto'}
+
+SAFE_STYLE_VALUE = re.compile(r'^[#\w\s.,%()-]+$')
+
+# Length of the plain-text preview stored alongside notes
+EXCERPT_LENGTH = 200
+
+RichText = namedtuple('RichText', ['html', 'text', 'excerpt', 'hash'])
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    """
+    Convert HTML to plain text.
+
+    Tags are removed, entities decoded and whitespace collapsed. Block-level
+    elements become line breaks so words from adjacent paragraphs or table
+    cells are not glued together.
+
+    Args:
+        html (str): HTML content (may be None)
+
+    Returns:
+        str: Plain text
+    """
+    if not html:
+        return ''
+
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    text = ''.join(parser.parts).replace('\xa0', ' ')
+
+    lines = (re.sub(r'[ \t\r\f\v]+', ' ', line).strip() for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+
+class _Sanitizer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.open_tags = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+            return
+        if self.skip_depth or tag not in ALLOWED_TAGS:
+            return
+
+        self.parts.append(f'<{tag}{_clean_attributes(tag, attrs)}>')
+        if tag not in VOID_TAGS:
+            self.open_tags.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in VOID_TAGS and not self.skip_depth:
+            self.parts.append(f'<{tag}{_clean_attributes(tag, attrs)}>')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(self.skip_depth - 1, 0)
+            return
+        if self.skip_depth or tag not in self.open_tags:
+            return
+
+        # Close any unclosed children so the output stays well-formed
+        while self.open_tags:
+            open_tag = self.open_tags.pop()
+            self.parts.append(f'</{open_tag}>')
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self.open_tags:
+            self.parts.append(f'</{self.open_tags.pop()}>')
+
+
+def _clean_attributes(tag, attrs):
+    allowed = ALLOWED_ATTRIBUTES['*'] | ALLOWED_ATTRIBUTES.get(tag, set())
+    cleaned = []
+    for name, value in attrs:
+        if name not in allowed or value is None:
+            continue
+        if name == 'style':
+            value = _clean_style(value)
+        elif name == 'href' and not _is_safe_url(value):
+            continue
+        if value:
+            cleaned.append(f' {name}="{escape(value)}"')
+    return ''.join(cleaned)
+
+
+def _clean_style(style):
+    declarations = []
+    for declaration in style.split(';'):
+        prop, _, value = declaration.partition(':')
+        prop, value = prop.strip().lower(), value.strip()
+        if prop in ALLOWED_STYLES and SAFE_STYLE_VALUE.match(value) and 'expression' not in value.lower():
+            declarations.append(f'{prop}: {value}')
+    return '; '.join(declarations)
+
+
+def _is_safe_url(url):
+    url = re.sub(r'[\x00-\x20]', '', url)
+    scheme, sep, _ = url.partition(':')
+    # Relative URLs and anchors have no scheme (or a ':' only after a path separator)
+    if not sep or any(char in scheme for char in '/?#'):
+        return True
+    return scheme.lower() in ALLOWED_URL_SCHEMES
+
+
+def sanitize_html(html):
+    """
+    Reduce HTML to the tags, attributes and styles CKEditor produces.
+
+    Disallowed tags are dropped but their text is kept (except for script
+    and style content), event handlers and ``javascript:`` URLs are removed
+    and unclosed tags are closed, so the result is safe to render with
+    ``|safe``.
+
+    Args:
+        html (str): HTML content (may be None)
+
+    Returns:
+        str: Sanitized HTML
+    """
+    if not html:
+        return ''
+
+    parser = _Sanitizer()
+    parser.feed(html)
+    parser.close()
+    return ''.join(parser.parts)
+
+
+def make_excerpt(text, length=EXCERPT_LENGTH):
+    """
+    Shorten plain text to at most ``length`` characters on a word boundary.
+
+    Args:
+        text (str): Plain text, e.g. the output of ``html_to_text``
+        length (int): Maximum excerpt length, including the ellipsis
+
+    Returns:
+        str: Single-line excerpt
+    """
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+
+    cut = text[:length - 1]
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip(' .,;:') + '…'
+
+
+def content_hash(html):
+    """Return the SHA-256 hex digest of the content ('' for empty content)"""
+    if not html:
+        return ''
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+
+def render_rich_text(html):
+    """
+    Compute every stored rendering of a rich-text value.
+
+    Args:
+        html (str): HTML content (may be None)
+
+    Returns:
+        RichText: Sanitized HTML, plain text, excerpt and content hash
+    """
+    text = html_to_text(html)
+    return RichText(
+        html=sanitize_html(html),
+        text=text,
+        excerpt=make_excerpt(text),
+        hash=content_hash(html),
+    )
@@ -0,0 +1,904 @@
+"""
+Search backends for patient/user lookup and doctor notes.
+
+Name/email searches used to be ``icontains`` filters ORed together, which
+forces a sequential scan over the users table, and note searches ran
+``icontains`` over CKEditor HTML. This module hides the database-specific
+indexes behind a small backend abstraction:
+
+- PostgreSQL: pg_trgm GIN indexes on names/username/email, an expression
+  GIN index on a ``simple`` tsvector and a pattern index for PESEL
+  prefixes; notes use a GIN tsvector index with the ``polish``
+  configuration when it is installed (``simple`` otherwise).
+- SQLite: FTS5 tables kept in sync with the source tables by triggers
+  (trigram tokenizer for people, unicode61 with prefix queries for notes).
+- Anything else: plain ``icontains`` filters.
+
+Notes are indexed through their plain-text projection
+(``Appointment.notes_text`` / ``NoteTemplate.content_text``), computed once
+at save time.
+
+Public entry points return IDs ordered by relevance:
+``search_patients(doctor, q)``, ``search_users(q)``,
+``search_notes(doctor, q)`` and ``search_templates(q)`` (the last two
+return ``(id, snippet)`` pairs with highlighted snippets).
+
+Paginated lists do not pass result IDs back to the ORM (a broad query on a
+large table matches far more rows than fit in one statement):
+``filter_matches(queryset, q)`` restricts a queryset with a subquery over
+the index, and ``SearchResults(queryset, q)`` hands ``Paginator`` one page
+at a time, ranked in the database with LIMIT/OFFSET.
+"""
+
+import re
+
+from django.conf import settings
+from django.db import connection, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+# Default maximum number of IDs returned by a single search (None: no limit)
+SEARCH_RESULTS_LIMIT = 1000
+
+# Trigram indexes cannot match anything shorter than three characters
+MIN_TRIGRAM_LENGTH = 3
+
+# Highlight markers used inside snippets before HTML escaping
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+# Characters of context shown around a match by the fallback backend
+SNIPPET_CONTEXT = 60
+
+SQLITE_USER_TABLE = 'search_user_fts'
+SQLITE_NOTE_TABLE = 'search_note_fts'
+SQLITE_TEMPLATE_TABLE = 'search_template_fts'
+
+SQLITE_INDEXES = {
+    'users': [
+        {
+            'table': SQLITE_USER_TABLE,
+            'create': f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_USER_TABLE} USING fts5(
+                    username, first_name, last_name, email, pesel,
+                    tokenize='trigram'
+                )
+            """,
+            'populate': f"""
+                INSERT INTO {SQLITE_USER_TABLE}(rowid, username, first_name, last_name, email, pesel)
+                SELECT u.id, u.username, u.first_name, u.last_name, u.email, coalesce(p.pesel, '')
+                FROM authentication_user u
+                LEFT JOIN patients_patient p ON p.user_id = u.id
+            """,
+            'triggers': {
+                f'{SQLITE_USER_TABLE}_user_ai': f"""
+                    AFTER INSERT ON authentication_user BEGIN
+                        INSERT INTO {SQLITE_USER_TABLE}(rowid, username, first_name, last_name, email, pesel)
+                        VALUES (new.id, new.username, new.first_name, new.last_name, new.email, '');
+                    END
+                """,
+                f'{SQLITE_USER_TABLE}_user_au': f"""
+                    AFTER UPDATE OF username, first_name, last_name, email ON authentication_user BEGIN
+                        UPDATE {SQLITE_USER_TABLE}
+                        SET username = new.username, first_name = new.first_name,
+                            last_name = new.last_name, email = new.email
+                        WHERE rowid = new.id;
+                    END
+                """,
+                f'{SQLITE_USER_TABLE}_user_ad': f"""
+                    AFTER DELETE ON authentication_user BEGIN
+                        DELETE FROM {SQLITE_USER_TABLE} WHERE rowid = old.id;
+                    END
+                """,
+                f'{SQLITE_USER_TABLE}_patient_ai': f"""
+                    AFTER INSERT ON patients_patient BEGIN
+                        UPDATE {SQLITE_USER_TABLE} SET pesel = new.pesel WHERE rowid = new.user_id;
+                    END
+                """,
+                f'{SQLITE_USER_TABLE}_patient_au': f"""
+                    AFTER UPDATE OF pesel, user_id ON patients_patient BEGIN
+                        UPDATE {SQLITE_USER_TABLE} SET pesel = '' WHERE rowid = old.user_id;
+                        UPDATE {SQLITE_USER_TABLE} SET pesel = new.pesel WHERE rowid = new.user_id;
+                    END
+                """,
+                f'{SQLITE_USER_TABLE}_patient_ad': f"""
+                    AFTER DELETE ON patients_patient BEGIN
+                        UPDATE {SQLITE_USER_TABLE} SET pesel = '' WHERE rowid = old.user_id;
+                    END
+                """,
+            },
+        },
+    ],
+    'notes': [
+        {
+            'table': SQLITE_NOTE_TABLE,
+            'create': f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_NOTE_TABLE} USING fts5(
+                    reason, notes_text,
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """,
+            'populate': f"""
+                INSERT INTO {SQLITE_NOTE_TABLE}(rowid, reason, notes_text)
+                SELECT id, reason, notes_text FROM appointments_appointment
+            """,
+            'triggers': {
+                f'{SQLITE_NOTE_TABLE}_ai': f"""
+                    AFTER INSERT ON appointments_appointment BEGIN
+                        INSERT INTO {SQLITE_NOTE_TABLE}(rowid, reason, notes_text)
+                        VALUES (new.id, new.reason, new.notes_text);
+                    END
+                """,
+                f'{SQLITE_NOTE_TABLE}_au': f"""
+                    AFTER UPDATE OF reason, notes_text ON appointments_appointment BEGIN
+                        UPDATE {SQLITE_NOTE_TABLE}
+                        SET reason = new.reason, notes_text = new.notes_text
+                        WHERE rowid = new.id;
+                    END
+                """,
+                f'{SQLITE_NOTE_TABLE}_ad': f"""
+                    AFTER DELETE ON appointments_appointment BEGIN
+                        DELETE FROM {SQLITE_NOTE_TABLE} WHERE rowid = old.id;
+                    END
+                """,
+            },
+        },
+        {
+            'table': SQLITE_TEMPLATE_TABLE,
+            'create': f"""
+                CREATE VIRTUAL TABLE IF NOT EXISTS {SQLITE_TEMPLATE_TABLE} USING fts5(
+                    name, description, content_text,
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            """,
+            'populate': f"""
+                INSERT INTO {SQLITE_TEMPLATE_TABLE}(rowid, name, description, content_text)
+                SELECT id, name, description, content_text FROM appointments_notetemplate
+            """,
+            'triggers': {
+                f'{SQLITE_TEMPLATE_TABLE}_ai': f"""
+                    AFTER INSERT ON appointments_notetemplate BEGIN
+                        INSERT INTO {SQLITE_TEMPLATE_TABLE}(rowid, name, description, content_text)
+                        VALUES (new.id, new.name, new.description, new.content_text);
+                    END
+                """,
+                f'{SQLITE_TEMPLATE_TABLE}_au': f"""
+                    AFTER UPDATE OF name, description, content_text ON appointments_notetemplate BEGIN
+                        UPDATE {SQLITE_TEMPLATE_TABLE}
+                        SET name = new.name, description = new.description,
+                            content_text = new.content_text
+                        WHERE rowid = new.id;
+                    END
+                """,
+                f'{SQLITE_TEMPLATE_TABLE}_ad': f"""
+                    AFTER DELETE ON appointments_notetemplate BEGIN
+                        DELETE FROM {SQLITE_TEMPLATE_TABLE} WHERE rowid = old.id;
+                    END
+                """,
+            },
+        },
+    ],
+}
+
+# The tsvector expressions must match the index definitions exactly,
+# otherwise PostgreSQL will not use the index.
+POSTGRES_USER_TSVECTOR = (
+    "to_tsvector('simple', coalesce(u.first_name, '') || ' ' || "
+    "coalesce(u.last_name, '') || ' ' || coalesce(u.email, ''))"
+)
+POSTGRES_NOTE_TSVECTOR = (
+    "to_tsvector('{config}', coalesce(a.reason, '') || ' ' || coalesce(a.notes_text, ''))"
+)
+POSTGRES_TEMPLATE_TSVECTOR = (
+    "to_tsvector('{config}', coalesce(t.name, '') || ' ' || "
+    "coalesce(t.description, '') || ' ' || coalesce(t.content_text, ''))"
+)
+
+POSTGRES_INDEXES = {
+    'users': {
+        'create': [
+            "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+            "CREATE INDEX IF NOT EXISTS user_first_name_trgm ON authentication_user "
+            "USING gin (first_name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS user_last_name_trgm ON authentication_user "
+            "USING gin (last_name gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS user_username_trgm ON authentication_user "
+            "USING gin (username gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS user_email_trgm ON authentication_user "
+            "USING gin (email gin_trgm_ops)",
+            "CREATE INDEX IF NOT EXISTS user_search_vector ON authentication_user USING gin ("
+            + POSTGRES_USER_TSVECTOR.replace('u.', '') + ")",
+            "CREATE INDEX IF NOT EXISTS patient_pesel_prefix ON patients_patient "
+            "(pesel varchar_pattern_ops)",
+        ],
+        'drop': [
+            "DROP INDEX IF EXISTS user_first_name_trgm",
+            "DROP INDEX IF EXISTS user_last_name_trgm",
+            "DROP INDEX IF EXISTS user_username_trgm",
+            "DROP INDEX IF EXISTS user_email_trgm",
+            "DROP INDEX IF EXISTS user_search_vector",
+            "DROP INDEX IF EXISTS patient_pesel_prefix",
+        ],
+    },
+    'notes': {
+        'create': [
+            "CREATE INDEX IF NOT EXISTS appointment_notes_search_{config} ON appointments_appointment "
+            "USING gin (" + POSTGRES_NOTE_TSVECTOR.replace('a.', '') + ")",
+            "CREATE INDEX IF NOT EXISTS notetemplate_search_{config} ON appointments_notetemplate "
+            "USING gin (" + POSTGRES_TEMPLATE_TSVECTOR.replace('t.', '') + ")",
+        ],
+        'drop': [
+            "DROP INDEX IF EXISTS appointment_notes_search_{config}",
+            "DROP INDEX IF EXISTS notetemplate_search_{config}",
+        ],
+    },
+}
+
+
+def _escape_like(value):
+    """Escape LIKE wildcards in user input."""
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _word_tokens(query):
+    """Split a query into word tokens usable in full-text queries."""
+    return re.findall(r'\w+', query)
+
+
+def _sqlite_limit(limit):
+    """SQLite has no ``LIMIT NULL``; a negative limit means no limit."""
+    return -1 if limit is None else limit
+
+
+def format_snippet(raw):
+    """Escape a raw snippet and turn highlight markers into ``<mark>`` tags."""
+    html = escape(raw).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+def _python_snippet(text, query):
+    """Build a highlighted snippet around the first occurrence of ``query``."""
+    text = (text or '').replace('\n', ' ')
+    position = text.lower().find(query.lower())
+    if position < 0:
+        return format_snippet(text[:SNIPPET_CONTEXT * 2])
+    start = max(position - SNIPPET_CONTEXT, 0)
+    end = min(position + len(query) + SNIPPET_CONTEXT, len(text))
+    raw = (
+        ('…' if start else '')
+        + text[start:position]
+        + MARK_START + text[position:position + len(query)] + MARK_END
+        + text[position + len(query):end]
+        + ('…' if end < len(text) else '')
+    )
+    return format_snippet(raw)
+
+
+class BaseSearchBackend:
+    """
+    Base class for search backends.
+
+    Subclasses implement ``_search`` (people) and ``_search_notes`` /
+    ``_search_templates``. Queries that the index cannot handle
+    (e.g. too short for trigrams) go through the ``icontains`` fallback.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    # People ---------------------------------------------------------------
+
+    def search_users(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Return user IDs matching ``query``, best matches first."""
+        query = (query or '').strip()
+        if not query:
+            return []
+        if not self.can_handle(query):
+            return self._fallback(query, limit=limit)
+        return [user_id for user_id, _ in self._search(query, limit=limit)]
+
+    def search_patients(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        """
+        Return patient IDs matching ``query``, best matches first.
+
+        When ``doctor`` is given, only patients who had appointments with
+        that doctor are returned.
+        """
+        query = (query or '').strip()
+        if not query:
+            return []
+        if not self.can_handle(query):
+            return self._fallback(query, doctor=doctor, patients_only=True, limit=limit)
+        return [
+            patient_id
+            for _, patient_id in self._search(query, doctor=doctor, patients_only=True, limit=limit)
+        ]
+
+    def matches(self, query):
+        """Subquery of the IDs of users matching ``query`` (for ``id__in``)."""
+        if not self.can_handle(query):
+            from authentication.models import User
+
+            return User.objects.filter(self._fallback_q(query)).values('id')
+        return RawSQL(*self._match_sql(query))
+
+    def ranked(self, query, restriction, limit, offset=0):
+        """
+        Return the IDs of matching users within ``restriction`` (a
+        ``values()`` queryset of user IDs), best matches first, sliced
+        with LIMIT/OFFSET in the database.
+        """
+        if not self.can_handle(query):
+            from authentication.models import User
+
+            users = User.objects.filter(self._fallback_q(query), id__in=restriction)
+            users = users.order_by('last_name', 'first_name', 'id').values_list('id', flat=True)
+            return list(users[offset:offset + limit] if limit is not None else users[offset:])
+        sql, params = restriction.query.get_compiler(using=restriction.db).as_sql()
+        with self.connection.cursor() as cursor:
+            cursor.execute(*self._ranked_sql(query, sql, params, limit, offset))
+            return [row[0] for row in cursor.fetchall()]
+
+    def can_handle(self, query):
+        return True
+
+    def _search(self, query, doctor=None, patients_only=False, limit=SEARCH_RESULTS_LIMIT):
+        raise NotImplementedError
+
+    def _match_sql(self, query):
+        raise NotImplementedError
+
+    def _ranked_sql(self, query, restriction_sql, restriction_params, limit, offset):
+        raise NotImplementedError
+
+    def _fallback_q(self, query, prefix=''):
+        return (
+            Q(**{f'{prefix}username__icontains': query}) |
+            Q(**{f'{prefix}first_name__icontains': query}) |
+            Q(**{f'{prefix}last_name__icontains': query}) |
+            Q(**{f'{prefix}email__icontains': query}) |
+            Q(**{f'{prefix}patient_profile__pesel__startswith': query})
+        )
+
+    def _fallback(self, query, doctor=None, patients_only=False, limit=SEARCH_RESULTS_LIMIT):
+        """Plain ``icontains`` search used when no index is available."""
+        if patients_only:
+            from patients.models import Patient
+
+            patients = Patient.objects.filter(
+                Q(user__first_name__icontains=query) |
+                Q(user__last_name__icontains=query) |
+                Q(user__email__icontains=query) |
+                Q(pesel__startswith=query)
+            )
+            if doctor is not None:
+                patients = patients.filter(appointments__doctor=doctor)
+            return list(
+                patients.order_by('user__last_name', 'user__first_name', 'id')
+                .values_list('id', flat=True)
+                .distinct()[:limit]
+            )
+
+        from authentication.models import User
+
+        users = User.objects.filter(self._fallback_q(query))
+        return list(users.order_by('last_name', 'first_name', 'id').values_list('id', flat=True)[:limit])
+
+    # Notes ----------------------------------------------------------------
+
+    def search_notes(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        """
+        Return ``(appointment_id, snippet)`` pairs for ``doctor``'s
+        appointments whose notes or reason match ``query``.
+        """
+        query = (query or '').strip()
+        if not _word_tokens(query):
+            return []
+        if not self.can_handle_notes(query):
+            return self._fallback_notes(doctor, query, limit=limit)
+        return [
+            (appointment_id, format_snippet(snippet or ''))
+            for appointment_id, snippet in self._search_notes(doctor, query, limit=limit)
+        ]
+
+    def search_templates(self, query, limit=SEARCH_RESULTS_LIMIT):
+        """Return ``(template_id, snippet)`` pairs for active note templates."""
+        query = (query or '').strip()
+        if not _word_tokens(query):
+            return []
+        if not self.can_handle_notes(query):
+            return self._fallback_templates(query, limit=limit)
+        return [
+            (template_id, format_snippet(snippet or ''))
+            for template_id, snippet in self._search_templates(query, limit=limit)
+        ]
+
+    def can_handle_notes(self, query):
+        return True
+
+    def _search_notes(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        raise NotImplementedError
+
+    def _search_templates(self, query, limit=SEARCH_RESULTS_LIMIT):
+        raise NotImplementedError
+
+    def _fallback_notes(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        from appointments.models import Appointment
+
+        appointments = Appointment.objects.filter(
+            Q(notes_text__icontains=query) | Q(reason__icontains=query),
+            doctor=doctor,
+        ).order_by('-appointment_date').values_list('id', 'notes_text', 'reason')[:limit]
+        return [
+            (appointment_id, _python_snippet(notes_text or reason, query))
+            for appointment_id, notes_text, reason in appointments
+        ]
+
+    def _fallback_templates(self, query, limit=SEARCH_RESULTS_LIMIT):
+        from appointments.models import NoteTemplate
+
+        templates = NoteTemplate.objects.filter(
+            Q(name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(content_text__icontains=query),
+            is_active=True,
+        ).order_by('category', 'name').values_list('id', 'content_text')[:limit]
+        return [
+            (template_id, _python_snippet(content_text, query))
+            for template_id, content_text in templates
+        ]
+
+    # Index management -----------------------------------------------------
+
+    def install(self, index='users'):
+        """Create indexes/triggers for ``index`` (idempotent)."""
+
+    def uninstall(self, index='users'):
+        """Remove indexes/triggers created by ``install``."""
+
+    def repair(self, index='users'):
+        """Re-create missing index structures, if the index was installed."""
+
+    def suspend(self, index='users'):
+        """Stop updating the index row by row; ``repair`` rebuilds it (bulk loads)."""
+
+
+class FallbackSearchBackend(BaseSearchBackend):
+    """Backend for databases without a dedicated index (plain ``icontains``)."""
+
+    def can_handle(self, query):
+        return False
+
+    def can_handle_notes(self, query):
+        return False
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """FTS5 indexes maintained by triggers."""
+
+    def can_handle(self, query):
+        return any(len(token) >= MIN_TRIGRAM_LENGTH for token in query.split())
+
+    def install(self, index='users'):
+        with self.connection.cursor() as cursor:
+            for spec in SQLITE_INDEXES[index]:
+                self._install_table(cursor, spec)
+
+    def repair(self, index='users'):
+        # Triggers are dropped whenever Django remakes one of the source
+        # tables, so they have to be re-created after migrations.
+        with self.connection.cursor() as cursor:
+            for spec in SQLITE_INDEXES[index]:
+                cursor.execute(
+                    "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name = %s",
+                    [spec['table']],
+                )
+                if cursor.fetchone()[0]:
+                    self._install_table(cursor, spec)
+
+    def suspend(self, index='users'):
+        # Without its triggers the table is repopulated in one pass by repair()
+        with self.connection.cursor() as cursor:
+            for spec in SQLITE_INDEXES[index]:
+                for name in spec['triggers']:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+
+    def uninstall(self, index='users'):
+        with self.connection.cursor() as cursor:
+            for spec in SQLITE_INDEXES[index]:
+                for name in spec['triggers']:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+                cursor.execute(f"DROP TABLE IF EXISTS {spec['table']}")
+
+    def _install_table(self, cursor, spec):
+        names = list(spec['triggers'])
+        cursor.execute(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN (%s)"
+            % ', '.join(['%s'] * len(names)),
+            names,
+        )
+        triggers_present = cursor.fetchone()[0] == len(names)
+        cursor.execute(spec['create'])
+        for name, body in spec['triggers'].items():
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {name} {body}")
+        if not triggers_present:
+            # Without all triggers the index may be stale - rebuild it
+            cursor.execute(f"DELETE FROM {spec['table']}")
+            cursor.execute(spec['populate'])
+
+    def _match_expression(self, query):
+        """Build an FTS5 query: every searchable token must appear somewhere."""
+        tokens = [token for token in query.split() if len(token) >= MIN_TRIGRAM_LENGTH]
+        return ' AND '.join('"%s"' % token.replace('"', '""') for token in tokens)
+
+    def _prefix_expression(self, query):
+        """Build an FTS5 prefix query (poor man's stemming for Polish)."""
+        return ' AND '.join('"%s"*' % token for token in _word_tokens(query))
+
+    def _search(self, query, doctor=None, patients_only=False, limit=SEARCH_RESULTS_LIMIT):
+        sql = [
+            f"SELECT {SQLITE_USER_TABLE}.rowid, p.id FROM {SQLITE_USER_TABLE}",
+            f"JOIN authentication_user u ON u.id = {SQLITE_USER_TABLE}.rowid",
+            "JOIN" if patients_only else "LEFT JOIN",
+            f"patients_patient p ON p.user_id = {SQLITE_USER_TABLE}.rowid",
+            f"WHERE {SQLITE_USER_TABLE} MATCH %s",
+        ]
+        params = [self._match_expression(query)]
+        if doctor is not None:
+            sql.append(
+                "AND EXISTS (SELECT 1 FROM appointments_appointment a "
+                "WHERE a.patient_id = p.id AND a.doctor_id = %s)"
+            )
+            params.append(doctor.pk)
+        sql.append(f"ORDER BY {SQLITE_USER_TABLE}.rank, {SQLITE_USER_TABLE}.rowid LIMIT %s")
+        params.append(_sqlite_limit(limit))
+
+        with self.connection.cursor() as cursor:
+            cursor.execute(' '.join(sql), params)
+            return cursor.fetchall()
+
+    def _match_sql(self, query):
+        return (
+            f"SELECT rowid FROM {SQLITE_USER_TABLE} WHERE {SQLITE_USER_TABLE} MATCH %s",
+            [self._match_expression(query)],
+        )
+
+    def _ranked_sql(self, query, restriction_sql, restriction_params, limit, offset):
+        sql = f"""
+            SELECT rowid FROM {SQLITE_USER_TABLE}
+            WHERE {SQLITE_USER_TABLE} MATCH %s AND rowid IN ({restriction_sql})
+            ORDER BY rank, rowid
+            LIMIT %s OFFSET %s
+        """
+        return sql, [self._match_expression(query), *restriction_params, _sqlite_limit(limit), offset]
+
+    def _search_notes(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        sql = f"""
+            SELECT {SQLITE_NOTE_TABLE}.rowid,
+                   snippet({SQLITE_NOTE_TABLE}, -1, %s, %s, '…', 16)
+            FROM {SQLITE_NOTE_TABLE}
+            JOIN appointments_appointment a ON a.id = {SQLITE_NOTE_TABLE}.rowid
+            WHERE {SQLITE_NOTE_TABLE} MATCH %s AND a.doctor_id = %s
+            ORDER BY {SQLITE_NOTE_TABLE}.rank, a.appointment_date DESC
+            LIMIT %s
+        """
+        params = [MARK_START, MARK_END, self._prefix_expression(query), doctor.pk, _sqlite_limit(limit)]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _search_templates(self, query, limit=SEARCH_RESULTS_LIMIT):
+        sql = f"""
+            SELECT {SQLITE_TEMPLATE_TABLE}.rowid,
+                   snippet({SQLITE_TEMPLATE_TABLE}, 2, %s, %s, '…', 16)
+            FROM {SQLITE_TEMPLATE_TABLE}
+            JOIN appointments_notetemplate t ON t.id = {SQLITE_TEMPLATE_TABLE}.rowid
+            WHERE {SQLITE_TEMPLATE_TABLE} MATCH %s AND t.is_active
+            ORDER BY {SQLITE_TEMPLATE_TABLE}.rank
+            LIMIT %s
+        """
+        params = [MARK_START, MARK_END, self._prefix_expression(query), _sqlite_limit(limit)]
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+class PostgreSQLSearchBackend(BaseSearchBackend):
+    """pg_trgm GIN indexes plus tsvector indexes for people and notes."""
+
+    # Text search configuration per database alias (detected once)
+    _configs = {}
+
+    def text_search_config(self):
+        """
+        Return the text search configuration used for notes.
+
+        ``NOTES_SEARCH_CONFIG`` in settings wins; otherwise ``polish`` is used
+        when the server has it (it needs the Polish ispell dictionary),
+        falling back to ``simple``.
+        """
+        configured = getattr(settings, 'NOTES_SEARCH_CONFIG', None)
+        if configured:
+            config = configured
+        else:
+            alias = self.connection.alias
+            if alias not in self._configs:
+                with self.connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM pg_ts_config WHERE cfgname = 'polish'")
+                    self._configs[alias] = 'polish' if cursor.fetchone() else 'simple'
+            config = self._configs[alias]
+        if not re.fullmatch(r'[a-z_]+', config):
+            raise ValueError(f'Invalid text search configuration: {config!r}')
+        return config
+
+    def install(self, index='users'):
+        config = self.text_search_config() if index == 'notes' else None
+        with self.connection.cursor() as cursor:
+            for statement in POSTGRES_INDEXES[index]['create']:
+                cursor.execute(statement.replace('{config}', config or ''))
+
+    def uninstall(self, index='users'):
+        config = self.text_search_config() if index == 'notes' else None
+        with self.connection.cursor() as cursor:
+            for statement in POSTGRES_INDEXES[index]['drop']:
+                cursor.execute(statement.replace('{config}', config or ''))
+
+    def _match_sql(self, query):
+        # One branch per index: ORing conditions on both sides of the join
+        # in a single WHERE makes the planner fall back to a sequential scan
+        like = '%' + _escape_like(query) + '%'
+        sql = f"""
+            SELECT u.id FROM authentication_user u WHERE u.first_name ILIKE %s
+            UNION SELECT u.id FROM authentication_user u WHERE u.last_name ILIKE %s
+            UNION SELECT u.id FROM authentication_user u WHERE u.username ILIKE %s
+            UNION SELECT u.id FROM authentication_user u WHERE u.email ILIKE %s
+            UNION SELECT u.id FROM authentication_user u
+                WHERE {POSTGRES_USER_TSVECTOR} @@ plainto_tsquery('simple', %s)
+            UNION SELECT p.user_id FROM patients_patient p WHERE p.pesel LIKE %s
+        """
+        return sql, [like, like, like, like, query, _escape_like(query) + '%']
+
+    def _rank_sql(self, query):
+        sql = f"""
+            GREATEST(
+                similarity(u.first_name, %s),
+                similarity(u.last_name, %s),
+                similarity(u.username, %s),
+                similarity(u.email, %s)
+            )
+            + ts_rank({POSTGRES_USER_TSVECTOR}, plainto_tsquery('simple', %s))
+        """
+        return sql, [query] * 5
+
+    def _search(self, query, doctor=None, patients_only=False, limit=SEARCH_RESULTS_LIMIT):
+        match_sql, params = self._match_sql(query)
+        rank_sql, rank_params = self._rank_sql(query)
+        join = 'JOIN' if patients_only else 'LEFT JOIN'
+        doctor_filter = ''
+        if doctor is not None:
+            doctor_filter = (
+                "WHERE EXISTS (SELECT 1 FROM appointments_appointment a "
+                "WHERE a.patient_id = p.id AND a.doctor_id = %s)"
+            )
+            params.append(doctor.pk)
+        sql = f"""
+            WITH matches AS ({match_sql})
+            SELECT u.id, p.id
+            FROM matches m
+            JOIN authentication_user u ON u.id = m.id
+            {join} patients_patient p ON p.user_id = u.id
+            {doctor_filter}
+            ORDER BY {rank_sql} DESC, u.id
+            LIMIT %s
+        """
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, [*params, *rank_params, limit])
+            return cursor.fetchall()
+
+    def _ranked_sql(self, query, restriction_sql, restriction_params, limit, offset):
+        match_sql, match_params = self._match_sql(query)
+        rank_sql, rank_params = self._rank_sql(query)
+        sql = f"""
+            WITH matches AS ({match_sql})
+            SELECT u.id
+            FROM matches m
+            JOIN authentication_user u ON u.id = m.id
+            WHERE u.id IN ({restriction_sql})
+            ORDER BY {rank_sql} DESC, u.id
+            LIMIT %s OFFSET %s
+        """
+        return sql, [*match_params, *restriction_params, *rank_params, limit, offset]
+
+    def _tsquery(self, query):
+        """Build a prefix tsquery string (``word:* & word:*``)."""
+        return ' & '.join(f'{token}:*' for token in _word_tokens(query))
+
+    def _headline_options(self):
+        return f'StartSel={MARK_START}, StopSel={MARK_END}, MaxFragments=2, MaxWords=20, MinWords=5'
+
+    def _search_notes(self, doctor, query, limit=SEARCH_RESULTS_LIMIT):
+        config = self.text_search_config()
+        vector = POSTGRES_NOTE_TSVECTOR.replace('{config}', config)
+        sql = f"""
+            SELECT a.id, ts_headline('{config}', coalesce(a.notes_text, a.reason), q, %(options)s)
+            FROM appointments_appointment a, to_tsquery('{config}', %(tsquery)s) q
+            WHERE a.doctor_id = %(doctor_id)s AND {vector} @@ q
+            ORDER BY ts_rank({vector}, q) DESC, a.appointment_date DESC
+            LIMIT %(limit)s
+        """
+        params = {
+            'options': self._headline_options(),
+            'tsquery': self._tsquery(query),
+            'doctor_id': doctor.pk,
+            'limit': limit,
+        }
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def _search_templates(self, query, limit=SEARCH_RESULTS_LIMIT):
+        config = self.text_search_config()
+        vector = POSTGRES_TEMPLATE_TSVECTOR.replace('{config}', config)
+        sql = f"""
+            SELECT t.id, ts_headline('{config}', t.content_text, q, %(options)s)
+            FROM appointments_notetemplate t, to_tsquery('{config}', %(tsquery)s) q
+            WHERE t.is_active AND {vector} @@ q
+            ORDER BY ts_rank({vector}, q) DESC
+            LIMIT %(limit)s
+        """
+        params = {
+            'options': self._headline_options(),
+            'tsquery': self._tsquery(query),
+            'limit': limit,
+        }
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+
+BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgreSQLSearchBackend,
+}
+
+
+def get_search_backend(using=None):
+    """Return the search backend matching the database vendor."""
+    conn = using or connection
+    backend_class = BACKENDS.get(conn.vendor, FallbackSearchBackend)
+    return backend_class(conn)
+
+
+def search_patients(doctor, q, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Search patients by name, email or PESEL prefix.
+
+    Args:
+        doctor: Doctor whose patients are searched, or None for all patients
+        q (str): Search query
+        limit (int): Maximum number of results, None for all matches
+
+    Returns:
+        list: Patient IDs ordered by relevance
+    """
+    return get_search_backend().search_patients(doctor, q, limit=limit)
+
+
+def search_users(q, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Search users by username, name, email or PESEL prefix.
+
+    Returns:
+        list: User IDs ordered by relevance
+    """
+    return get_search_backend().search_users(q, limit=limit)
+
+
+def search_notes(doctor, q, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Full-text search over the doctor's own appointment notes.
+
+    Args:
+        doctor: Doctor whose appointments are searched
+        q (str): Search query (words are matched by prefix)
+        limit (int): Maximum number of results
+
+    Returns:
+        list: ``(appointment_id, snippet)`` pairs ordered by relevance;
+        snippets are safe HTML with matches wrapped in ``<mark>``
+    """
+    return get_search_backend().search_notes(doctor, q, limit=limit)
+
+
+def search_templates(q, limit=SEARCH_RESULTS_LIMIT):
+    """
+    Full-text search over active note templates.
+
+    Returns:
+        list: ``(template_id, snippet)`` pairs ordered by relevance
+    """
+    return get_search_backend().search_templates(q, limit=limit)
+
+
+def filter_matches(queryset, q, user_field='id'):
+    """
+    Restrict ``queryset`` to rows whose user matches ``q``.
+
+    The matches are a subquery over the search index, so the statement
+    does not grow with the number of results.
+
+    Args:
+        queryset: Users, or rows pointing at a user through ``user_field``
+        q (str): Search query
+        user_field (str): Field holding the user (e.g. ``'user'`` for patients)
+    """
+    q = (q or '').strip()
+    if not q:
+        return queryset.none()
+    backend = get_search_backend(connections[queryset.db])
+    return queryset.filter(**{f'{user_field}__in': backend.matches(q)})
+
+
+class SearchResults:
+    """
+    Rows of ``queryset`` matching a search, best matches first, for ``Paginator``.
+
+    Slicing ranks only the requested page in the database (LIMIT/OFFSET
+    over the index, restricted to ``queryset`` with a subquery) and loads
+    those rows; ``count()`` counts the matches with ``filter_matches``.
+    """
+
+    def __init__(self, queryset, q, user_field='id'):
+        self.queryset = queryset
+        self.query = (q or '').strip()
+        self.user_field = user_field
+        self._count = None
+
+    def count(self):
+        if self._count is None:
+            self._count = filter_matches(self.queryset, self.query, self.user_field).count()
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        limit = index.stop - start if index.stop is not None else None
+        if not self.query or limit == 0:
+            return []
+
+        backend = get_search_backend(connections[self.queryset.db])
+        restriction = self.queryset.order_by().values(self.user_field)
+        user_ids = backend.ranked(self.query, restriction, limit, start)
+
+        attname = self.queryset.model._meta.get_field(self.user_field).attname
+        rows = {
+            getattr(row, attname): row
+            for row in self.queryset.filter(**{f'{self.user_field}__in': user_ids})
+        }
+        return [rows[user_id] for user_id in user_ids if user_id in rows]
+
+
+def install_search_index(using=None, index='users'):
+    """Create the search index (``'users'`` or ``'notes'``) for the database."""
+    get_search_backend(using).install(index)
+
+
+def uninstall_search_index(using=None, index='users'):
+    get_search_backend(using).uninstall(index)
+
+
+def repair_search_index(using=None, index='users'):
+    """Re-create triggers dropped by table remakes (no-op if not installed)."""
+    get_search_backend(using).repair(index)
+
+
+def suspend_search_index(using=None, index='users'):
+    """Pause index maintenance during a bulk load; call ``repair_search_index`` after it."""
+    get_search_backend(using).suspend(index)
@@ -0,0 +1,284 @@
+"""
+Slow query log.
+
+``SlowQueryMiddleware`` times every query of a request (``execute_wrapper``
+on all connections). Queries slower than ``SLOW_QUERY_THRESHOLD_MS`` are:
+
+* logged as one JSON line on this module's logger (``logs/slow_queries.log``
+  in production) with the URL name of the view, the innermost stack frame in
+  the project's apps (e.g. ``doctors/views.py:412 in patients_list``) and,
+  with ``SLOW_QUERY_EXPLAIN``, the query plan of SELECT queries on
+  PostgreSQL and SQLite,
+* added up in the shared cache per query shape and call site, for the
+  superadmin page listing the queries with the largest total time.
+
+Query shapes ignore literal values and the length of ``IN (...)`` lists, so
+one ORM call with different parameters is one entry. Query parameters are
+never logged or stored (they hold patient data), also not as the literals
+PostgreSQL puts into query plans (see ``explain``).
+
+The middleware is sync and async capable. Django connections belong to one
+thread, so for async requests the hook is installed in the request's thread
+for sync code (``sync_to_async``, async ORM calls).
+"""
+
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import traceback
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .cache import CacheNamespace
+
+
+logger = logging.getLogger(__name__)
+
+# Aggregates are kept for a week without new slow calls
+STATS_TIMEOUT = 7 * 24 * 3600
+
+# Query shapes tracked on the superadmin page
+MAX_ENTRIES = 500
+
+EXPLAIN_VENDORS = ('postgresql', 'sqlite')
+
+# First PostgreSQL version (server_version_num) with EXPLAIN (GENERIC_PLAN)
+GENERIC_PLAN_VERSION = 160000
+
+stats = CacheNamespace('slow_queries', timeout=STATS_TIMEOUT)
+
+# Set while a slow query is reported: EXPLAIN and cache queries are not timed
+_reporting = contextvars.ContextVar('slow_query_reporting', default=False)
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_PLAN_COSTS = re.compile(r'\s+\((?:cost|actual)=[^)]*\)')
+_IN_LISTS = re.compile(r'\(\s*(?:%s|\?)(?:\s*,\s*(?:%s|\?))*\s*\)')
+
+
+def query_shape(sql):
+    """SQL with literals and IN lists replaced by placeholders"""
+    shape = _LITERALS.sub('?', sql)
+    shape = _IN_LISTS.sub('(...)', shape)
+    return ' '.join(shape.split())
+
+
+@functools.lru_cache(maxsize=1)
+def _app_paths():
+    base = str(settings.BASE_DIR)
+    return tuple(
+        os.path.join(config.path, '') for config in apps.get_app_configs()
+        if config.path.startswith(base) and 'site-packages' not in config.path
+    )
+
+
+def call_site():
+    """
+    Return the innermost stack frame in the project's apps.
+
+    Frames of ``utilities`` (decorators, template timing, execute wrappers)
+    are skipped, so queries are attributed to the view, form or model that
+    runs them.
+
+    Returns:
+        tuple: (``'doctors/views.py:412 in patients_list'``, source line),
+        or (None, None)
+    """
+    app_paths = _app_paths()
+    base = str(settings.BASE_DIR)
+    for frame in reversed(traceback.extract_stack()):
+        if frame.filename.startswith(app_paths):
+            return f'{os.path.relpath(frame.filename, base)}:{frame.lineno} in {frame.name}', frame.line
+    return None, None
+
+
+def redact_plan(plan):
+    """Query plan with literals (the query's parameters) replaced by ``?``; costs are kept"""
+    lines = []
+    for line in plan.splitlines():
+        match = _PLAN_COSTS.search(line)
+        end = match.start() if match else len(line)
+        lines.append(_LITERALS.sub('?', line[:end]) + line[end:])
+    return '\n'.join(lines)
+
+
+def _run_explain(connection, sql, params):
+    try:
+        # A savepoint keeps a failed EXPLAIN from breaking the request's transaction
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+    except Exception:
+        return None
+
+
+def explain(connection, sql, params):
+    """
+    Query plan of a SELECT, or None.
+
+    PostgreSQL embeds the values of the parameters in the plan (e.g.
+    ``Filter: (pesel = '92032109552'::text)``). PostgreSQL 16+ is asked for
+    the generic plan, with ``$1, $2...`` in place of the values; when that
+    is not possible the literals are removed from the plan text. SQLite
+    plans contain no values.
+    """
+    if connection.vendor not in EXPLAIN_VENDORS or not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    plan_sql = f'{connection.ops.explain_query_prefix()} {sql}'
+    if connection.vendor == 'sqlite':
+        return _run_explain(connection, plan_sql, params)
+
+    if connection.pg_version >= GENERIC_PLAN_VERSION and isinstance(params, (list, tuple)):
+        placeholders = tuple(f'${number}' for number in range(1, len(params) + 1))
+        try:
+            plan = _run_explain(connection, f'EXPLAIN (GENERIC_PLAN) {sql % placeholders}', None)
+        except (TypeError, ValueError):
+            plan = None
+        if plan is not None:
+            return plan
+    plan = _run_explain(connection, plan_sql, params)
+    return redact_plan(plan) if plan is not None else None
+
+
+def _add(key, value):
+    if not stats.add(key, value):
+        try:
+            stats.incr(key, value)
+        except ValueError:
+            # Expired between add() and incr()
+            stats.set(key, value)
+
+
+def record(entry, duration):
+    """Add one slow call to the aggregates of its query shape and call site"""
+    fingerprint = hashlib.sha1(f'{entry["shape"]}|{entry["frame"]}'.encode()).hexdigest()[:16]
+    try:
+        index = stats.get('index') or set()
+        if fingerprint not in index:
+            if len(index) >= MAX_ENTRIES:
+                return
+            stats.set('index', index | {fingerprint})
+        _add(('count', fingerprint), 1)
+        _add(('total_us', fingerprint), int(duration * 1_000_000))
+        previous = stats.get(('entry', fingerprint))
+        entry = dict(entry, max_ms=max(entry['duration_ms'], previous['max_ms'] if previous else 0))
+        stats.set(('entry', fingerprint), entry)
+    except Exception:
+        # The log must never break a request (e.g. cache server down)
+        pass
+
+
+def top_offenders(limit=50):
+    """
+    Return the recorded query shapes with the largest total time.
+
+    Returns:
+        list: Entries (dicts from the log line) with ``count``, ``total_ms``,
+        ``avg_ms`` and ``max_ms``, slowest first
+    """
+    index = sorted(stats.get('index') or ())
+    keys = [(kind, fingerprint) for fingerprint in index for kind in ('entry', 'count', 'total_us')]
+    values = stats.get_many(keys)
+    offenders = []
+    for fingerprint in index:
+        entry = values.get(('entry', fingerprint))
+        count = values.get(('count', fingerprint))
+        if entry is None or not count:
+            continue
+        total_ms = values.get(('total_us', fingerprint), 0) / 1000
+        offenders.append(dict(entry, count=count, total_ms=total_ms, avg_ms=total_ms / count))
+    offenders.sort(key=lambda offender: offender['total_ms'], reverse=True)
+    return offenders[:limit]
+
+
+def reset_slow_queries():
+    """Forget the aggregates"""
+    index = stats.get('index') or ()
+    stats.delete_many(['index'] + [(kind, fingerprint) for fingerprint in index
+                                   for kind in ('entry', 'count', 'total_us')])
+
+
+class SlowQueryWrapper:
+    """``execute_wrapper`` hook logging the slow queries of one request"""
+
+    def __init__(self, request, threshold_ms):
+        self.request = request
+        self.threshold = threshold_ms / 1000
+
+    def __call__(self, execute, sql, params, many, context):
+        if _reporting.get():
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - start
+        if duration >= self.threshold:
+            token = _reporting.set(True)
+            try:
+                self.report(context['connection'], sql, params, many, duration)
+            finally:
+                _reporting.reset(token)
+        return result
+
+    def report(self, connection, sql, params, many, duration):
+        match = self.request.resolver_match
+        frame, code = call_site()
+        entry = {
+            'duration_ms': round(duration * 1000, 2),
+            'view': match.view_name if match else None,
+            'path': self.request.path,
+            'frame': frame,
+            'code': code,
+            'database': connection.alias,
+            'sql': sql,
+            'shape': query_shape(sql),
+            'many': many,
+            'explain': explain(connection, sql, params) if settings.SLOW_QUERY_EXPLAIN and not many else None,
+            'time': timezone.now().isoformat(),
+        }
+        logger.warning(json.dumps(entry))
+        del entry['path']
+        record(entry, duration)
+
+
+def _wrap_connections(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+class SlowQueryMiddleware:
+    """Log queries slower than SLOW_QUERY_THRESHOLD_MS (0 disables)"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if not threshold:
+            return self.get_response(request)
+        with ExitStack() as stack:
+            _wrap_connections(stack, SlowQueryWrapper(request, threshold))
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        threshold = settings.SLOW_QUERY_THRESHOLD_MS
+        if not threshold:
+            return await self.get_response(request)
+        with ExitStack() as stack:
+            await sync_to_async(_wrap_connections)(stack, SlowQueryWrapper(request, threshold))
+            return await self.get_response(request)
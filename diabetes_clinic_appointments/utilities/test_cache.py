@@ -0,0 +1,89 @@
+"""
+Tests for namespaced cache access and hit/miss statistics.
+"""
+
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import SimpleTestCase
+
+from . import cache as cache_utils
+from .cache import CacheNamespace, flush_stats, get_stats, reset_stats
+
+
+class CacheNamespaceTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_utils._stats.clear()
+        self.namespace = CacheNamespace('test_ns', timeout=60)
+
+    def test_keys_are_prefixed_with_namespace(self):
+        self.assertEqual(self.namespace.key('version'), 'test_ns:version')
+        self.assertEqual(self.namespace.key(('content', 42)), 'test_ns:content:42')
+
+        self.namespace.set(('content', 42), 'value')
+        self.assertEqual(cache.get('test_ns:content:42'), 'value')
+
+    def test_get_distinguishes_missing_from_falsy_values(self):
+        self.namespace.set('flag', False)
+        self.assertIs(self.namespace.get('flag'), False)
+        self.assertEqual(self.namespace.get('missing', 'default'), 'default')
+
+    def test_get_many_returns_keys_as_passed(self):
+        self.namespace.set(('a', 1), 'one')
+        found = self.namespace.get_many([('a', 1), ('a', 2)])
+        self.assertEqual(found, {('a', 1): 'one'})
+
+    def test_hits_and_misses_are_counted_per_namespace(self):
+        other = CacheNamespace('other_ns')
+        self.namespace.set('key', 1)
+        self.namespace.get('key')
+        self.namespace.get('key')
+        self.namespace.get('missing')
+        other.get('missing')
+
+        flush_stats()
+
+        stats = get_stats()
+        self.assertEqual(stats['test_ns'], {'hits': 2, 'misses': 1})
+        self.assertEqual(stats['other_ns'], {'hits': 0, 'misses': 1})
+
+    def test_flush_adds_to_shared_counters(self):
+        self.namespace.get('missing')
+        flush_stats()
+        self.namespace.get('missing')
+        flush_stats()
+
+        self.assertEqual(get_stats()['test_ns']['misses'], 2)
+
+    def test_reset_stats(self):
+        self.namespace.get('missing')
+        flush_stats()
+        reset_stats()
+
+        self.assertEqual(get_stats(), {})
+
+
+class CacheStatsCommandTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        cache_utils._stats.clear()
+
+    def test_reports_hit_rate_and_resets(self):
+        namespace = CacheNamespace('test_ns')
+        namespace.set('key', 1)
+        for _ in range(3):
+            namespace.get('key')
+        namespace.get('missing')
+
+        out = StringIO()
+        call_command('cache_stats', '--reset', stdout=out)
+
+        output = out.getvalue()
+        self.assertIn('test_ns', output)
+        self.assertIn('75.0%', output)
+        self.assertIn('Gotowe.', output)
+        self.assertEqual(get_stats(), {})
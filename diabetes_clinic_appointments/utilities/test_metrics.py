@@ -0,0 +1,196 @@
+"""
+Tests for the Prometheus metrics store and the /metrics endpoint.
+"""
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, time, timedelta
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from authentication import lockout
+from authentication.models import User
+from doctors.models import Doctor
+from appointments.forms import AppointmentBookingForm
+from appointments.models import Appointment
+from patients.models import Patient
+from . import metrics
+from .metrics import Counter, Histogram, MetricsMiddleware
+
+
+jobs = Counter('clinic_test_jobs_total', 'Test counter', ['kind'])
+durations = Histogram('clinic_test_duration_seconds', 'Test histogram', buckets=(0.1, 1))
+
+
+def value(name):
+    """Value of one sample line (name with labels) of /metrics"""
+    for line in metrics.render().splitlines():
+        if line.startswith(name + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def count_jobs(times):
+    for _ in range(times):
+        jobs.inc(kind='worker')
+    metrics.flush()
+
+
+class MetricsTestMixin:
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.settings_override = override_settings(METRICS_DIR=self.directory)
+        self.settings_override.enable()
+        metrics._values.clear()
+
+    def tearDown(self):
+        metrics._values.clear()
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        super().tearDown()
+
+
+class MetricsStoreTest(MetricsTestMixin, SimpleTestCase):
+
+    def test_counter_text_format(self):
+        jobs.inc(kind='a')
+        jobs.inc(2, kind='a')
+        jobs.inc(kind='b "quoted"')
+
+        text = metrics.render()
+        self.assertIn('# TYPE clinic_test_jobs_total counter', text)
+        self.assertIn('clinic_test_jobs_total{kind="a"} 3', text)
+        self.assertIn('clinic_test_jobs_total{kind="b \\"quoted\\""} 1', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        for observation in (0.05, 0.5, 0.7, 3):
+            durations.observe(observation)
+
+        text = metrics.render()
+        self.assertIn('clinic_test_duration_seconds_bucket{le="0.1"} 1', text)
+        self.assertIn('clinic_test_duration_seconds_bucket{le="1"} 3', text)
+        self.assertIn('clinic_test_duration_seconds_bucket{le="+Inf"} 4', text)
+        self.assertIn('clinic_test_duration_seconds_count 4', text)
+        self.assertAlmostEqual(value('clinic_test_duration_seconds_sum'), 4.25)
+
+    def test_wrong_labels_are_rejected(self):
+        with self.assertRaises(ValueError):
+            jobs.inc(other='x')
+
+    def test_processes_are_added_up(self):
+        jobs.inc(kind='worker')
+        context = multiprocessing.get_context('fork')
+        processes = [context.Process(target=count_jobs, args=(10,)) for _ in range(3)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+
+        self.assertEqual(value('clinic_test_jobs_total{kind="worker"}'), 31)
+        # Files of exited workers are merged, their counts stay
+        files = sorted(name for name in os.listdir(self.directory) if name.endswith('.json'))
+        self.assertEqual(len(files), 2)
+        self.assertIn(metrics.MERGED_FILE, files)
+        self.assertEqual(value('clinic_test_jobs_total{kind="worker"}'), 31)
+
+    def test_model_version_is_exposed(self):
+        self.assertRegex(metrics.render(), r'clinic_predictor_model_info\{version="[0-9a-f]{12}"\} 1')
+
+
+class MetricsEndpointTest(MetricsTestMixin, TestCase):
+
+    def test_allowed_ip(self):
+        response = self.client.get(reverse('metrics'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret-token')
+    def test_token_required_from_other_addresses(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        self.assertEqual(
+            self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403
+        )
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret-token')
+        self.assertEqual(response.status_code, 200)
+
+    def test_requests_are_counted_by_url_name(self):
+        self.client.get(reverse('authentication:login'))
+        self.client.get(reverse('authentication:login'))
+
+        self.assertEqual(
+            value('clinic_http_requests_total{view="authentication:login",method="GET",status="200"}'), 2
+        )
+        self.assertEqual(value('clinic_http_request_duration_seconds_count{view="authentication:login"}'), 2)
+        self.assertEqual(value('clinic_http_request_queries_count{view="authentication:login"}'), 2)
+
+    async def test_async_requests_are_counted_without_query_hook(self):
+        async def view(request):
+            # No execute_wrapper is installed for the async path
+            await sync_to_async(self.assertEqual)(connection.execute_wrappers, [])
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+
+        await middleware(request)
+
+        self.assertEqual(value('clinic_http_requests_total{view="unresolved",method="GET",status="200"}'), 1)
+        self.assertEqual(value('clinic_http_request_duration_seconds_count{view="unresolved"}'), 1)
+        self.assertEqual(value('clinic_http_request_queries_count{view="unresolved"}'), 0)
+
+    @override_settings(LOGIN_LOCKOUT_ATTEMPTS=2)
+    def test_lockouts_are_counted(self):
+        cache.clear()
+        for _ in range(3):
+            lockout.register_failure('someone', '10.0.0.1')
+
+        self.assertEqual(value('clinic_login_failures_total'), 3)
+        self.assertEqual(value('clinic_login_lockouts_total{scope="user"}'), 1)
+
+    def test_booking_conflicts_are_counted(self):
+        doctor = Doctor.objects.create(
+            user=User.objects.create_user(username='doctor_m', password='testpass123', user_type='doctor'),
+            license_number='DOC777',
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University',
+        )
+        patient = Patient.objects.create(
+            user=User.objects.create_user(username='patient_m', password='testpass123', user_type='patient'),
+            date_of_birth=date(1992, 3, 21),
+            pesel='92032109552',
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123',
+            diabetes_type='type1',
+        )
+        day = timezone.localdate() + timedelta(days=7)
+        while day.weekday() >= 5:
+            day += timedelta(days=1)
+        Appointment.objects.create(
+            patient=patient, doctor=doctor, reason='Kontrola', status='scheduled',
+            appointment_date=timezone.make_aware(datetime.combine(day, time(10))),
+        )
+        form = AppointmentBookingForm(data={
+            'doctor': doctor.id, 'appointment_date': f'{day.isoformat()} 10:15', 'reason': 'Kontrola',
+        })
+
+        self.assertFalse(form.is_valid())
+        self.assertEqual(value('clinic_booking_conflicts_total{form="book"}'), 1)
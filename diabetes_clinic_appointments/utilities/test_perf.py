@@ -0,0 +1,101 @@
+"""
+Tests for the sampled per-request performance metrics.
+"""
+
+import json
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import User
+from .cache import CacheNamespace
+from .perf import PerformanceMiddleware
+
+
+@override_settings(PERF_SAMPLE_RATE=1, PERF_SERVER_TIMING=True)
+class PerformanceMiddlewareTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+
+    def measure(self, view):
+        request = self.factory.get('/')
+        request.resolver_match = None
+        with self.assertLogs('utilities.perf', 'INFO') as logs:
+            response = PerformanceMiddleware(view)(request)
+        self.assertEqual(len(logs.records), 1)
+        return response, json.loads(logs.records[0].getMessage())
+
+    def test_counts_queries_cache_reads_and_size(self):
+        namespace = CacheNamespace('test_perf')
+        namespace.set('seen', 1)
+
+        def view(request):
+            list(User.objects.all())
+            User.objects.count()
+            namespace.get('seen')
+            namespace.get('missing')
+            return HttpResponse(b'x' * 123)
+
+        response, record = self.measure(view)
+
+        self.assertEqual(record['db_queries'], 2)
+        self.assertGreater(record['db_ms'], 0)
+        self.assertEqual((record['cache_hits'], record['cache_misses']), (1, 1))
+        self.assertEqual(record['response_bytes'], 123)
+        self.assertEqual(record['status'], 200)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+    def test_template_time_excludes_queries(self):
+        def view(request):
+            return HttpResponse(render_to_string('authentication/login.html', request=request))
+
+        _, record = self.measure(view)
+
+        self.assertGreater(record['template_ms'], 0)
+        self.assertLessEqual(record['template_ms'] + record['db_ms'], record['total_ms'])
+
+    def test_records_url_name(self):
+        with self.assertLogs('utilities.perf', 'INFO') as logs:
+            response = self.client.get(reverse('authentication:login'))
+
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['url_name'], 'authentication:login')
+        self.assertEqual(record['response_bytes'], len(response.content))
+        self.assertGreater(record['template_ms'], 0)
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_measured(self):
+        with self.assertNoLogs('utilities.perf', 'INFO'):
+            response = PerformanceMiddleware(lambda request: HttpResponse())(self.factory.get('/'))
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(PERF_SERVER_TIMING=False)
+    def test_server_timing_is_optional(self):
+        response, _ = self.measure(lambda request: HttpResponse())
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    async def test_async_request_is_measured_without_thread(self):
+        async def view(request):
+            await sync_to_async(list)(User.objects.all())
+            await User.objects.acount()
+            return HttpResponse(b'x' * 10)
+
+        middleware = PerformanceMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+
+        request = self.factory.get('/')
+        request.resolver_match = None
+        with self.assertLogs('utilities.perf', 'INFO') as logs:
+            response = await middleware(request)
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['db_queries'], 2)
+        self.assertEqual(record['response_bytes'], 10)
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
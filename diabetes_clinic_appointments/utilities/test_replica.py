@@ -0,0 +1,118 @@
+"""
+Tests for read-replica routing and read-your-writes pinning.
+"""
+
+from unittest import mock
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+
+from . import replica
+from .replica import ReplicaPinMiddleware, ReplicaRouter, pin_to_primary, replica_reads, use_replica
+
+
+class User:
+    is_authenticated = True
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+@mock.patch.object(replica, 'replica_configured', return_value=True)
+class ReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+        replica._wrote.set(False)
+
+    def read_db(self):
+        return self.router.db_for_read(None)
+
+    def test_reads_use_primary_outside_replica_views(self, configured):
+        self.assertEqual(self.read_db(), 'default')
+
+    def test_reads_use_replica_inside_context(self, configured):
+        with replica_reads():
+            self.assertEqual(self.read_db(), 'replica')
+        self.assertEqual(self.read_db(), 'default')
+
+    def test_reads_after_write_use_primary(self, configured):
+        with replica_reads():
+            self.assertEqual(self.router.db_for_write(None), 'default')
+            self.assertEqual(self.read_db(), 'default')
+
+    def test_no_replica_configured(self, configured):
+        configured.return_value = False
+        with replica_reads():
+            self.assertEqual(self.read_db(), 'default')
+
+    def test_replica_is_not_migrated(self, configured):
+        self.assertFalse(self.router.allow_migrate('replica', 'appointments'))
+        self.assertTrue(self.router.allow_migrate('default', 'appointments'))
+
+    def test_decorated_view_reads_from_replica(self, configured):
+        @use_replica
+        def view(request):
+            return HttpResponse(self.read_db())
+
+        request = self.factory.get('/')
+        request.user = User(1)
+        self.assertEqual(view(request).content, b'replica')
+
+    def test_pinned_user_reads_from_primary(self, configured):
+        @use_replica
+        def view(request):
+            return HttpResponse(self.read_db())
+
+        pin_to_primary(1)
+        request = self.factory.get('/')
+        request.user = User(1)
+        self.assertEqual(view(request).content, b'default')
+
+        request.user = User(2)
+        self.assertEqual(view(request).content, b'replica')
+
+    def test_streamed_content_reads_from_replica(self, configured):
+        @use_replica
+        def view(request):
+            return StreamingHttpResponse(self.read_db().encode() for _ in range(2))
+
+        request = self.factory.get('/')
+        request.user = User(1)
+        response = view(request)
+        self.assertEqual(b''.join(response.streaming_content), b'replicareplica')
+
+    def test_middleware_pins_after_post(self, configured):
+        middleware = ReplicaPinMiddleware(lambda request: HttpResponse())
+
+        request = self.factory.get('/')
+        request.user = User(1)
+        middleware(request)
+        self.assertIsNone(replica.pins.get(1))
+
+        request = self.factory.post('/')
+        request.user = User(1)
+        middleware(request)
+        self.assertTrue(replica.pins.get(1))
+
+        # Anonymous writes (e.g. a failed login) pin nobody
+        request = self.factory.post('/')
+        request.user = AnonymousUser()
+        middleware(request)
+        self.assertIsNone(replica.pins.get(None))
+
+    def test_middleware_resets_write_flag(self, configured):
+        replica._wrote.set(True)
+
+        def view(request):
+            with replica_reads():
+                return HttpResponse(self.read_db())
+
+        middleware = ReplicaPinMiddleware(view)
+        request = self.factory.get('/')
+        request.user = User(1)
+        self.assertEqual(middleware(request).content, b'replica')
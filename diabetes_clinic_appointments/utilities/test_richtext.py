@@ -0,0 +1,98 @@
+"""
+Tests for rich-text helpers.
+"""
+
+from django.test import SimpleTestCase
+from .richtext import html_to_text, sanitize_html, make_excerpt, content_hash, render_rich_text
+
+
+class HtmlToTextTest(SimpleTestCase):
+    """Test html_to_text()"""
+
+    def test_empty_values(self):
+        """Test None and empty string"""
+        self.assertEqual(html_to_text(None), '')
+        self.assertEqual(html_to_text(''), '')
+
+    def test_strips_tags_and_decodes_entities(self):
+        """Test tags are removed and entities decoded"""
+        html = '<p><strong>Glikemia</strong> &lt; 100&nbsp;mg/dl</p>'
+        self.assertEqual(html_to_text(html), 'Glikemia < 100 mg/dl')
+
+    def test_block_elements_separate_words(self):
+        """Test adjacent block elements are not glued together"""
+        html = '<ul><li>Retinopatia</li><li>Nefropatia</li></ul><table><tr><td>A</td><td>B</td></tr></table>'
+        self.assertEqual(html_to_text(html), 'Retinopatia\nNefropatia\nA\nB')
+
+    def test_skips_script_and_style(self):
+        """Test script/style content is dropped"""
+        html = '<style>p {color: red}</style><p>Tekst</p><script>alert(1)</script>'
+        self.assertEqual(html_to_text(html), 'Tekst')
+
+
+class SanitizeHtmlTest(SimpleTestCase):
+    """Test sanitize_html()"""
+
+    def test_empty_values(self):
+        """Test None and empty string"""
+        self.assertEqual(sanitize_html(None), '')
+        self.assertEqual(sanitize_html(''), '')
+
+    def test_keeps_editor_markup(self):
+        """Test markup produced by CKEditor is preserved"""
+        html = '<p style="text-align: center">A <strong>B</strong><br>C</p><table border="1"><tr><td colspan="2">D</td></tr></table>'
+        self.assertEqual(sanitize_html(html), html)
+
+    def test_removes_scripts_and_event_handlers(self):
+        """Test script content, event handlers and unknown tags are removed"""
+        html = '<p onclick="steal()">Tekst<script>alert(1)</script><img src=x onerror=alert(1)></p>'
+        self.assertEqual(sanitize_html(html), '<p>Tekst</p>')
+
+    def test_filters_urls_and_styles(self):
+        """Test javascript: URLs and unsafe CSS are dropped"""
+        html = (
+            '<a href="javascript:alert(1)">X</a>'
+            '<a href="https://example.com/?a=1&b=2">Y</a>'
+            '<span style="color: #ff0000; background: url(evil.png); position: fixed">Z</span>'
+        )
+        self.assertEqual(
+            sanitize_html(html),
+            '<a>X</a><a href="https://example.com/?a=1&amp;b=2">Y</a><span style="color: #ff0000">Z</span>'
+        )
+
+    def test_escapes_text_and_closes_tags(self):
+        """Test text is escaped and unclosed tags are closed"""
+        self.assertEqual(sanitize_html('<ul><li>1 &lt; 2<li>&lt;b&gt;'), '<ul><li>1 &lt; 2<li>&lt;b&gt;</li></li></ul>')
+
+
+class MakeExcerptTest(SimpleTestCase):
+    """Test make_excerpt()"""
+
+    def test_short_text_unchanged(self):
+        """Test text within the limit is only whitespace-normalized"""
+        self.assertEqual(make_excerpt('Linia 1\nLinia 2'), 'Linia 1 Linia 2')
+
+    def test_long_text_cut_on_word_boundary(self):
+        """Test long text is cut between words and ends with an ellipsis"""
+        excerpt = make_excerpt('insulina ' * 50, length=30)
+        self.assertLessEqual(len(excerpt), 30)
+        self.assertTrue(excerpt.endswith('insulina…'))
+
+
+class RenderRichTextTest(SimpleTestCase):
+    """Test render_rich_text() and content_hash()"""
+
+    def test_renderings(self):
+        """Test all renderings are computed from the same content"""
+        html = '<p>Glikemia <em>w normie</em></p>'
+        rendered = render_rich_text(html)
+
+        self.assertEqual(rendered.html, html)
+        self.assertEqual(rendered.text, 'Glikemia w normie')
+        self.assertEqual(rendered.excerpt, 'Glikemia w normie')
+        self.assertEqual(rendered.hash, content_hash(html))
+
+    def test_empty_content_has_empty_hash(self):
+        """Test empty content hashes to an empty string"""
+        self.assertEqual(content_hash(None), '')
+        self.assertEqual(render_rich_text('').hash, '')
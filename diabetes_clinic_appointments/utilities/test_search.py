@@ -0,0 +1,268 @@
+"""
+Tests for patient/user search backends.
+"""
+
+from django.test import TestCase
+from django.utils import timezone
+from datetime import date, time, timedelta
+from authentication.models import User
+from patients.models import Patient
+from doctors.models import Doctor
+from appointments.models import Appointment
+from .search import (
+    SearchResults, filter_matches, get_search_backend, search_notes, search_patients, search_templates,
+    search_users,
+)
+
+
+class SearchTestMixin:
+    """Common fixtures: two doctors, three patients"""
+
+    def create_doctor(self, username, license_number):
+        user = User.objects.create_user(
+            username=username,
+            password='testpass123',
+            user_type='doctor',
+            first_name='Adam',
+            last_name='Lekarz',
+        )
+        return Doctor.objects.create(
+            user=user,
+            license_number=license_number,
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=time(8, 0),
+            working_hours_end=time(16, 0),
+            education='Medical University'
+        )
+
+    def create_patient(self, username, first_name, last_name, email, pesel, birth_date):
+        user = User.objects.create_user(
+            username=username,
+            password='testpass123',
+            user_type='patient',
+            first_name=first_name,
+            last_name=last_name,
+            email=email,
+        )
+        return Patient.objects.create(
+            user=user,
+            date_of_birth=birth_date,
+            pesel=pesel,
+            address='ul. Test 1',
+            emergency_contact_name='Test',
+            emergency_contact_phone='123456789',
+            diabetes_type='type1'
+        )
+
+    def setUp(self):
+        self.doctor = self.create_doctor('doctor1', 'DOC001')
+        self.other_doctor = self.create_doctor('doctor2', 'DOC002')
+
+        self.kowalski = self.create_patient(
+            'jkowalski', 'Jan', 'Kowalski', 'jan@example.com', '92032109552', date(1992, 3, 21)
+        )
+        self.kowalska = self.create_patient(
+            'akowalska', 'Anna', 'Kowalska', 'anna@example.com', '44051401458', date(1944, 5, 14)
+        )
+        self.nowak = self.create_patient(
+            'pnowak', 'Piotr', 'Nowak', 'piotr@example.com', '00210155875', date(2000, 1, 1)
+        )
+
+        for patient in (self.kowalski, self.kowalska):
+            Appointment.objects.create(
+                patient=patient,
+                doctor=self.doctor,
+                appointment_date=timezone.now() + timedelta(days=1),
+                reason='Kontrola'
+            )
+        Appointment.objects.create(
+            patient=self.nowak,
+            doctor=self.other_doctor,
+            appointment_date=timezone.now() + timedelta(days=1),
+            reason='Kontrola'
+        )
+
+
+class SearchPatientsTest(SearchTestMixin, TestCase):
+    """Test search_patients()"""
+
+    def test_search_by_last_name_substring(self):
+        """Test substring of last name matches"""
+        results = search_patients(self.doctor, 'kowal')
+        self.assertCountEqual(results, [self.kowalski.id, self.kowalska.id])
+
+    def test_search_is_scoped_to_doctor(self):
+        """Test doctor sees only own patients"""
+        self.assertEqual(search_patients(self.doctor, 'Nowak'), [])
+        self.assertEqual(search_patients(self.other_doctor, 'Nowak'), [self.nowak.id])
+
+    def test_search_without_doctor_returns_all_patients(self):
+        """Test doctor=None searches all patients"""
+        self.assertEqual(search_patients(None, 'Nowak'), [self.nowak.id])
+
+    def test_search_by_full_name(self):
+        """Test multi-word query matches across name columns"""
+        self.assertEqual(search_patients(self.doctor, 'Jan Kowalski'), [self.kowalski.id])
+
+    def test_search_by_email(self):
+        """Test search by email"""
+        self.assertEqual(search_patients(self.doctor, 'anna@example.com'), [self.kowalska.id])
+
+    def test_search_by_pesel_prefix(self):
+        """Test search by PESEL prefix"""
+        self.assertEqual(search_patients(self.doctor, '920321'), [self.kowalski.id])
+
+    def test_short_query_uses_fallback(self):
+        """Test queries shorter than a trigram still work"""
+        self.assertEqual(search_patients(self.doctor, 'Ja'), [self.kowalski.id])
+
+    def test_empty_query_returns_nothing(self):
+        """Test empty query"""
+        self.assertEqual(search_patients(self.doctor, '   '), [])
+
+    def test_limit(self):
+        """Test results are limited, and limit=None returns every match"""
+        self.assertEqual(len(search_patients(self.doctor, 'kowal', limit=1)), 1)
+        self.assertEqual(len(search_patients(self.doctor, 'kowal', limit=None)), 2)
+        self.assertEqual(len(search_patients(self.doctor, 'Ko', limit=None)), 2)
+
+    def test_index_follows_updates(self):
+        """Test index is updated when user and patient rows change"""
+        self.kowalski.user.username = 'jzielinski'
+        self.kowalski.user.last_name = 'Zielinski'
+        self.kowalski.user.save()
+
+        self.assertEqual(search_patients(self.doctor, 'Zielinski'), [self.kowalski.id])
+        self.assertEqual(search_patients(self.doctor, 'Kowalski'), [])
+
+    def test_index_follows_deletes(self):
+        """Test deleted users disappear from results"""
+        self.kowalska.user.delete()
+
+        self.assertEqual(search_patients(self.doctor, 'kowal'), [self.kowalski.id])
+
+    def test_install_is_idempotent(self):
+        """Test re-installing the index keeps results consistent"""
+        get_search_backend().install()
+
+        self.assertEqual(search_patients(self.doctor, 'Nowak'), [])
+        self.assertEqual(search_patients(None, 'Nowak'), [self.nowak.id])
+
+
+class SearchUsersTest(SearchTestMixin, TestCase):
+    """Test search_users()"""
+
+    def test_search_by_username(self):
+        """Test search by username"""
+        self.assertEqual(search_users('jkowalski'), [self.kowalski.user.id])
+
+    def test_search_includes_doctors(self):
+        """Test users without patient profile are searchable"""
+        results = search_users('Lekarz')
+        self.assertCountEqual(results, [self.doctor.user.id, self.other_doctor.user.id])
+
+    def test_search_by_pesel(self):
+        """Test search by patient PESEL"""
+        self.assertEqual(search_users('00210155875'), [self.nowak.user.id])
+
+
+class SearchNotesTest(SearchTestMixin, TestCase):
+    """Test search_notes() and search_templates()"""
+
+    def setUp(self):
+        super().setUp()
+        self.appointment = Appointment.objects.get(patient=self.kowalski)
+        self.appointment.notes = '<p>Pacjent zgłasza <strong>retinopatię</strong> &amp; neuropatię.</p>'
+        self.appointment.save()
+
+        self.other_appointment = Appointment.objects.get(patient=self.nowak)
+        self.other_appointment.notes = '<p>Podejrzenie retinopatii</p>'
+        self.other_appointment.save()
+
+    def test_notes_text_stored_on_save(self):
+        """Test plain-text projection is computed at save time"""
+        self.assertEqual(self.appointment.notes_text, 'Pacjent zgłasza retinopatię & neuropatię.')
+
+    def test_search_matches_plain_text(self):
+        """Test words are found in notes, not in markup"""
+        results = search_notes(self.doctor, 'neuropatię')
+        self.assertEqual([appointment_id for appointment_id, _ in results], [self.appointment.id])
+        self.assertEqual(search_notes(self.doctor, 'strong'), [])
+
+    def test_search_matches_word_prefix(self):
+        """Test inflected forms match by common prefix"""
+        results = search_notes(self.doctor, 'retinopat')
+        self.assertEqual([appointment_id for appointment_id, _ in results], [self.appointment.id])
+
+    def test_search_is_scoped_to_doctor(self):
+        """Test doctor only sees notes from own appointments"""
+        results = search_notes(self.other_doctor, 'retinopat')
+        self.assertEqual([appointment_id for appointment_id, _ in results], [self.other_appointment.id])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        """Test snippet highlights matches and escapes note text"""
+        _, snippet = search_notes(self.doctor, 'neuropatię')[0]
+        self.assertIn('<mark>neuropatię</mark>', snippet)
+        self.assertIn('&amp;', snippet)
+
+    def test_index_follows_note_updates(self):
+        """Test the index is updated when notes change"""
+        self.appointment.notes = '<p>Stopa cukrzycowa</p>'
+        self.appointment.save()
+
+        self.assertEqual(search_notes(self.doctor, 'retinopat'), [])
+        self.assertEqual(len(search_notes(self.doctor, 'stopa')), 1)
+
+    def test_search_templates(self):
+        """Test active templates are searchable by content"""
+        from appointments.models import NoteTemplate
+
+        template = NoteTemplate.objects.create(
+            name='Badanie dna oka',
+            content='<h3>Ocena retinopatii</h3>',
+            category='checkup',
+        )
+        NoteTemplate.objects.create(
+            name='Nieaktywny',
+            content='<p>Retinopatia</p>',
+            category='other',
+            is_active=False,
+        )
+
+        results = search_templates('retinopatii')
+        self.assertEqual([template_id for template_id, _ in results], [template.id])
+
+
+class SearchResultsTest(SearchTestMixin, TestCase):
+    """Test filter_matches() and SearchResults"""
+
+    def test_filter_matches(self):
+        """Test queryset is restricted to matching users"""
+        results = filter_matches(Patient.objects.all(), 'kowal', user_field='user')
+        self.assertCountEqual(results, [self.kowalski, self.kowalska])
+        self.assertFalse(filter_matches(Patient.objects.all(), '  ', user_field='user').exists())
+
+    def test_pages_follow_ranking(self):
+        """Test slices of a result set larger than a page follow the ranked search"""
+        User.objects.bulk_create([
+            User(username=f'bulk{i}', email=f'bulk{i}@example.com') for i in range(30)
+        ])
+        results = SearchResults(User.objects.all(), 'example.com')
+        ranked = search_users('example.com', limit=None)
+
+        self.assertEqual(results.count(), len(ranked))
+        self.assertEqual(
+            [user.id for user in results[0:10] + results[10:20] + results[20:]],
+            ranked,
+        )
+
+    def test_restricted_to_queryset(self):
+        """Test results only contain rows of the given queryset"""
+        patients = Patient.objects.filter(appointments__doctor=self.doctor)
+        results = SearchResults(patients, 'example.com', user_field='user')
+
+        self.assertEqual(results.count(), 2)
+        self.assertCountEqual(results[0:10], [self.kowalski, self.kowalska])
@@ -0,0 +1,207 @@
+"""
+Tests for the slow query log.
+"""
+
+import json
+from types import SimpleNamespace
+
+from asgiref.sync import iscoroutinefunction
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from authentication.models import User
+from . import slow_queries
+from .slow_queries import (
+    SlowQueryMiddleware, SlowQueryWrapper, query_shape, redact_plan, reset_slow_queries, top_offenders,
+)
+
+
+# Every query is slow
+@override_settings(SLOW_QUERY_THRESHOLD_MS=0.000001, SLOW_QUERY_EXPLAIN=False)
+class SlowQueryLogTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.superuser = User.objects.create_superuser(
+            username='admin_slow', password='testpass123', email='admin@test.com'
+        )
+        self.client.force_login(self.superuser)
+
+    def log_lines(self, url):
+        with self.assertLogs('utilities.slow_queries', 'WARNING') as logs:
+            self.client.get(url)
+        return [json.loads(record.getMessage()) for record in logs.records]
+
+    def test_logs_view_and_call_site(self):
+        lines = self.log_lines(reverse('superadmin:user_list'))
+
+        in_view = [line for line in lines if line['view'] == 'superadmin:user_list']
+        self.assertTrue(in_view)
+        # Querysets evaluated in the template belong to the view's render() call
+        frames = {line['frame'].split(':')[0] + ' ' + line['frame'].split(' in ')[1] for line in in_view}
+        self.assertIn('superadmin/views.py user_list', frames)
+        self.assertTrue(all(line['duration_ms'] >= 0 and line['sql'] for line in lines))
+        self.assertIsNone(in_view[0]['explain'])
+
+    @override_settings(SLOW_QUERY_EXPLAIN=True)
+    def test_explain_of_selects(self):
+        lines = self.log_lines(reverse('superadmin:user_list'))
+
+        selects = [line for line in lines if line['sql'].startswith('SELECT')]
+        self.assertTrue(selects)
+        self.assertTrue(all(line['explain'] for line in selects))
+        # EXPLAIN runs on the same connection but is not logged itself
+        self.assertFalse(any('EXPLAIN' in line['sql'] for line in lines))
+
+    def test_parameters_are_not_logged(self):
+        lines = self.log_lines(reverse('superadmin:user_list') + '?search=Kowalski-secret')
+
+        self.assertFalse(any('Kowalski-secret' in json.dumps(line) for line in lines))
+
+    def test_top_offenders_add_up_repeated_calls(self):
+        with self.assertLogs('utilities.slow_queries', 'WARNING'):
+            self.client.get(reverse('superadmin:user_list'))
+            self.client.get(reverse('superadmin:user_list'))
+
+        offenders = top_offenders()
+        self.assertTrue(offenders)
+        self.assertEqual(
+            [offender['total_ms'] for offender in offenders],
+            sorted((offender['total_ms'] for offender in offenders), reverse=True),
+        )
+        self.assertTrue(any(offender['count'] == 2 for offender in offenders))
+        offender = offenders[0]
+        self.assertAlmostEqual(offender['avg_ms'], offender['total_ms'] / offender['count'])
+        self.assertGreaterEqual(offender['max_ms'], offender['avg_ms'] - 0.01)
+
+        reset_slow_queries()
+        self.assertEqual(top_offenders(), [])
+
+    async def test_async_request(self):
+        async def view(request):
+            await User.objects.acount()
+            return HttpResponse()
+
+        middleware = SlowQueryMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        request = RequestFactory().get('/async/')
+        request.resolver_match = None
+
+        with self.assertLogs('utilities.slow_queries', 'WARNING') as logs:
+            await middleware(request)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['path'], '/async/')
+        self.assertIn('COUNT(*)', line['sql'])
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_disabled(self):
+        with self.assertNoLogs('utilities.slow_queries', 'WARNING'):
+            self.client.get(reverse('superadmin:user_list'))
+        self.assertEqual(top_offenders(), [])
+
+    def test_entries_are_capped(self):
+        with self.assertLogs('utilities.slow_queries', 'WARNING'):
+            original = slow_queries.MAX_ENTRIES
+            slow_queries.MAX_ENTRIES = 1
+            try:
+                self.client.get(reverse('superadmin:user_list'))
+            finally:
+                slow_queries.MAX_ENTRIES = original
+
+        self.assertEqual(len(top_offenders()), 1)
+
+
+PESEL = '92032109552'
+
+POSTGRESQL_PLAN = [
+    ('Limit  (cost=0.29..8.31 rows=1 width=1021)',),
+    ('  ->  Index Scan using patients_patient_pesel_key on patients_patient  (cost=0.29..8.31 rows=1 width=1021)',),
+    (f"        Index Cond: ((pesel)::text = '{PESEL}'::text)",),
+    ('        Filter: (user_id <> 42)',),
+]
+
+
+class FakePostgreSQL:
+    """Connection returning a PostgreSQL plan, recording the EXPLAIN statements"""
+
+    alias = 'default'
+    vendor = 'postgresql'
+    ops = SimpleNamespace(explain_query_prefix=lambda: 'EXPLAIN')
+
+    def __init__(self, pg_version):
+        self.pg_version = pg_version
+        self.executed = []
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return POSTGRESQL_PLAN
+
+
+@override_settings(SLOW_QUERY_EXPLAIN=True)
+class SlowQueryPlanTest(TestCase):
+    """PostgreSQL plans must not carry the parameter values into the log"""
+
+    SQL = 'SELECT * FROM "patients_patient" WHERE "patients_patient"."pesel" = %s LIMIT 21'
+
+    def setUp(self):
+        cache.clear()
+
+    def report(self, connection):
+        request = RequestFactory().get('/')
+        request.resolver_match = None
+        with self.assertLogs('utilities.slow_queries', 'WARNING') as logs:
+            SlowQueryWrapper(request, 1).report(connection, self.SQL, [PESEL], False, 0.5)
+        return logs.records[0].getMessage()
+
+    def test_parameters_removed_from_plan(self):
+        connection = FakePostgreSQL(pg_version=150000)
+
+        line = self.report(connection)
+
+        self.assertEqual(connection.executed, [(f'EXPLAIN {self.SQL}', [PESEL])])
+        self.assertIn('Index Cond', line)
+        self.assertNotIn(PESEL, line)
+        [offender] = top_offenders()
+        self.assertIn('Index Cond', offender['explain'])
+        self.assertNotIn(PESEL, json.dumps(offender))
+
+    def test_generic_plan_on_postgresql_16(self):
+        connection = FakePostgreSQL(pg_version=160002)
+
+        self.report(connection)
+
+        sql, params = connection.executed[0]
+        self.assertEqual(sql, 'EXPLAIN (GENERIC_PLAN) ' + self.SQL.replace('%s', '$1'))
+        self.assertIsNone(params)
+
+    def test_redact_plan_keeps_costs(self):
+        plan = redact_plan('\n'.join(row[0] for row in POSTGRESQL_PLAN))
+
+        self.assertIn('(cost=0.29..8.31 rows=1 width=1021)', plan)
+        self.assertIn("Index Cond: ((pesel)::text = ?::text)", plan)
+        self.assertIn('Filter: (user_id <> ?)', plan)
+        self.assertIn('patients_patient_pesel_key', plan)
+
+
+class QueryShapeTest(SimpleTestCase):
+
+    def test_literals_and_in_lists(self):
+        self.assertEqual(
+            query_shape("SELECT * FROM t WHERE a = 12 AND b = 'x''y' AND c IN (%s, %s, %s)\n LIMIT 21"),
+            'SELECT * FROM t WHERE a = ? AND b = ? AND c IN (...) LIMIT ?',
+        )
+        self.assertEqual(query_shape('SELECT 1 WHERE id IN (%s)'), query_shape('SELECT 2 WHERE id IN (%s, %s)'))
@@ -9,6 +9,7 @@ Testuje wszystkie funkcje i klasy z utilities/validators.py:
 - validate_pesel_birth_date_consistency()
 - PESELValidator class
 - is_valid_pesel()
+- generate_pesel()
 """
 
 from datetime import date
@@ -21,7 +22,8 @@ from utilities.validators import (
     extract_gender_from_pesel,
     validate_pesel_birth_date_consistency,
     PESELValidator,
-    is_valid_pesel
+    is_valid_pesel,
+    generate_pesel
 )
 
 
@@ -317,3 +319,27 @@ class IsValidPeselTest(TestCase):
         self.assertFalse(is_valid_pesel('123'))
         self.assertFalse(is_valid_pesel('1234567890A'))
         self.assertFalse(is_valid_pesel(''))
+
+
+class GeneratePeselTest(TestCase):
+    """Testy funkcji generate_pesel()"""
+
+    def test_generated_pesel_is_valid(self):
+        """Test poprawności wygenerowanego PESEL (suma kontrolna, data, płeć)"""
+        for birth_date in [date(1899, 12, 31), date(1944, 5, 14), date(2000, 2, 26), date(2101, 1, 1)]:
+            for serial in [0, 14, 999]:
+                for female in [True, False]:
+                    pesel = generate_pesel(birth_date, serial, female)
+                    self.assertTrue(is_valid_pesel(pesel))
+                    self.assertEqual(extract_birth_date_from_pesel(pesel), birth_date)
+                    self.assertEqual(extract_gender_from_pesel(pesel), 'F' if female else 'M')
+
+    def test_serials_give_distinct_pesels(self):
+        """Test unikalności PESEL dla różnych numerów serii tej samej daty"""
+        pesels = {generate_pesel(date(1990, 1, 1), serial, female) for serial in range(1000) for female in [True, False]}
+        self.assertEqual(len(pesels), 2000)
+
+    def test_serial_out_of_range(self):
+        """Test numeru serii spoza zakresu"""
+        with self.assertRaises(ValueError):
+            generate_pesel(date(1990, 1, 1), 1000)
@@ -0,0 +1,144 @@
+"""
+Tests for per-user caching of rendered pages.
+"""
+
+from datetime import date, time as dtime, timedelta
+
+from django.contrib.messages import constants
+from django.contrib.messages.storage.base import Message
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from appointments.models import Appointment
+from authentication.models import User
+from doctors.models import Doctor
+from patients.models import Patient
+
+
+class ViewCacheTestMixin:
+
+    def create_doctor(self, username, license_number, first_name):
+        user = User.objects.create_user(
+            username=username,
+            password='testpass123',
+            user_type='doctor',
+            first_name=first_name,
+            last_name='Lekarz',
+        )
+        return Doctor.objects.create(
+            user=user,
+            license_number=license_number,
+            specialization='diabetologist',
+            years_of_experience=10,
+            office_address='ul. Lekarska 1',
+            consultation_fee=200.00,
+            working_hours_start=dtime(8, 0),
+            working_hours_end=dtime(16, 0),
+            education='Medical University',
+        )
+
+
+class CacheResponseTest(ViewCacheTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = self.create_doctor('doctor_a', 'DOC001', 'Adam')
+        self.other = self.create_doctor('doctor_b', 'DOC002', 'Barbara')
+        self.url = reverse('doctors:doctor_profile')
+        self.client.login(username='doctor_a', password='testpass123')
+
+    def test_second_request_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first['X-View-Cache'], 'miss')
+
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url)
+        self.assertEqual(second['X-View-Cache'], 'hit')
+        self.assertEqual(second.content, first.content)
+
+    def test_responses_are_private(self):
+        response = self.client.get(self.url)
+        self.assertIn('private', response['Cache-Control'])
+
+        response = self.client.get(self.url)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_page_is_never_served_to_another_user(self):
+        self.client.get(self.url)
+        self.client.logout()
+
+        self.client.login(username='doctor_b', password='testpass123')
+        response = self.client.get(self.url)
+
+        self.assertEqual(response['X-View-Cache'], 'miss')
+        self.assertContains(response, 'Barbara')
+        self.assertNotContains(response, 'Adam')
+
+    def test_profile_change_invalidates_page(self):
+        self.client.get(self.url)
+
+        self.doctor.office_address = 'ul. Nowa 5'
+        self.doctor.save()
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-View-Cache'], 'miss')
+        self.assertContains(response, 'ul. Nowa 5')
+
+    def test_pending_messages_bypass_cache(self):
+        self.client.get(self.url)
+
+        storage = CookieStorage(None)
+        messages = [Message(constants.SUCCESS, 'Zapisano zmiany')]
+        self.client.cookies[CookieStorage.cookie_name] = storage._encode(messages)
+        response = self.client.get(self.url)
+
+        self.assertNotIn('X-View-Cache', response)
+        self.assertContains(response, 'Zapisano zmiany')
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=0)
+    def test_disabled_by_setting(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url)
+        self.assertNotIn('X-View-Cache', response)
+
+    def test_wrong_role_is_not_cached(self):
+        response = self.client.get(reverse('patients:profile'))
+        self.assertEqual(response.status_code, 302)
+        self.assertNotIn('X-View-Cache', response)
+
+
+class PatientProfileCacheTest(ViewCacheTestMixin, TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.doctor = self.create_doctor('doctor_a', 'DOC001', 'Adam')
+        user = User.objects.create_user(username='patient', password='testpass123', user_type='patient')
+        self.patient = Patient.objects.create(
+            user=user,
+            date_of_birth=date(1944, 5, 14),
+            pesel='44051401458',
+            address='ul. Testowa 1, Warszawa',
+            emergency_contact_name='Anna Kowalska',
+            emergency_contact_phone='123456789',
+            diabetes_type='type1',
+            diagnosis_date=date(2020, 1, 15),
+        )
+        self.url = reverse('patients:profile')
+        self.client.login(username='patient', password='testpass123')
+
+    def test_new_appointment_invalidates_profile(self):
+        self.client.get(self.url)
+        self.assertEqual(self.client.get(self.url)['X-View-Cache'], 'hit')
+
+        Appointment.objects.create(
+            patient=self.patient,
+            doctor=self.doctor,
+            appointment_date=timezone.now() + timedelta(days=3),
+            status='scheduled',
+        )
+
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-View-Cache'], 'miss')
+        self.assertContains(response, 'Dr. Adam')
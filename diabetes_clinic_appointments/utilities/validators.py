@@ -282,3 +282,31 @@ def is_valid_pesel(pesel):
         return True
     except ValidationError:
         return False
+
+
+# Month offsets encoding the century of the birth date (see extract_birth_date_from_pesel)
+CENTURY_MONTH_OFFSETS = {1800: 80, 1900: 0, 2000: 20, 2100: 40, 2200: 60}
+
+
+def generate_pesel(birth_date, serial, female=False):
+    """
+    Build a valid PESEL for the given birth date (e.g. for test data).
+
+    Args:
+        birth_date (datetime.date): Birth date encoded in the first 6 digits
+        serial (int): Serial number 0-999 (digits 7-9)
+        female (bool): Gender encoded in the 10th digit
+
+    Returns:
+        str: PESEL number with a correct checksum
+    """
+    if not 0 <= serial <= 999:
+        raise ValueError('PESEL serial must be between 0 and 999')
+
+    month = birth_date.month + CENTURY_MONTH_OFFSETS[birth_date.year // 100 * 100]
+    gender_digit = serial % 5 * 2 + (0 if female else 1)
+    digits = f'{birth_date.year % 100:02d}{month:02d}{birth_date.day:02d}{serial:03d}{gender_digit}'
+
+    weights = [1, 3, 7, 9, 1, 3, 7, 9, 1, 3]
+    checksum = (10 - sum(int(digit) * weight for digit, weight in zip(digits, weights)) % 10) % 10
+    return f'{digits}{checksum}'
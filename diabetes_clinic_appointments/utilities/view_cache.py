@@ -0,0 +1,140 @@
+"""
+Per-user caching of rendered pages.
+
+Read-mostly pages (profiles, the template list, the superadmin dashboard)
+are rendered from the database on every hit although they rarely change.
+``cache_response`` stores the rendered HTML per user::
+
+    @login_required
+    @cache_response('user:{user.pk}', 'note_templates')
+    def list_templates(request):
+        ...
+
+The cache key contains the view, the user's id and role, the full path, the
+CSRF secret and the current version of every scope the page depends on.
+Scopes are formatted with the requesting user, and their versions are
+bumped by signal handlers when the underlying rows change (``bump_version``),
+which makes every page depending on them a miss.
+
+Pages with medical data stay private:
+
+* only authenticated GET/HEAD requests are cached, always under the
+  requesting user's id - a page is never served to another user,
+* responses are marked ``Cache-Control: private`` so shared proxies never
+  store them,
+* nothing is cached or served while flash messages are pending, and a page
+  is not stored if rendering it created a new CSRF token.
+
+Changes made without signals (``queryset.update()``) and time-dependent
+content (e.g. the next appointment) are bounded by the entry timeout.
+"""
+
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from django.utils.cache import patch_cache_control
+
+from .cache import CacheNamespace
+
+
+responses = CacheNamespace('view_response')
+versions = CacheNamespace('entity_version', timeout=None)
+
+
+def bump_version(*scopes):
+    """Invalidate cached pages depending on the given scopes (e.g. ``'user:42'``)"""
+    for scope in scopes:
+        try:
+            versions.incr(scope)
+        except ValueError:
+            versions.set(scope, time.time_ns())
+
+
+def _versions(scopes):
+    current = versions.get_many(scopes)
+    for scope in scopes:
+        if scope not in current:
+            # A time-based start value never reuses keys of an evicted counter
+            versions.add(scope, time.time_ns())
+            current[scope] = versions.get(scope, time.time_ns())
+    return [current[scope] for scope in scopes]
+
+
+def _role(user):
+    return 'superuser' if user.is_superuser else user.user_type
+
+
+def _has_messages(request):
+    # len() loads the stored messages without marking them as displayed
+    return len(get_messages(request)) > 0
+
+
+def _cache_key(view, request, scopes, csrf_secret):
+    user = request.user
+    try:
+        scopes = [scope.format(user=user) for scope in scopes]
+    except ObjectDoesNotExist:
+        # Wrong role for the page (e.g. no patient profile) - the view redirects
+        return None
+    variant = '|'.join(map(str, [request.get_full_path(), csrf_secret or '', *_versions(scopes)]))
+    digest = hashlib.sha256(variant.encode('utf-8')).hexdigest()[:32]
+    return (view.__module__, view.__qualname__, user.pk, _role(user), digest)
+
+
+def _private(response, state):
+    patch_cache_control(response, private=True, no_cache=True)
+    response['X-View-Cache'] = state
+    return response
+
+
+def cache_response(*scopes, timeout=None):
+    """
+    Cache the rendered page per user (see the module docstring).
+
+    Args:
+        *scopes: Version scopes the page depends on, formatted with the
+            requesting ``user`` (e.g. ``'user:{user.pk}'``)
+        timeout: Seconds an entry is kept (at most RESPONSE_CACHE_TIMEOUT,
+            which is also the default; 0 there disables caching)
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            entry_timeout = settings.RESPONSE_CACHE_TIMEOUT
+            if timeout is not None:
+                entry_timeout = min(timeout, entry_timeout)
+            if (
+                entry_timeout <= 0
+                or request.method not in ('GET', 'HEAD')
+                or not request.user.is_authenticated
+                or _has_messages(request)
+            ):
+                return view(request, *args, **kwargs)
+
+            csrf_secret = request.META.get('CSRF_COOKIE')
+            key = _cache_key(view, request, scopes, csrf_secret)
+            if key is None:
+                return view(request, *args, **kwargs)
+            cached = responses.get(key)
+            if cached is not None:
+                content, content_type = cached
+                return _private(HttpResponse(content, content_type=content_type), 'hit')
+
+            response = view(request, *args, **kwargs)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and request.META.get('CSRF_COOKIE') == csrf_secret
+                and not _has_messages(request)
+            ):
+                responses.set(key, (response.content, response['Content-Type']), entry_timeout)
+                return _private(response, 'miss')
+            return response
+        return wrapper
+    return decorator